@@ -0,0 +1,56 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Time to draw the waveform surface while scrolling, per step."""
+
+from gum.lib.mock import Fake
+from gum.models import Graph, Sound
+from gum.models.graph import peak_pyramid
+from gum.views.waveform import WaveformLayer, WaveformRenderer
+import numpy
+import time
+
+SAMPLERATE = 44100
+MINUTES = 10
+HEIGHT = 400
+STEPS = 100
+
+
+def bench_scroll(graph, draw_values, width, shifted):
+    graph.set_width(width)
+    graph.density = 100
+    graph.move_to(0)
+    renderer = WaveformRenderer(graph, draw_values, None)
+    surface = renderer.render((0, graph.density, width, HEIGHT))
+    t = time.time()
+    for i in range(STEPS):
+        # Scroll by a few pixels, like dragging with the middle button.
+        graph.move_to(graph.view()[0] + 7 * graph.density)
+        view = graph.first_cell(), graph.density, width, HEIGHT
+        if not shifted:
+            renderer = WaveformRenderer(graph, draw_values, None)
+        shown, surface = surface, renderer.render(view)
+        renderer.release(shown)
+    return (time.time() - t) / STEPS
+
+
+def main():
+    n = MINUTES * 60 * SAMPLERATE
+    frames = numpy.random.uniform(-1, 1, (n, 2)).astype('float32')
+    sound = Sound(dtype='float32')
+    sound.frames = frames
+    peak_pyramid(frames)
+    graph = Graph(sound)
+    layer = WaveformLayer(Fake(), graph)
+    print "%d minutes of stereo frames, %d scroll steps of 7 pixels" % (
+        MINUTES, STEPS)
+    print "%-8s %16s %16s" % ("width", "full redraw", "shifted")
+    for width in [1000, 1920, 3840]:
+        full = bench_scroll(graph, layer.draw_values, width, False)
+        shifted = bench_scroll(graph, layer.draw_values, width, True)
+        print "%-8d %13.2f ms %13.2f ms" % (width, full * 1e3, shifted * 1e3)
+
+
+if __name__ == '__main__':
+    main()
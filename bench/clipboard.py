@@ -0,0 +1,56 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Time and frames copied by copy, paste and undo of large selections."""
+
+from gum.models import Sound
+from copy import copy
+import numpy
+import time
+
+MINUTES = 60
+SAMPLERATE = 44100
+
+
+def copied_bytes(snd, clip, original):
+    "Bytes of the buffers referenced by snd and clip, other than original."
+    bufs = {}
+    for buf, start, end in snd.frames.pieces() + clip.pieces():
+        if buf is not original:
+            bufs[id(buf)] = buf.nbytes
+    return sum(bufs.values())
+
+
+def main():
+    n = MINUTES * 60 * SAMPLERATE
+    frames = numpy.random.uniform(-1, 1, (n, 2)).astype('float32')
+    print "%d minutes of stereo frames, %.0f MB" % (MINUTES,
+                                                    frames.nbytes / 2. ** 20)
+    print "%-10s %12s %12s %12s %12s %12s" % ("selection", "array copy",
+                                              "copy", "paste", "undo",
+                                              "copied")
+    for minutes in [1, 10, 30]:
+        snd = Sound(dtype='float32')
+        snd.frames = frames
+        length = minutes * 60 * SAMPLERATE
+        t = time.time()
+        copy(frames[:length])
+        t_array = time.time() - t
+        t = time.time()
+        clip = snd.copy(0, length)
+        t_copy = time.time() - t
+        t = time.time()
+        snd.paste(n / 2, n / 2, clip)
+        t_paste = time.time() - t
+        copied = copied_bytes(snd, clip, frames)
+        t = time.time()
+        snd.undo()
+        t_undo = time.time() - t
+        print "%-10s %10.1f ms %10.1f ms %10.1f ms %10.1f ms %9.1f MB" % (
+            "%d min" % minutes, t_array * 1e3, t_copy * 1e3, t_paste * 1e3,
+            t_undo * 1e3, copied / 2. ** 20)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Overview throughput per sample, for increasing numbers of channels."""
+
+from gum.models import graph
+import numpy
+import time
+
+WIDTH = 1000
+DENSITY = 1000.
+
+
+def timeit(func, repeat=5):
+    "Return the best time of repeat calls of func."
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        func()
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main():
+    nframes = int(WIDTH * DENSITY)
+    print "%d frames, float32, %d threads" % (nframes, graph.THREADS)
+    print "%-10s %16s %16s %16s" % ("channels", "per channel",
+                                    "one pass", "threads")
+    for numchan in [1, 2, 4, 8]:
+        data = numpy.random.uniform(-1, 1, (nframes, numchan))
+        data = data.astype('float32')
+
+        def per_channel():
+            for chan in data.transpose():
+                graph._condense(chan, 0, WIDTH, DENSITY)
+
+        def one_pass():
+            out = numpy.empty((numchan, WIDTH, 3))
+            graph._condense_channels(data, 0, WIDTH, DENSITY, 0, out)
+
+        def threads():
+            graph._overview(data, 0, WIDTH, DENSITY)
+
+        saved = graph.PARALLEL_FRAMES
+        graph.PARALLEL_FRAMES = 0
+        t_threads = timeit(threads)
+        graph.PARALLEL_FRAMES = saved
+        samples = nframes * numchan / 1e6
+        print "%-10d %9.1f Ms/s %11.1f Ms/s %11.1f Ms/s" % (numchan,
+            samples / timeit(per_channel), samples / timeit(one_pass),
+            samples / t_threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Time to composite a full-screen view for each tick of the cursor."""
+
+from gum.lib.event import Signal
+from gum.lib.mock import Mock
+from gum.views.waveform import Layer, BackgroundLayer, SelectionLayer, \
+     CursorLayer
+import cairo
+import time
+
+WIDTH = 1920
+HEIGHT = 1080
+TICKS = 200
+# The cursor moves every 50 ms while playing.
+TICKS_PER_SECOND = 20
+
+
+class Widget(object):
+    "Keeps the areas the layers ask to draw, like CairoWidget."
+
+    def __init__(self):
+        self.areas = []
+
+    def connect(self, *args):
+        pass
+
+    def redraw(self, areas=None):
+        if areas is None or self.areas is None:
+            self.areas = None
+        else:
+            self.areas = self.areas + areas
+
+
+class Picture(Layer):
+    "Paints a surface, like the waveform layer."
+
+    def __init__(self, layered, surface):
+        Layer.__init__(self, layered)
+        self._surface = surface
+
+    def stack(self, context, width, height):
+        context.set_source_surface(self._surface, 0, 0)
+        context.set_operator(cairo.OPERATOR_OVER)
+        context.paint()
+
+
+class Cursor(object):
+
+    def __init__(self):
+        self.x = 0
+        self.changed = Signal()
+
+    def pixel(self):
+        return self.x
+
+
+def bench_ticks(damage):
+    widget = Widget()
+    selection = Mock({"pixels": (WIDTH / 4, WIDTH / 2), "selected": True})
+    selection.changed = Signal()
+    cursor = Cursor()
+    wave = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+    c = cairo.Context(wave)
+    c.set_source_rgb(0.0, 0.47058823529411764, 1.0)
+    c.rectangle(0, HEIGHT / 4, WIDTH, HEIGHT / 2)
+    c.fill()
+    layers = [BackgroundLayer(widget, selection), Picture(widget, wave),
+              SelectionLayer(widget, selection), CursorLayer(widget, cursor)]
+    screen = cairo.ImageSurface(cairo.FORMAT_RGB24, WIDTH, HEIGHT)
+    t = time.time()
+    for i in range(TICKS):
+        cursor.x += 1
+        widget.areas = []
+        cursor.changed()
+        context = cairo.Context(screen)
+        if damage and widget.areas is not None:
+            for x, width in widget.areas:
+                context.rectangle(x, 0, width, HEIGHT)
+            context.clip()
+        for layer in layers:
+            layer.stack(context, WIDTH, HEIGHT)
+    screen.flush()
+    return (time.time() - t) / TICKS
+
+
+def main():
+    print "%dx%d view, %d cursor ticks" % (WIDTH, HEIGHT, TICKS)
+    print "%-12s %14s %14s" % ("", "per tick", "CPU")
+    for name, damage in [("whole view", False), ("damage", True)]:
+        t = bench_ticks(damage)
+        print "%-12s %11.2f ms %12.1f %%" % (name, t * 1e3,
+                                              t * TICKS_PER_SECOND * 100)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Time to draw the waveform of a stereo overview on an image surface."""
+
+import cairo
+import numpy
+import time
+try:
+    from gum import fast
+except ImportError:
+    fast = None
+
+HEIGHT = 400
+REPEAT = 20
+
+# The colors and fill width of gum.views.waveform.WaveformLayer.
+WAVECOLOR = 0.0, 0.47058823529411764, 1.0
+RMSCOLOR = 0.4, 0.6823529411764706, 1.0
+AXISCOLOR = 0.2, 0.2, 0.2
+FILL_COLUMNS = 16
+
+
+def overview(width, amplitude):
+    "Return a stereo overview of random cells."
+    values = numpy.empty((2, width, 3))
+    peaks = numpy.random.uniform(-amplitude, amplitude, (2, width, 2))
+    peaks.sort(axis=2)
+    values[:, :, :2] = peaks
+    values[:, :, 2] = abs(peaks).max(axis=2) * 0.7
+    return values
+
+
+def bench_draw(values, width):
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, HEIGHT)
+    context = cairo.Context(surface)
+    numchan = len(values)
+    t = time.time()
+    for i in range(REPEAT):
+        context.set_operator(cairo.OPERATOR_CLEAR)
+        context.paint()
+        context.set_operator(cairo.OPERATOR_OVER)
+        for c in range(numchan):
+            y = (HEIGHT / numchan) * c
+            fast.draw_channel(values[c], context, y, width, HEIGHT / numchan,
+                              WAVECOLOR, RMSCOLOR, AXISCOLOR, FILL_COLUMNS)
+    surface.flush()
+    return (time.time() - t) / REPEAT
+
+
+def main():
+    if fast is None:
+        print "The fast module is not built, nothing to time."
+        return
+    print "stereo, %d pixels high, %d redraws" % (HEIGHT, REPEAT)
+    print "%-8s %16s %16s" % ("width", "quiet", "loud")
+    for width in [1000, 1920, 3840]:
+        quiet = bench_draw(overview(width, 0.01), width)
+        loud = bench_draw(overview(width, 1), width)
+        print "%-8d %13.2f ms %13.2f ms" % (width, quiet * 1e3, loud * 1e3)
+
+
+if __name__ == '__main__':
+    main()
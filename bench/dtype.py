@@ -0,0 +1,66 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Memory use, overview and playback throughput for each sample type."""
+
+from gum.lib import pcm
+from gum.models import Sound
+from gum.models.graph import _overview
+from gum.controllers.player import interleave, OUTPUT_DTYPES
+import numpy
+import time
+
+SECONDS = 60
+SAMPLERATE = 44100
+PERIODSIZE = 1024
+WIDTH = 1000
+
+
+def timeit(func, repeat=3):
+    "Return the best time of repeat calls of func."
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        func()
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def bench_dtype(frames, dtype):
+    snd = Sound(dtype=dtype)
+    snd.frames = pcm.convert(frames, dtype)
+    data = snd.frames
+    nframes = len(data)
+    density = nframes / float(WIDTH)
+
+    def overview():
+        _overview(data, 0, WIDTH, density)
+
+    def playback():
+        for i in xrange(0, nframes, PERIODSIZE):
+            interleave(data[i:i + PERIODSIZE], OUTPUT_DTYPES[dtype],
+                       PERIODSIZE)
+
+    t_overview = timeit(overview)
+    t_playback = timeit(playback)
+    print "%-8s %8.1f MB %10.1f Mframes/s %10.1f Mframes/s" % (
+        dtype, data.nbytes / 2. ** 20,
+        nframes / t_overview / 1e6, nframes / t_playback / 1e6)
+
+
+def main():
+    n = SECONDS * SAMPLERATE
+    t = numpy.arange(n) / float(SAMPLERATE)
+    sine = 0.8 * numpy.sin(2 * numpy.pi * 440 * t)
+    frames = numpy.array([sine, -sine]).transpose()
+    print "%d seconds of stereo frames" % SECONDS
+    print "%-8s %11s %20s %20s" % ("dtype", "memory", "overview", "playback")
+    for dtype in pcm.DTYPES:
+        bench_dtype(frames, dtype)
+
+
+if __name__ == '__main__':
+    main()
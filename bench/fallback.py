@@ -0,0 +1,51 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Overview throughput of the numpy fallback, next to the fast module."""
+
+from gum.models import graph
+import numpy
+import time
+
+WIDTH = 1000
+
+
+def timeit(func, repeat=5):
+    "Return the best time of repeat calls of func."
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        func()
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main():
+    if not graph.HAVE_FAST:
+        print "The fast module is not built, nothing to compare with."
+        return
+    print "%d cells, stereo float32" % WIDTH
+    print "%-10s %14s %14s %10s" % ("density", "fast", "numpy", "ratio")
+    for density in [1, 10, 100, 1000, 10000]:
+        data = numpy.random.uniform(-1, 1, (WIDTH * density, 2))
+        data = data.astype('float32')
+        out = numpy.empty((2, WIDTH, 3))
+
+        def compiled():
+            graph._condense_channels(data, 0, WIDTH, density, 0, out)
+
+        def fallback():
+            graph._numpy_condense_channels(data, 0, WIDTH, density, 0, out)
+
+        t_fast = timeit(compiled)
+        t_numpy = timeit(fallback)
+        print "%-10d %11.2f ms %11.2f ms %9.1fx" % (density, t_fast * 1e3,
+                                                    t_numpy * 1e3,
+                                                    t_numpy / t_fast)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Overview time when zoomed out full, for increasing sound lengths."""
+
+from gum.models.graph import _overview, peak_pyramid
+import numpy
+import time
+
+SAMPLERATE = 44100
+WIDTH = 1000
+
+
+def main():
+    print "%-10s %12s %12s %12s" % ("minutes", "pyramid", "zoom out",
+                                    "zoom in x4")
+    for minutes in [1, 10, 60]:
+        n = minutes * 60 * SAMPLERATE
+        data = numpy.random.uniform(-1, 1, n).astype('float32')
+        t = time.time()
+        peak_pyramid(data)
+        t_build = time.time() - t
+        t = time.time()
+        _overview(data, 0, WIDTH, n / float(WIDTH))
+        t_full = time.time() - t
+        t = time.time()
+        _overview(data, WIDTH, WIDTH, n / float(WIDTH * 4))
+        t_zoom = time.time() - t
+        print "%-10d %10.1f ms %10.1f ms %10.1f ms" % (
+            minutes, t_build * 1e3, t_full * 1e3, t_zoom * 1e3)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""CPU time to prepare the periods of one second of playback.
+
+Compares converting each period into a new string, as the device used
+to be written, with pumping the frames into a ring buffer in place.
+
+"""
+
+from gum.controllers import player
+from gum.lib import pcm
+from gum.lib.ringbuffer import RingBuffer
+import numpy
+import time
+
+SAMPLERATE = 44100
+SECONDS = 60
+PERIOD = 1024
+
+
+def per_second(func, frames):
+    "Return the CPU time of func for each period of frames, per second."
+    t = time.clock()
+    for i in xrange(0, len(frames), PERIOD):
+        func(frames[i:i + PERIOD])
+    return (time.clock() - t) / SECONDS
+
+
+def main():
+    print "%d s of frames, periods of %d frames" % (SECONDS, PERIOD)
+    print "%-10s %-8s %16s %16s" % ("frames", "", "copies", "in place")
+    n = SECONDS * SAMPLERATE
+    for dtype in ['float64', 'float32', 'int16']:
+        for numchan in [1, 2]:
+            frames = numpy.random.uniform(-1, 1, (n, numchan))
+            frames = pcm.convert(frames, dtype)
+            if numchan == 1:
+                frames = frames[:, 0]
+            output = player.OUTPUT_DTYPES[dtype]
+            ring = RingBuffer(8 * PERIOD, 2, output)
+
+            def copies(buf):
+                player.interleave(buf, output, PERIOD)
+
+            def in_place(buf):
+                area = ring.free_area(len(buf))
+                player.pump(buf, area)
+                ring.commit(len(area))
+                ring.release(len(ring.buffered_area(PERIOD)))
+
+            print "%-10s %-8s %13.2f ms %13.2f ms" % (dtype,
+                ["mono", "stereo"][numchan - 1],
+                per_second(copies, frames) * 1e3,
+                per_second(in_place, frames) * 1e3)
+
+
+if __name__ == '__main__':
+    main()
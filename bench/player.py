@@ -0,0 +1,50 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Playback throughput, without a sound card.
+
+The player writes to a null backend as fast as it can. Run with
+python -m cProfile to profile the playback path.
+
+"""
+
+from gum.controllers.player import Player, NullBackend
+from gum.lib import pcm
+from gum.lib.mock import Mock
+import numpy
+import time
+
+SAMPLERATE = 44100
+MINUTES = 10
+
+
+def main():
+    print "%d minutes of frames, played as fast as possible" % MINUTES
+    print "%-10s %-8s %12s %12s %14s" % ("frames", "", "time", "speed",
+                                         "CPU per s")
+    n = MINUTES * 60 * SAMPLERATE
+    for dtype in ['float64', 'float32', 'int16']:
+        for numchan in [1, 2]:
+            frames = numpy.random.uniform(-1, 1, (n, numchan))
+            frames = pcm.convert(frames, dtype)
+            if numchan == 1:
+                frames = frames[:, 0]
+            sound = Mock({})
+            sound.samplerate = SAMPLERATE
+            sound.frames = frames
+            backend = NullBackend(realtime=False)
+            player = Player(sound, backend=backend)
+            t = time.time()
+            cpu = time.clock()
+            player.thread_play().join()
+            t = time.time() - t
+            cpu = time.clock() - cpu
+            assert backend.frames == n
+            print "%-10s %-8s %10.2f s %10.0f x %11.2f ms" % (dtype,
+                ["mono", "stereo"][numchan - 1], t, MINUTES * 60 / t,
+                cpu / (MINUTES * 60) * 1e3)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Time to scroll the overview of a stereo sound, per step."""
+
+from gum.models import Graph, Sound
+from gum.models.graph import peak_pyramid
+import numpy
+import time
+
+SAMPLERATE = 44100
+MINUTES = 10
+STEPS = 100
+
+
+def bench_scroll(graph, width, density):
+    graph.set_width(width)
+    graph.density = density
+    graph.move_to(0)
+    graph.channels()
+    t = time.time()
+    for i in range(STEPS):
+        # Scroll by a few pixels, like dragging the scrollbar.
+        graph.move_to(graph.view()[0] + 7 * density)
+        graph.channels()
+    return (time.time() - t) / STEPS
+
+
+def main():
+    n = MINUTES * 60 * SAMPLERATE
+    frames = numpy.random.uniform(-1, 1, (n, 2)).astype('float32')
+    sound = Sound(dtype='float32')
+    sound.frames = frames
+    # Summarize all frames now, not while scrolling.
+    peak_pyramid(frames)
+    graph = Graph(sound)
+    print "%d minutes of stereo frames, %d scroll steps" % (MINUTES, STEPS)
+    print "%-8s %10s %16s" % ("width", "density", "time per step")
+    for width in [1000, 1920, 3840]:
+        for density in [100, 5000]:
+            t = bench_scroll(graph, width, density)
+            print "%-8d %10d %13.2f ms" % (width, density, t * 1e3)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,7 +18,7 @@ PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fx')
 new_sound_loaded = event.Signal()
 
 def open_(filename=None):
-    sound = Sound(filename)
+    sound = Sound(filename, background=True)
     graph = Graph(sound)
     p = Player(sound)
     curs = Cursor(graph, p)
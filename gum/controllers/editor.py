@@ -54,7 +54,8 @@ class Editor(object):
     @_report_exception
     def load_sound(self, filename):
         self._player.stop()
-        self._sound = Sound(filename)
+        self._sound.cancel_loading()
+        self._sound = Sound(filename, background=True)
         self._graph.set_sound(self._sound)
         self._player.set_sound(self._sound)
         self._selection.unselect()
@@ -71,7 +72,7 @@ class Editor(object):
 
     @_report_exception
     def save_selection_as(self, filename):
-        sound = Sound()
+        sound = Sound(dtype=self._sound.dtype)
         if not self._selection.selected():
             raise Exception("There is no selection.")
         start, end = self._selection.get()
@@ -79,11 +80,32 @@ class Editor(object):
         sound.samplerate = self._sound.samplerate
         sound.save_as(filename)
 
+    def load_progress(self):
+        """Return the fraction of the file loaded so far.
+
+        Returns None when the sound is not loading.
+
+        """
+        sound = self._sound
+        buf = sound.file_frames()
+        if not sound.is_loading() or buf is None:
+            return None
+        return len(sound.frames) / float(max(1, len(buf)))
+
+    def load_error(self):
+        return self._sound.load_error
+
+    def cancel_loading(self):
+        self._sound.cancel_loading()
+        self.fix_selection()
+        self.filename_changed()
+
     def close(self, force=False):
         sound = self._sound
         if not sound.is_saved() and not sound.is_fresh() and not force:
             raise FileNotSaved
-        self._player.stop()
+        self._player.close()
+        sound.cancel_loading()
 
     def play(self):
         start, end = self._selection.get()
@@ -102,6 +124,9 @@ class Editor(object):
         else:
             self.play()
 
+    def toggle_loop(self):
+        self._player.loop = not self._player.loop
+
     def goto_start(self):
         self._selection.set(0, 0)
         self._graph.move_to(0)
@@ -111,11 +136,12 @@ class Editor(object):
         self._selection.set(end, end)
         self._graph.move_to(end)
 
+    @_report_exception
     def cut(self):
         start, end = self._selection.get()
+        clipboard.clip = self._sound.cut(start, end)
         self._selection.start = start
         self._selection.end = start
-        clipboard.clip = self._sound.cut(start, end)
         
     def copy(self):
         start, end = self._selection.get()
@@ -147,13 +173,19 @@ class Editor(object):
             l = min(end - start, len(clipboard.clip))
         self._selection.set(start, start + l)
 
+    @_report_exception
     def trim(self):
-        pass
+        if self._selection.selected():
+            start, end = self._selection.get()
+            self._sound.trim(start, end)
+            self._selection.set(0, end - start)
 
+    @_report_exception
     def undo(self):
         self._sound.undo()
         self.fix_selection()
 
+    @_report_exception
     def redo(self):
         self._sound.redo()
         self.fix_selection()
@@ -176,6 +208,8 @@ class Editor(object):
 
     @_report_exception
     def effect(self, name):
+        if self._sound.is_loading():
+            raise Exception("The sound is still loading.")
         if self._selection.selected():
             start, end = self._selection.get()
         else:
@@ -189,7 +223,7 @@ class Editor(object):
 
     def on_selection_changed(self, widget):
         if self._player.is_playing():
-            self.stop()
+            # The player goes on with the new selection, without a gap.
             self.play()
 
     def __getattr__(self, name):
@@ -213,6 +247,12 @@ def test_Editor():
     editor.open(gum.basedir + '/data/test/test1.wav')
     assert editor._sound != None
 
+    # loading another file stops loading the first one
+    first = editor._sound
+    editor.load_sound(gum.basedir + '/data/test/test2.wav')
+    assert not first.is_loading()
+    editor._sound.wait_loaded()
+
 def test_fix_selection():
     from gum.lib.mock import Fake, Mock
     from gum.models import Selection
@@ -254,6 +294,26 @@ def test_fix_selection():
     assert sound.frames.tolist() == frames.tolist()
     
 
+def test_paste_shares_frames():
+    from gum.lib.mock import Fake, Mock
+    from gum.models import Selection
+    import numpy
+
+    graph = Mock({})
+    graph.changed = Fake()
+    selection = Selection(graph, Fake())
+    sound = Sound()
+    frames = numpy.arange(1000.)
+    sound.frames = frames
+    editor = Editor(sound, Fake(), Fake(), selection)
+    selection.set(100, 200)
+    editor.copy()
+    selection.set(500, 500)
+    editor.paste()
+    assert all(p[0] is frames for p in sound.frames.pieces())
+    assert sound.frames[500:600].tolist() == range(100, 200)
+
 if __name__ == "__main__":
     test_Editor()
     test_fix_selection()
+    test_paste_shares_frames()
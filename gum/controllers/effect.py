@@ -1,3 +1,4 @@
+from gum.lib import pcm
 import numpy
 from copy import copy
 
@@ -16,6 +17,9 @@ def normalize(x):
     return y
 
 def negate(x):
+    if x.dtype.kind == 'i':
+        # -(-32768) does not fit in 16 bits
+        return pcm.cast(-x.astype(numpy.int64), x.dtype)
     return -x
 
 def fade(x, type='in'):
@@ -28,7 +32,7 @@ def fade(x, type='in'):
         curve = numpy.array(curve)
         curve = curve.transpose()
     y = copy(x) * curve
-    return y
+    return pcm.cast(y, x.dtype)
 
 def fade_out(x):
     return fade(x, 'out')
@@ -37,7 +41,7 @@ def mkfx_overwrite_selection(function):
     def process(sound, start, end):
         x = sound.frames[start:end]
         y = function(x)
-        sound.paste(start, end, y)
+        sound.replace(start, end, y)
     return process
 
 # Register effects
@@ -49,6 +53,13 @@ effects['Fade Out'] = mkfx_overwrite_selection(fade_out)
 
 # Tests
 if __name__ == '__main__':
+    # Keep the peaks of the test sounds out of the user's cache.
+    import atexit
+    import shutil
+    import tempfile
+    from gum.lib import peakcache
+    peakcache.CACHE_DIR = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, peakcache.CACHE_DIR, True)
     from gum.models import Sound
     import numpy
 
@@ -113,3 +124,12 @@ if __name__ == '__main__':
     snd.frames = numpy.array([1, 1, 1])
     fx(snd, 0, 3)
     assert snd.frames.tolist() == [1, 0.5, 0]
+
+    # integer samples
+    snd = Sound(dtype='int16')
+    snd.frames = numpy.array([-32768, 100, 200], dtype='int16')
+    effects['Negate'](snd, 0, 3)
+    assert snd.frames.tolist() == [32767, -100, -200]
+    effects['Fade Out'](snd, 0, 3)
+    assert snd.frames.tolist() == [32767, -50, 0]
+    assert snd.frames.dtype == numpy.int16
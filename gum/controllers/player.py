@@ -2,49 +2,448 @@
 # Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
 # Licensed under the Revised BSD License.
 
-import alsaaudio
 import threading
+import traceback
+import collections
+import Queue
 from  gum.lib.event import Signal
+from gum.lib import pcm
+from gum.lib.piecetable import PieceTable
+from gum.lib.ringbuffer import RingBuffer
 import numpy
+import struct
+import time
+try:
+    import alsaaudio
+except ImportError:
+    HAVE_ALSA = False
+    print "Warning: 'alsaaudio' module not found. You won't hear sounds!"
+else:
+    HAVE_ALSA = True
 
-class AlsaBackend(object):
+# Sample type written to the device for each sample type of the frames.
+# float64 has no ALSA format and is converted to float32.
+OUTPUT_DTYPES = {'int16': 'int16', 'int32': 'int32',
+                 'float32': 'float32', 'float64': 'float32'}
+
+# Number of periods of frames read and converted ahead of the device.
+DEPTH = 8
+
+# Frames a backend takes at once.
+PERIODSIZE = 1024
+
+def interleave(buf, dtype, periodsize):
+    """Return the bytes of stereo frames of type dtype.
+
+    Mono frames are duplicated, and frames shorter than periodsize
+    are padded with zeros. Samples are only converted if dtype is not
+    the type of buf.
+
+    """
+    if buf.ndim == 1:
+        # converting mono to stereo
+        buf = numpy.array([buf, buf]).transpose()
+    if 0 < len(buf) < periodsize:
+        # zero padding to flush the ALSA buffer
+        padlen = periodsize - len(buf)
+        padding = numpy.zeros((padlen, buf.shape[1]), dtype=buf.dtype)
+        buf = numpy.concatenate((buf, padding))
+    return pcm.convert(buf, dtype).tostring()
+
+def pump(frames, out):
+    """Copy frames into the stereo out array, converted to its type.
+
+    Mono frames are copied on both channels, and channels after the
+    second are dropped. No array is allocated.
+
+    """
+    n = len(frames)
+    if frames.dtype != out.dtype:
+        scale = pcm.fullscale(out.dtype) / pcm.fullscale(frames.dtype)
+        if scale != 1:
+            if frames.ndim == 1:
+                frames = frames.reshape((n, 1))
+            numpy.multiply(frames[:, :2], scale, out=out[:n],
+                           casting='unsafe')
+            return
+    if frames.ndim == 1:
+        out[:n, 0] = frames
+        out[:n, 1] = frames
+    else:
+        out[:n] = frames[:, :2]
+
+def _wait(event, ready):
+    """Wait until ready() returns True.
+
+    event must be set each time ready() may have become true.
+
+    """
+    while not ready():
+        event.clear()
+        if not ready():
+            event.wait()
+
+def _pieces(frames, start, end):
+    "Return the (buffer, start, end) pieces of frames[start:end]."
+    if isinstance(frames, PieceTable):
+        return frames.pieces(start, end)
+    elif start < end:
+        return [(frames, start, end)]
+    else:
+        return []
+
+
+class Backend(object):
+    """Where a Player writes the frames it plays.
+
+    The player writes periodsize stereo frames of type dtype at a time,
+    and fewer at the end. write() also takes any frames interleave()
+    does. xruns counts the times the output ran out of frames.
+
+    A backend can be shared by several players, one playing at a time:
+    a player claim()s it before playing, which stops the player that
+    was playing, and release()s it once done. When no player plays or
+    waits to, the backend is idle() until the next one opens it.
+
+    """
+    def __init__(self, rate=44100):
+        self.xruns = 0
+        self.periodsize = PERIODSIZE
+        self.samplerate = None
+        self.dtype = None
+        self.set_dtype('float64')
+        self.set_samplerate(rate)
+        # The player playing, and the lock it holds while playing.
+        self._player = None
+        self._lock = threading.Lock()
+        # Held while a player waits for the one playing to stop.
+        self._claim_lock = threading.Lock()
+        # Claims not released yet, the one playing included.
+        self._claims = 0
+        self._claims_lock = threading.Lock()
+
+    def set_samplerate(self, rate):
+        "Set the sample rate, if it is not the one already set."
+        if rate != self.samplerate:
+            self.samplerate = rate
+            self._configure()
+
+    def set_dtype(self, dtype):
+        """Set the sample type of the frames that will be written.
+
+        Integer and float32 frames are output as they are.
+
+        """
+        dtype = OUTPUT_DTYPES.get(numpy.dtype(dtype).name, 'float32')
+        if dtype != self.dtype:
+            self.dtype = dtype
+            self._configure()
+
+    def _configure(self):
+        "Apply the sample rate and type to the output."
+        pass
+
+    def claim(self, player):
+        """Give the output to player, once the player playing stopped."""
+        self._claims_lock.acquire()
+        self._claims += 1
+        self._claims_lock.release()
+        self._claim_lock.acquire()
+        try:
+            playing = self._player
+            if playing is not None and playing is not player:
+                playing.stop()
+            self._lock.acquire()
+            self._player = player
+        finally:
+            self._claim_lock.release()
+
+    def release(self):
+        "Tell that the player the output was given to stopped playing."
+        self._player = None
+        self._claims_lock.acquire()
+        try:
+            self._claims -= 1
+            idle = self._claims == 0
+        finally:
+            self._claims_lock.release()
+        # Before another player can claim the output and open it.
+        if idle:
+            self.idle()
+        self._lock.release()
+
+    def player(self):
+        "Return the player playing, or None."
+        return self._player
+
+    def open(self):
+        "Prepare the output to be written to."
+        pass
+
+    def idle(self):
+        """Let go of the output while no player plays or waits to.
+
+        open() is called before it is written to again.
+
+        """
+        pass
+
+    def write(self, buf):
+        """Output the frames of buf.
+
+        Subclasses must override this method: Backend itself has no
+        output.
+
+        """
+        raise NotImplementedError
+
+
+class AlsaBackend(Backend):
+    """Play frames on the sound card.
+
+    The device is opened when a player starts playing, and closed once
+    no player plays or waits to, so that other programs can use it.
+    While it is open, it is only set up again when the sample rate or
+    type changes.
+
+    """
     def __init__(self, rate=44100):
+        self._pcm = None
+        Backend.__init__(self, rate)
+
+    def _configure(self):
+        if self._pcm is None:
+            return
+        formats = {'int16': alsaaudio.PCM_FORMAT_S16_LE,
+                   'int32': alsaaudio.PCM_FORMAT_S32_LE,
+                   'float32': alsaaudio.PCM_FORMAT_FLOAT_LE}
+        self._pcm.setformat(formats[self.dtype])
+        self._pcm.setrate(self.samplerate)
+
+    def open(self):
+        if self._pcm is not None:
+            return
         self._pcm = alsaaudio.PCM(type=alsaaudio.PCM_PLAYBACK,
                             mode=alsaaudio.PCM_NORMAL)
         self._pcm.setchannels(2)
-        self._pcm.setformat(alsaaudio.PCM_FORMAT_FLOAT_LE)
-        self.set_samplerate(rate)
+        self._configure()
         # alsaaudio.PCM.setperiodsize() attempts to change the
         # periodsize and returns the actual period size.
-        self.periodsize = self._pcm.setperiodsize(1024)
+        self.periodsize = self._pcm.setperiodsize(PERIODSIZE)
 
-    def set_samplerate(self, rate):
-        self._pcm.setrate(rate)
+    def close(self):
+        "Close the device, until frames are played again."
+        if self._pcm is not None:
+            self._pcm.close()
+            self._pcm = None
+
+    def idle(self):
+        self.close()
+
+    def write(self, buf):
+        self.open()
+        # Older versions of alsaaudio do not tell the state of the device.
+        xrun = getattr(alsaaudio, 'PCM_STATE_XRUN', None)
+        if xrun is not None and self._pcm.state() == xrun:
+            self.xruns += 1
+        if (len(buf) == self.periodsize and buf.ndim == 2 and
+            buf.shape[1] == 2 and buf.dtype == self.dtype and
+            buf.flags.c_contiguous):
+            # A period ready to play is written without a copy. alsaaudio
+            # releases the GIL while the device takes it.
+            self._pcm.write(buf)
+        else:
+            self._pcm.write(interleave(buf, self.dtype, self.periodsize))
+
+
+class NullBackend(Backend):
+    """Discard frames, as a sound card would play them, or at once.
+
+    In real time, write() returns when the output has room for the
+    frames. The output holds latency frames, two periods by default,
+    and runs out of frames when they are not written in time. frames
+    counts the frames written.
+
+    """
+    def __init__(self, rate=44100, realtime=True, latency=None):
+        Backend.__init__(self, rate)
+        self.realtime = realtime
+        if latency is None:
+            latency = 2 * self.periodsize
+        self.latency = latency
+        self.frames = 0
+        # Time the output will have played the frames written.
+        self._end = None
+
+    def write(self, buf):
+        self.frames += len(buf)
+        if not self.realtime:
+            return
+        now = time.time()
+        if self._end is None or self._end < now:
+            if self._end is not None:
+                self.xruns += 1
+            self._end = now
+        self._end += len(buf) / float(self.samplerate)
+        wait = self._end - self.latency / float(self.samplerate) - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+class WavBackend(Backend):
+    """Write frames to a WAV file, as fast as possible.
+
+    Samples are saved in the type they are output in: 16 or 32 bits
+    integers, or 32 bits floats. The file is complete after each
+    write.
+
+    """
+    def __init__(self, filename, rate=44100):
+        Backend.__init__(self, rate)
+        self._file = open(filename, 'wb')
+        self._datasize = 0
+        self._write_header()
+
+    def _write_header(self):
+        dtype = numpy.dtype(self.dtype)
+        width = dtype.itemsize
+        if dtype.kind == 'f':
+            tag = 0x0003 # WAVE_FORMAT_IEEE_FLOAT
+        else:
+            tag = 0x0001 # WAVE_FORMAT_PCM
+        fmt = struct.pack('<HHIIHH', tag, 2, self.samplerate,
+                          self.samplerate * 2 * width, 2 * width, 8 * width)
+        self._file.seek(0)
+        self._file.write('RIFF' + struct.pack('<I', 28 + len(fmt) +
+                                              self._datasize))
+        self._file.write('WAVEfmt ' + struct.pack('<I', len(fmt)) + fmt)
+        self._file.write('data' + struct.pack('<I', self._datasize))
 
     def write(self, buf):
-        if buf.ndim == 1:
-            # converting mono to stereo
-            buf = numpy.array([buf, buf]).transpose()
-        if 0 < len(buf) < self.periodsize:
-            # zero padding to flush the ALSA buffer
-            padlen = self.periodsize - len(buf)
-            padding = numpy.zeros((padlen, buf.ndim))
-            buf = numpy.concatenate((buf, padding))
-        bytes = buf.astype(numpy.float32).tostring()
-        self._pcm.write(bytes)
-        
+        data = interleave(buf, self.dtype, 0)
+        self._file.seek(0, 2)
+        self._file.write(data)
+        self._datasize += len(data)
+        self._write_header()
+        self._file.flush()
+
+    def close(self):
+        self._write_header()
+        self._file.close()
+
+
+_output = None
+_output_lock = threading.Lock()
+
+def output():
+    """Return the backend players share by default.
+
+    It is made the first time it is needed: alsa if it is installed,
+    a null backend otherwise.
+
+    """
+    global _output
+    _output_lock.acquire()
+    try:
+        if _output is None:
+            _output = AlsaBackend() if HAVE_ALSA else NullBackend()
+        return _output
+    finally:
+        _output_lock.release()
+
+
+class _Session(object):
+    """What the playing thread and the producer share while playing."""
+
+    def __init__(self, ring, periodsize):
+        self.ring = ring
+        self.periodsize = periodsize
+        # A period whose frames wrap around the end of the ring, put
+        # together.
+        self.period = numpy.empty((periodsize, 2), ring.dtype)
+        self.active = True
+        # (write count, frame) where the region last started: the
+        # frames written before are dropped.
+        self.jump = None
+        # (write count, frame) where the region wrapped around, in loop
+        # mode.
+        self.wraps = collections.deque()
+        # Generation of the region the producer buffered to the end.
+        self.exhausted = None
+        self.finished = threading.Event()
+
+
+class _Playback(object):
+    """What Player.thread_play() returns."""
+
+    def __init__(self, done):
+        self._done = done
+
+    def join(self, timeout=None):
+        "Wait until the player stops playing."
+        self._done.wait(timeout)
+
 
 class Player(object):
     """Play sound using alsa.
 
+    While playing, a producer thread reads and converts the frames into
+    a ring buffer, depth periods ahead of the device, and the playing
+    thread only writes the buffered frames to the device. A stall of
+    the producer shorter than the buffer is not heard. Frames are
+    converted in place in the buffer, and written to the device from
+    it, so that no array is allocated while playing. The device is
+    written whole periods, and a period that wraps around the end of
+    the buffer is copied into one array first.
+
+    Both threads are made the first time the player plays, and wait
+    for the next play once done, until close(). Playing while playing
+    swaps the region in: the frames buffered from the previous region
+    are dropped and the device goes on, without a gap. In loop mode,
+    the start of the region follows its end in the same period.
+
+    underruns counts the times the buffer ran out of frames, and xruns
+    the times the device did while the player played.
+
+    Frames are played with the backend given, or with the output all
+    players share by default. Starting to play stops the player that
+    was playing on the same backend.
+
     """
-    def __init__(self, sound):
+    def __init__(self, sound, depth=DEPTH, backend=None):
         self._playing = False
         self._lock = threading.Lock()
         self.start_playing = Signal()
         self.stop_playing = Signal()
         self.position = 0
-        self._backend = AlsaBackend()
+        self.depth = depth
+        self.loop = False
+        self.underruns = 0
+        # xruns counted until the last claim of the backend, and the
+        # count of the backend at that claim while it is not released.
+        self._xruns = 0
+        self._claimed_xruns = None
+        self._ring = None
+        # (generation, start, end) of the region to play. Each play
+        # makes a new generation, which the producer goes on with.
+        self._target = (0, 0, 0)
+        # Set when frames are buffered, and when frames are played or
+        # the region changes. The frames themselves are passed without
+        # a lock.
+        self._buffered = threading.Event()
+        self._played = threading.Event()
+        # The playing thread waits for _wake, and sets _done once it
+        # stopped playing. _active tells whether it plays, or was woken
+        # up to.
+        self._wake = threading.Event()
+        self._done = threading.Event()
+        self._active = False
+        self._closed = False
+        self._sessions = Queue.Queue()
+        self._threads = None
+        if backend is None:
+            backend = output()
+        self._backend = backend
         self.set_sound(sound)
 
     def set_sound(self, sound):
@@ -54,44 +453,258 @@ class Player(object):
         self.set_samplerate(self._sound.samplerate)
 
     def set_samplerate(self, rate):
-        self._backend.set_samplerate(rate)
+        self._samplerate = rate
+        if self._backend.player() is self:
+            self._backend.set_samplerate(rate)
+
+    @property
+    def xruns(self):
+        self._lock.acquire()
+        try:
+            xruns = self._xruns
+            if self._claimed_xruns is not None:
+                xruns += self._backend.xruns - self._claimed_xruns
+            return xruns
+        finally:
+            self._lock.release()
+
+    def fill(self):
+        "Return the number of frames buffered ahead of the device."
+        if self._ring is None:
+            return 0
+        return self._ring.fill()
 
-    def play(self):
-        self.position = self.start
-        self.start_playing()
+    def _run(self):
+        "The playing thread: play each time thread_play() asks to."
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self._lock.acquire()
+            try:
+                closed = self._closed
+                done = self._done
+                self._active = self._playing
+            finally:
+                self._lock.release()
+            if closed:
+                done.set()
+                break
+            if self._active:
+                try:
+                    self._play()
+                except Exception:
+                    traceback.print_exc()
+                    self._lock.acquire()
+                    self._playing = self._active = False
+                    self._lock.release()
+            done.set()
+        self._sessions.put(None)
+
+    def _play(self):
+        backend = self._backend
+        backend.claim(self)
+        self._claimed_xruns = backend.xruns
         try:
-            while self._playing:
-                if self.position >= self.end:
-                    self._playing = False
-                else:
-                    start = self.position
-                    end = min(self.position + self._backend.periodsize, 
-                              self.end)
-                    buf = self._sound.frames[start:end]
-                    self.position = end
-                    self._backend.write(buf)
+            backend.set_samplerate(self._samplerate)
+            backend.set_dtype(self._sound.frames.dtype)
+            backend.open()
+            periodsize = backend.periodsize
+            dtype = numpy.dtype(backend.dtype)
+            capacity = self.depth * periodsize
+            ring = self._ring
+            if (ring is None or ring.capacity != capacity or
+                ring.dtype != dtype):
+                ring = RingBuffer(capacity, 2, dtype)
+            ring.clear()
+            self._ring = ring
+            session = _Session(ring, periodsize)
+            self._sessions.put(session)
+            self.start_playing()
+            try:
+                self._consume(session)
+            finally:
+                session.active = False
+                self._played.set()
+                session.finished.wait()
+                self.stop_playing()
         finally:
-            self.stop_playing()
+            self._lock.acquire()
+            self._xruns += backend.xruns - self._claimed_xruns
+            self._claimed_xruns = None
             self._lock.release()
+            backend.release()
+
+    def _consume(self, session):
+        "Write the frames buffered to the device until playing stops."
+        ring = session.ring
+        periodsize = session.periodsize
+        wraps = session.wraps
+        jump = None
+        base = (0, self._target[1])
+        self.position = base[1]
+        ended = lambda: (session.exhausted == self._target[0] and
+                         session.jump is jump and ring.fill() == 0)
+        ready = lambda: (ring.fill() >= periodsize or not self._playing or
+                         session.exhausted == self._target[0] or
+                         session.jump is not jump)
+        # Let the producer get ahead before playing.
+        _wait(self._buffered, lambda: ring.space() < periodsize or
+              session.exhausted is not None or not self._playing)
+        while True:
+            if session.jump is not jump:
+                # A new region: the frames left from the previous one
+                # are not played.
+                jump = session.jump
+                ring.drop_before(jump[0])
+                while wraps and wraps[0][0] < jump[0]:
+                    wraps.popleft()
+                base = jump
+            if not self._playing or ended():
+                # Unless asked to play again in the meantime.
+                self._lock.acquire()
+                try:
+                    stop = not self._playing or ended()
+                    if stop:
+                        self._playing = self._active = False
+                finally:
+                    self._lock.release()
+                if stop:
+                    break
+                continue
+            if not ready():
+                self.underruns += 1
+                _wait(self._buffered, ready)
+                continue
+            n = min(periodsize, ring.fill())
+            if n == 0:
+                continue
+            read = ring.total_read() + n
+            while wraps and wraps[0][0] <= read:
+                base = wraps.popleft()
+            self.position = base[1] + read - base[0]
+            frames = ring.buffered_area(n)
+            if len(frames) == n:
+                self._backend.write(frames)
+                ring.release(n)
+            else:
+                # A region can start anywhere in the ring: the frames
+                # are copied, so that only its last write is short.
+                ring.read(session.period[:n])
+                self._backend.write(session.period[:n])
+            self._played.set()
+
+    def _produce(self):
+        "The producer thread: fill the ring of each session."
+        while True:
+            session = self._sessions.get()
+            if session is None:
+                break
+            try:
+                self._fill(session)
+            finally:
+                session.finished.set()
+                self._buffered.set()
+
+    def _fill(self, session):
+        """Fill the ring with the frames of the region to play, converted
+        for the device, until the session ends."""
+        ring = session.ring
+        periodsize = session.periodsize
+        generation = None
+        while session.active:
+            target = self._target
+            if target[0] != generation:
+                generation, start, end = target
+                end = min(end, len(self._sound.frames))
+                position = start
+                session.jump = (ring.total_written(), start)
+                self._buffered.set()
+            moved = lambda: (not session.active or
+                             self._target[0] != generation)
+            if position >= end:
+                if self.loop and start < end:
+                    position = start
+                    session.wraps.append((ring.total_written(), start))
+                    session.exhausted = None
+                else:
+                    session.exhausted = generation
+                    self._buffered.set()
+                    _wait(self._played, lambda: moved() or self.loop)
+                    continue
+            _wait(self._played, lambda: ring.space() >= periodsize or moved())
+            if moved():
+                continue
+            area = ring.free_area(end - position)
+            i = 0
+            for buf, s, e in _pieces(self._sound.frames, position,
+                                     position + len(area)):
+                pump(buf[s:e], area[i:i + e - s])
+                i += e - s
+            ring.commit(i)
+            position += i
+            self._buffered.set()
 
     def thread_play(self):
-        # Only one thread at a time can play. If a thread is already
-        # playing, stop it before creating a new thread.
-        self._playing = False
+        """Play from start to end, in the playing thread.
+
+        If the player is playing, it goes on from start at once.
+        Returns an object whose join() waits until playing stops.
+
+        """
         self._lock.acquire()
-        self._playing = True
-        t = threading.Thread(target=self.play, args=())
-        t.start()
-        return t
+        try:
+            if self._threads is None:
+                self._threads = [threading.Thread(target=self._run),
+                                 threading.Thread(target=self._produce)]
+                for t in self._threads:
+                    t.setDaemon(True)
+                    t.start()
+            self._target = (self._target[0] + 1, self.start, self.end)
+            self._playing = True
+            if not self._active:
+                # The calls made until the playing thread wakes up wait
+                # for the same playing.
+                self._active = True
+                self._done = threading.Event()
+                self._wake.set()
+            self._played.set()
+            self._buffered.set()
+            return _Playback(self._done)
+        finally:
+            self._lock.release()
 
     def stop(self):
         self._playing = False
+        self._played.set()
+        self._buffered.set()
+
+    def close(self):
+        "Stop playing, and end the threads of the player."
+        self._lock.acquire()
+        try:
+            self._closed = True
+            self._playing = False
+        finally:
+            self._lock.release()
+        self._wake.set()
+        self._played.set()
+        self._buffered.set()
 
     def is_playing(self):
         return self._playing
 
 
 # test
+def test_interleave():
+    mono = numpy.array([16384, -32768], dtype='int16')
+    out = numpy.fromstring(interleave(mono, 'int16', 4), dtype='int16')
+    assert out.tolist() == [16384, 16384, -32768, -32768, 0, 0, 0, 0]
+    stereo = numpy.array([[0.5, -1]])
+    out = numpy.fromstring(interleave(stereo, 'float32', 1), dtype='float32')
+    assert out.tolist() == [0.5, -1]
+    out = numpy.fromstring(interleave(stereo, 'int16', 1), dtype='int16')
+    assert out.tolist() == [16384, -32768]
+
 def testPlayer():
     from gum.lib.mock import Mock
     from math import sin
@@ -156,6 +769,230 @@ def testPlayer():
     player = Player(sound)
     player.thread_play().join()
 
+def test_pump():
+    from gum.lib.pcmmap import PCMMap
+    import tempfile
+    import os
+    fd, filename = tempfile.mkstemp(suffix='.wav')
+    os.close(fd)
+    frames = numpy.random.uniform(-1, 1, (3000, 2)).astype('float32')
+    backend = WavBackend(filename)
+    backend.set_dtype('float32')
+    backend.write(frames)
+    backend.close()
+    try:
+        mono = numpy.array([16384, -32768], dtype='int16')
+        out = numpy.zeros((3, 2), dtype='float32')
+        pump(mono, out)
+        assert out.tolist() == [[0.5, 0.5], [-1, -1], [0, 0]]
+        out = numpy.zeros((2, 2), dtype='int16')
+        pump(mono, out)
+        assert out.tolist() == [[16384, 16384], [-32768, -32768]]
+        four = numpy.array([[0.25, -0.5, 1, 1]])
+        out = numpy.zeros((1, 2), dtype='float32')
+        pump(four, out)
+        assert out.tolist() == [[0.25, -0.5]]
+        # frames mapped read-only from a file of their sample type
+        mapped = PCMMap(filename, 'float32')[:]
+        assert not mapped.flags.writeable
+        out = numpy.zeros((3000, 2), dtype='float32')
+        pump(mapped, out)
+        assert (out == frames).all()
+        del mapped
+    finally:
+        os.remove(filename)
+
+def test_backends():
+    from gum.lib.mock import Mock
+    from gum.lib.pcmmap import PCMMap
+    import tempfile
+    import os
+    sound = Mock({"numchan": 1})
+    sound.samplerate = 8000
+    sound.frames = numpy.linspace(-1, 1, 5000)
+
+    # as fast as possible
+    backend = NullBackend(realtime=False)
+    player = Player(sound, backend=backend)
+    player.thread_play().join()
+    assert backend.frames == 5000
+    assert player.position == 5000
+    assert backend.samplerate == 8000
+    assert backend.dtype == 'float32'
+
+    # plays asked for before the playing thread wakes up end together
+    for i in range(20):
+        t1 = player.thread_play()
+        t2 = player.thread_play()
+        t1.join(5)
+        t2.join(5)
+        assert t1._done.is_set() and t2._done.is_set()
+    assert not player.is_playing()
+
+    # in real time
+    backend = NullBackend()
+    player = Player(sound, backend=backend)
+    player.start = 2000
+    t = time.time()
+    player.thread_play().join()
+    latency = backend.latency / 8000.
+    assert time.time() - t >= 3000 / 8000. - latency
+    assert (backend.frames, backend.xruns, player.underruns) == (3000, 0, 0)
+    # a late write
+    time.sleep(latency + 0.05)
+    backend.write(numpy.zeros(10))
+    assert backend.xruns == 1
+    # only the xruns while the player played are its own
+    assert player.xruns == 0
+
+    # sample accurate files
+    fd, filename = tempfile.mkstemp(suffix='.wav')
+    os.close(fd)
+    try:
+        for dtype in ['float64', 'float32', 'int16', 'int32']:
+            sound.frames = pcm.convert(numpy.random.uniform(-1, 1, (5000, 2)),
+                                       dtype)
+            backend = WavBackend(filename)
+            player = Player(sound, backend=backend)
+            player.start = 1000
+            player.end = 3500
+            player.thread_play().join()
+            backend.close()
+            played = PCMMap(filename, dtype)[:]
+            expected = pcm.convert(sound.frames[1000:3500], backend.dtype)
+            assert (pcm.convert(played, backend.dtype) == expected).all()
+    finally:
+        os.remove(filename)
+
+def test_output():
+    from gum.lib.mock import Mock
+    sound = Mock({"numchan": 1})
+    sound.samplerate = 8000
+    sound.frames = numpy.zeros(8000)
+    assert Player(sound)._backend is Player(sound)._backend
+
+    class Output(NullBackend):
+        configured = 0
+        idled = 0
+        def _configure(self):
+            self.configured += 1
+        def idle(self):
+            self.idled += 1
+
+    # another player starting to play stops the one playing
+    backend = Output()
+    p1 = Player(sound, backend=backend)
+    p2 = Player(sound, backend=backend)
+    t1 = p1.thread_play()
+    time.sleep(0.1)
+    assert p1.is_playing() and backend.player() is p1
+    t2 = p2.thread_play()
+    t1.join()
+    assert not p1.is_playing() and p1.position < 8000
+    time.sleep(0.1)
+    assert p2.is_playing() and backend.player() is p2
+    # p2 was waiting for the output when p1 released it
+    assert backend.idled == 0
+    p2.stop()
+    t2.join()
+    assert backend.player() is None
+    assert backend.idled == 1
+
+    # the output is only set up again when something changed
+    configured = backend.configured
+    p1.thread_play().join()
+    assert backend.configured == configured
+    sound.samplerate = 44100
+    p1.set_sound(sound)
+    p1.thread_play().join()
+    assert backend.configured == configured + 1
+    assert backend.samplerate == 44100
+
+def test_loop():
+    from gum.lib.mock import Mock
+    sound = Mock({"numchan": 2})
+    sound.samplerate = 8000
+    sound.frames = numpy.random.uniform(-1, 1, (20000, 2)).astype('float32')
+    frames = sound.frames
+
+    class Recorder(NullBackend):
+        def __init__(self, realtime):
+            NullBackend.__init__(self, realtime=realtime)
+            self.written = []
+            self.on_write = lambda: None
+        def write(self, buf):
+            self.written.append(numpy.array(buf))
+            self.on_write()
+            NullBackend.write(self, buf)
+        def played(self):
+            return numpy.concatenate(self.written)
+
+    # the region wraps around without a gap
+    backend = Recorder(realtime=False)
+    player = Player(sound, backend=backend)
+    player.loop = True
+    player.start, player.end = 1000, 1300
+    def stop():
+        if len(backend.written) == 5:
+            player.stop()
+    backend.on_write = stop
+    player.thread_play().join()
+    played = backend.played()
+    assert len(played) == 5 * backend.periodsize
+    loops = numpy.tile(frames[1000:1300], (20, 1))
+    assert (played == loops[:len(played)]).all()
+    assert player.position == 1000 + len(played) % 300
+
+    # playing while playing goes on with the new region, in the same
+    # threads
+    threads = threading.active_count()
+    backend = Recorder(realtime=True)
+    player._backend = backend
+    player.loop = False
+    def retarget():
+        if len(backend.written) == 3:
+            player.start, player.end = 10000, 12000
+            player.thread_play()
+    backend.on_write = retarget
+    player.start, player.end = 0, 8000
+    player.thread_play().join()
+    assert threading.active_count() == threads
+    played = backend.played()
+    old = 3 * backend.periodsize
+    assert (played[:old] == frames[:old]).all()
+    assert (played[old:] == frames[10000:12000]).all()
+    assert player.position == 12000 and not player.is_playing()
+
+    # a region starting at any frame is played in whole periods
+    backend = Recorder(realtime=False)
+    player._backend = backend
+    player.loop = True
+    player.start, player.end = 1000, 1300
+    def retarget():
+        if len(backend.written) == 3:
+            player.loop = False
+            player.start, player.end = 10000, 16000
+            player.thread_play()
+    backend.on_write = retarget
+    player.thread_play().join()
+    sizes = [len(buf) for buf in backend.written]
+    assert sizes[:-1] == [backend.periodsize] * (len(sizes) - 1)
+    played = backend.played()
+    old = len(played) - 6000
+    assert old >= 3 * backend.periodsize
+    loops = numpy.tile(frames[1000:1300], (old / 300 + 1, 1))
+    assert (played[:old] == loops[:old]).all()
+    assert (played[old:] == frames[10000:16000]).all()
+
+    player.close()
+    for t in player._threads:
+        t.join()
+
 if __name__ == '__main__':
+    test_interleave()
+    test_pump()
+    test_backends()
+    test_output()
+    test_loop()
     testPlayer()
     print "done"
@@ -1,7 +1,10 @@
 #cython: boundscheck=False
 
+from libc.stdlib cimport malloc, free
+
 cdef extern from "math.h":
     double round (double x) nogil
+    double sqrt (double x) nogil
 
 cdef extern from "fast.h":
     ctypedef struct PycairoContext:
@@ -16,55 +19,92 @@ cdef extern from "fast.h":
     void cairo_set_line_width(void *cr, double w) nogil
 
 
-def draw_channel(list values,
+def draw_channel(const double[:, ::1] values,
                  context,
-                 float ystart, float width, float height):
+                 float ystart, float width, float height,
+                 wavecolor, rmscolor, axiscolor, int fill_columns):
+    """Draw the (min, max) rows of the values array.
+
+    If the rows also hold the root mean square, it is drawn as a band
+    inside the peaks. Colors are (r, g, b) tuples, and the rectangles
+    of fill_columns columns are filled at once.
+
+    """
     cdef PycairoContext *pcc
     cdef void *cr
-    cdef double mini, maxi, x, ymin, ymax
+    cdef double mini, maxi, rms, ymin, ymax
+    cdef Py_ssize_t x
+    cdef double r, g, b
 
     pcc = <PycairoContext *> context
     cr = pcc.ctx
 
     # Line at zero
     cairo_set_line_width(cr, 1)
-    cairo_set_source_rgb(cr, 0.2, 0.2, 0.2)
+    r, g, b = axiscolor
+    cairo_set_source_rgb(cr, r, g, b)
     cairo_move_to(cr, 0, ystart + round(height / 2) + 0.5)
     cairo_line_to(cr, width, ystart + round(height / 2) + 0.5)
     cairo_stroke(cr)
 
-    # Waveform
-    cairo_set_source_rgb(cr, 0.0, 0.47058823529411764, 1.0)
-    for x, (mini, maxi) in enumerate(values):
-        with nogil:
+    # Waveform, as pixel-aligned rectangles filled a few columns at once.
+    r, g, b = wavecolor
+    cairo_set_source_rgb(cr, r, g, b)
+    with nogil:
+        for x in range(values.shape[0]):
+            mini = values[x, 0]
+            maxi = values[x, 1]
             # -1 <= mini <= maxi <= 1
-            # ystart <= ymin <= ymax <= ystart + height - 1
+            # ystart <= ymax <= ymin <= ystart + height - 1
             ymin = ystart + round((-mini * 0.5 + 0.5) * (height - 1))
             ymax = ystart + round((-maxi * 0.5 + 0.5) * (height - 1))
+            # The pixels a line from max to min covers, at least one.
             if ymin == ymax:
-                # Fill one pixel
-                cairo_rectangle(cr, x, ymin, 1, 1)
+                ymin = ymax + 1
+            cairo_rectangle(cr, x, ymax, 1, ymin - ymax)
+            if x % fill_columns == fill_columns - 1:
                 cairo_fill(cr)
-            else:
-                # Draw a line from min to max
-                cairo_move_to(cr, x + 0.5, ymin)
-                cairo_line_to(cr, x + 0.5, ymax)
-                cairo_stroke(cr)
+        cairo_fill(cr)
+
+    if values.shape[1] < 3:
+        return
+    r, g, b = rmscolor
+    cairo_set_source_rgb(cr, r, g, b)
+    with nogil:
+        for x in range(values.shape[0]):
+            rms = values[x, 2]
+            mini = values[x, 0] if values[x, 0] > -rms else -rms
+            maxi = values[x, 1] if values[x, 1] < rms else rms
+            ymin = ystart + round((-mini * 0.5 + 0.5) * (height - 1))
+            ymax = ystart + round((-maxi * 0.5 + 0.5) * (height - 1))
+            if ymin > ymax:
+                cairo_rectangle(cr, x, ymax, 1, ymin - ymax)
+            if x % fill_columns == fill_columns - 1:
+                cairo_fill(cr)
+        cairo_fill(cr)
 
 
 
 import numpy
 cimport numpy
-DTYPE = numpy.float64
-ctypedef numpy.float64_t DTYPE_t
 
-def _condense(numpy.ndarray[DTYPE_t, ndim=1] data,
-              int start, int width, float density):
+# Sample types of gum.lib.pcm.DTYPES, and int64 for plain integer arrays.
+ctypedef fused sample_t:
+    numpy.float64_t
+    numpy.float32_t
+    numpy.int32_t
+    numpy.int16_t
+    numpy.int64_t
+
+def _condense(numpy.ndarray[sample_t, ndim=1] data,
+              int start, int width, float density, Py_ssize_t offset=0):
     """Returns a list of (min, max) tuples.
 
     A density slices the data in "cells", each cell containing several
     frames. This function returns the min and max of each visible cell.
 
+    data[0] is frame number offset.
+
     """
     cdef Py_ssize_t i, j, a, b, l
     cdef double mini, maxi, x
@@ -72,8 +112,10 @@ def _condense(numpy.ndarray[DTYPE_t, ndim=1] data,
     l = len(data)
     for i in range(start, start + width):
         with nogil:
-            a = <int> round(i * density)
-            b = <int> round((i + 1) * density)
+            a = <int> round(i * density) - offset
+            b = <int> round((i + 1) * density) - offset
+            if a < 0:
+                a = 0
             if a >= l:
                 break
             if b > l:
@@ -88,3 +130,99 @@ def _condense(numpy.ndarray[DTYPE_t, ndim=1] data,
                     mini = x
         res.append((mini, maxi))
     return res
+
+
+def condense(const sample_t[:, ::1] data, Py_ssize_t start, Py_ssize_t width,
+             float density, Py_ssize_t offset, double[:, :, :] out):
+    """Fill out[c, k] with the (min, max, rms) of channel c in cell
+    start + k.
+
+    rms is the root mean square of the frames of the cell, from their
+    sum of squares. data holds one column per channel, and data[0] is
+    frame number offset. All channels are read in one pass, without
+    the GIL.
+    Returns the number of cells filled, less than width at the end of
+    data.
+
+    """
+    cdef Py_ssize_t i, j, c, a, b, l, numchan, n = 0
+    cdef double x, mini, maxi, mini2, maxi2, sq, sq2, count
+    cdef double *mins
+    cdef double *maxs
+    cdef double *sqs
+    cdef const sample_t *frames
+    l = data.shape[0]
+    numchan = data.shape[1]
+    if out.shape[0] < numchan or out.shape[1] < width or out.shape[2] < 3:
+        raise ValueError("out is too small")
+    if l == 0 or numchan == 0:
+        return 0
+    frames = &data[0, 0]
+    mins = <double *> malloc(3 * numchan * sizeof(double))
+    if mins == NULL:
+        raise MemoryError()
+    maxs = mins + numchan
+    sqs = maxs + numchan
+    with nogil:
+        for i in range(start, start + width):
+            a = <Py_ssize_t> round(i * density) - offset
+            b = <Py_ssize_t> round((i + 1) * density) - offset
+            if a < 0:
+                a = 0
+            if a >= l:
+                break
+            if b > l:
+                b = l
+            # A cell of less than one frame holds the frame it starts on.
+            count = b - a if b > a else 1
+            if numchan == 1:
+                mini = frames[a]
+                maxi = frames[a]
+                sq = mini * mini
+                for j in range(a + 1, b):
+                    x = frames[j]
+                    maxi = x if x > maxi else maxi
+                    mini = x if x < mini else mini
+                    sq = sq + x * x
+                out[0, n, 0] = mini
+                out[0, n, 1] = maxi
+                out[0, n, 2] = sqrt(sq / count)
+            elif numchan == 2:
+                mini = maxi = frames[2 * a]
+                mini2 = maxi2 = frames[2 * a + 1]
+                sq = mini * mini
+                sq2 = mini2 * mini2
+                for j in range(a + 1, b):
+                    x = frames[2 * j]
+                    maxi = x if x > maxi else maxi
+                    mini = x if x < mini else mini
+                    sq = sq + x * x
+                    x = frames[2 * j + 1]
+                    maxi2 = x if x > maxi2 else maxi2
+                    mini2 = x if x < mini2 else mini2
+                    sq2 = sq2 + x * x
+                out[0, n, 0] = mini
+                out[0, n, 1] = maxi
+                out[0, n, 2] = sqrt(sq / count)
+                out[1, n, 0] = mini2
+                out[1, n, 1] = maxi2
+                out[1, n, 2] = sqrt(sq2 / count)
+            else:
+                for c in range(numchan):
+                    mins[c] = frames[a * numchan + c]
+                    maxs[c] = mins[c]
+                    sqs[c] = mins[c] * mins[c]
+                for j in range(a + 1, b):
+                    for c in range(numchan):
+                        x = frames[j * numchan + c]
+                        maxs[c] = x if x > maxs[c] else maxs[c]
+                        mins[c] = x if x < mins[c] else mins[c]
+                        sqs[c] = sqs[c] + x * x
+                for c in range(numchan):
+                    out[c, n, 0] = mins[c]
+                    out[c, n, 1] = maxs[c]
+                    out[c, n, 2] = sqrt(sqs[c] / count)
+            n += 1
+    free(mins)
+    return n
+
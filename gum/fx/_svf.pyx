@@ -1,12 +1,17 @@
 import numpy
 cimport numpy
 
-DTYPE = numpy.float64
-ctypedef numpy.float64_t DTYPE_t
+ctypedef fused DTYPE_t:
+    numpy.float64_t
+    numpy.float32_t
 
 def svf(numpy.ndarray[DTYPE_t, ndim=1] x not None,
         float f, float damping, int samplerate):
-    """State variable filters. DAFX book, Section 2.2, page 36."""
+    """State variable filters. DAFX book, Section 2.2, page 36.
+
+    Outputs have the type of x.
+
+    """
     cdef float F
     cdef float Q
     cdef Py_ssize_t l
@@ -18,9 +23,9 @@ def svf(numpy.ndarray[DTYPE_t, ndim=1] x not None,
     F = 2 * numpy.sin(numpy.pi * f / samplerate)
     Q = 2 * damping
     l = len(x)
-    yh = numpy.zeros(l, dtype=DTYPE)
-    yb = numpy.zeros(l, dtype=DTYPE)
-    yl = numpy.zeros(l, dtype=DTYPE)
+    yh = numpy.zeros(l, dtype=x.dtype)
+    yb = numpy.zeros(l, dtype=x.dtype)
+    yl = numpy.zeros(l, dtype=x.dtype)
 
     n = 0
     while n < l:
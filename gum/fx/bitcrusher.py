@@ -1,20 +1,21 @@
 from gum.controllers import effect
 from gum.views import EffectDialog
+from gum.lib import pcm
 import numpy
 
 nbits_last = 8
 
 def bitcrush(x, nbits=4):
     maxamp = 2 ** int(nbits) / 2
-    y = numpy.array(x * maxamp, dtype='int16')
+    y = numpy.array(pcm.to_float(x) * maxamp, dtype='int16')
     z = numpy.array(y, dtype='float64') / maxamp
-    return z
+    return pcm.convert(z, x.dtype)
 
 def bitcrusher(sound, start, end):
 
     def process(nbits):
         y = bitcrush(sound.frames[start:end], nbits)
-        sound.paste(start, end, y)
+        sound.replace(start, end, y)
 
     def callback(parameters):
         nbits = parameters['Bit Width']
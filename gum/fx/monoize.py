@@ -4,6 +4,7 @@ from gum.models import sound
 
 def replace_frames(sound, y):
     sound.frames = y
+    sound.changed()
 
 def monoize(sound, start, end):
     x = sound.frames
@@ -11,6 +12,5 @@ def monoize(sound, start, end):
     do = (replace_frames, [sound, y])
     undo = (replace_frames, [sound, x])
     sound.history.add(do, undo)
-    sound.changed()
 
 effect.effects['Monoize'] = monoize
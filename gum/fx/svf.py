@@ -1,5 +1,6 @@
 from gum.controllers.effect import effects
 from gum.views import EffectDialog
+from gum.lib import pcm
 import numpy
 import functools
 
@@ -10,9 +11,9 @@ def svf(x, f, damping, samplerate):
     F = 2 * numpy.sin(numpy.pi * f / samplerate)
     Q = 2 * damping
 
-    yh = numpy.zeros(len(x))
-    yb = numpy.zeros(len(x))
-    yl = numpy.zeros(len(x))
+    yh = numpy.zeros(len(x), dtype=x.dtype)
+    yb = numpy.zeros(len(x), dtype=x.dtype)
+    yl = numpy.zeros(len(x), dtype=x.dtype)
     for n in range(len(x)):
         yh[n] = x[n] - yl[n-1] - Q * yb[n-1]
         yb[n] = F * yh[n] + yb[n-1]
@@ -45,11 +46,12 @@ def svf_fx(type, sound, start, end):
 
     def process(freq, damp):
         def apply(channel):
-            filtered = svf(channel, freq, damp, sound.samplerate)
+            filtered = svf(pcm.to_float(channel), freq, damp,
+                           sound.samplerate)
             i = svf_index[type]
             return filtered[i]
         y = process_each_channel(apply, sound.frames[start:end])
-        sound.paste(start, end, y)
+        sound.replace(start, end, y)
 
     def callback(parameters):
         freq = parameters['Frequency']
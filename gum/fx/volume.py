@@ -1,5 +1,6 @@
 from gum.controllers import effect
 from gum.views import EffectDialog
+from gum.lib import pcm
 
 volume_last = 100
 
@@ -8,8 +9,8 @@ def volume(sound, start, end):
     def process(volume):
         gain = volume / 100.
         x = sound.frames[start:end]
-        y = x * gain
-        sound.paste(start, end, y)
+        y = pcm.cast(x * gain, x.dtype)
+        sound.replace(start, end, y)
 
     def callback(parameters):
         global volume_last
@@ -1,12 +1,34 @@
+from gum.lib import pcm
 import numpy
 import samplerate
 
 
 def resample(frames, ratio):
+    """Resample frames, keeping their sample type.
+
+    Frames are returned unchanged when ratio is 1.
+
+    """
+    if ratio == 1:
+        return frames
     new = samplerate.resample(frames, ratio, 'sinc_best')
+    if frames.dtype.name in pcm.DTYPES:
+        return pcm.cast(new, frames.dtype)
     return numpy.array(new, dtype='float64')
 
 
+def add(a, b):
+    """Add two arrays of frames.
+
+    Integer samples are clipped instead of wrapping around.
+
+    """
+    dtype = numpy.result_type(a, b)
+    if dtype.name in pcm.DTYPES and dtype.kind == 'i':
+        return pcm.cast(numpy.add(a, b, dtype=numpy.int64), dtype)
+    return a + b
+
+
 def mix_channels(frames, gain_lists):
     """Mix channels into a possibly different number of channels.
 
@@ -32,7 +54,7 @@ def mix_channels(frames, gain_lists):
     if numchan == 1:
         channels = [frames]
     else:
-        channels = frames.transpose()
+        channels = numpy.asarray(frames).transpose()
 
     # apply gains
     out = []
@@ -50,7 +72,8 @@ def mix_channels(frames, gain_lists):
         out = numpy.array(out)
         out = out.transpose()
 
-    return out
+    # keep the sample type
+    return pcm.cast(out, frames.dtype)
 
 def mix_channels_auto(frames, n):
     """Convert the number of channels.
@@ -109,6 +132,23 @@ if __name__ == "__main__":
     frames = numpy.array([c0, c1]).transpose()
     out = mix_channels(frames, [[1, 0], [1, 0]])
     assert out.tolist() == [[1, 1], [2, 2], [3, 3], [4, 4]]
+    #
+    # frames of a sound
+    from gum.lib.piecetable import PieceTable
+    out = mix_channels(PieceTable(frames), [[0.5, 0.5]])
+    assert out.tolist() == [3, 4, 5, 6]
+
+    # test add()
+    a = numpy.array([30000, -30000], dtype='int16')
+    assert add(a, a).tolist() == [32767, -32768]
+    assert add(a, a).dtype == numpy.int16
+    assert add(numpy.array([1, 2]), numpy.array([0.5, 1])).tolist() == [1.5, 3]
+
+    # sample type is kept
+    frames = numpy.array([[1, 2], [-32768, -32767]], dtype='int16')
+    out = mix_channels(frames, [[0.5, 0.5]])
+    assert out.dtype == numpy.int16
+    assert out.tolist() == [2, -32768]
 
     # test mix_channels_auto()
     #
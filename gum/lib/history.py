@@ -1,3 +1,38 @@
+from gum.lib.piecetable import PieceTable
+import tempfile
+import numpy
+
+# Default number of bytes of frames a history keeps in memory.
+MAX_BYTES = 2 ** 28
+
+# Arrays smaller than this are never spilled.
+SPILL_MIN_BYTES = 2 ** 16
+
+# Directory of the spill files. None is the default temporary directory.
+SPILL_DIR = None
+
+
+def _buffers(arg):
+    "Return the arrays holding the frames of arg."
+    if isinstance(arg, PieceTable):
+        return [b for b, s, e in arg.pieces() if isinstance(b, numpy.ndarray)]
+    elif isinstance(arg, numpy.ndarray):
+        return [arg]
+    return []
+
+
+def _spill(buf):
+    "Return a copy of buf mapped from a temporary file."
+    f = tempfile.TemporaryFile(dir=SPILL_DIR)
+    try:
+        copy = numpy.memmap(f, dtype=buf.dtype, mode='w+', shape=buf.shape)
+    finally:
+        # The mapping keeps the file alive.
+        f.close()
+    copy[:] = buf
+    return copy
+
+
 class Action(object):
     """Describes an action, and a way to revert that action"""
      
@@ -7,6 +42,30 @@ class Action(object):
         self._do = do
         self._undo = undo
 
+    def buffers(self):
+        "Return the arrays holding the frames of the arguments."
+        return [b for arg in list(self._do[1]) + list(self._undo[1])
+                  for b in _buffers(arg)]
+
+    def spill(self, copies):
+        """Replace arrays of the arguments by their copies.
+
+        copies maps the id of an array to its copy.
+
+        """
+        def move(arg):
+            if isinstance(arg, PieceTable):
+                pieces = [(copies.get(id(b), b), s, e)
+                          for b, s, e in arg.pieces()]
+                if pieces:
+                    return PieceTable(pieces[0][0], pieces)
+            elif isinstance(arg, numpy.ndarray):
+                return copies.get(id(arg), arg)
+            return arg
+        (do, do_args), (undo, undo_args) = self._do, self._undo
+        self._do = do, [move(a) for a in do_args]
+        self._undo = undo, [move(a) for a in undo_args]
+
     def do(self):
         fun, args = self._do
         return fun(*args)
@@ -17,12 +76,29 @@ class Action(object):
 
 
 class History(object):
-    "A list of actions, that can be undone and redone."
+    """A list of actions, that can be undone and redone.
+
+    The arrays held by the actions are kept under max_bytes (MAX_BYTES
+    by default): the arrays of the oldest actions are spilled to
+    temporary files, or if spill is False, the oldest actions are
+    forgotten and cannot be undone anymore.
 
-    def __init__(self):
+    shared is a function returning the tables and arrays in use
+    outside of the history. Their frames are neither counted nor
+    spilled.
+
+    """
+    def __init__(self, max_bytes=None, spill=True, shared=None):
+        if max_bytes is None:
+            max_bytes = MAX_BYTES
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self._shared = shared
         self._actions = []
         self._last = -1
         self._counter = 0
+        # Revision of the oldest state that can be reached.
+        self._base = 0
 
     def _push(self, action):
         if self._last < len(self._actions) - 1:
@@ -32,7 +108,68 @@ class History(object):
         self._last = self._last + 1
         self._counter += 1
         action.number = self._counter
-        
+
+    def _held(self):
+        "Return the arrays held in memory by the history only, by id."
+        shared = set()
+        if self._shared is not None:
+            for arg in self._shared():
+                shared.update(id(b) for b in _buffers(arg))
+        held = {}
+        for action in self._actions:
+            for b in action.buffers():
+                if id(b) not in shared and not isinstance(b, numpy.memmap):
+                    held[id(b)] = b
+        return held
+
+    def _shrink(self):
+        "Keep the frames held in memory under max_bytes."
+        held = self._held()
+        total = sum(b.nbytes for b in held.values())
+        if self.spill:
+            # Spill the arrays of the oldest actions first.
+            copies = {}
+            for action in self._actions:
+                for b in action.buffers():
+                    if total <= self.max_bytes:
+                        break
+                    if (id(b) in held and id(b) not in copies and
+                        b.nbytes >= SPILL_MIN_BYTES):
+                        copies[id(b)] = _spill(b)
+                        total -= b.nbytes
+            if copies:
+                for action in self._actions:
+                    action.spill(copies)
+        else:
+            while total > self.max_bytes and self._last >= 0:
+                action = self._actions.pop(0)
+                self._base = action.number
+                self._last -= 1
+                total = self.nbytes()
+
+    def buffers(self):
+        "Return the arrays held by the actions."
+        return [b for action in self._actions for b in action.buffers()]
+
+    def nbytes(self):
+        "Number of bytes of frames held in memory by the history only."
+        return sum(b.nbytes for b in self._held().values())
+
+    def spilled_bytes(self):
+        "Number of bytes of frames spilled to temporary files."
+        spilled = {}
+        for action in self._actions:
+            for b in action.buffers():
+                if isinstance(b, numpy.memmap):
+                    spilled[id(b)] = b.nbytes
+        return sum(spilled.values())
+
+    def can_undo(self):
+        return self._last >= 0
+
+    def can_redo(self):
+        return self._last < len(self._actions) - 1
+
     def undo(self):
         if self._last < 0:
             return None
@@ -53,11 +190,13 @@ class History(object):
         "Does an action and adds it to history."
         action = Action(do, undo)
         self._push(action)
-        return action.do()
+        result = action.do()
+        self._shrink()
+        return result
 
     def revision(self):
         if self._last < 0:
-            return 0
+            return self._base
         else:
             action = self._actions[self._last]
             return action.number
@@ -123,5 +262,59 @@ if __name__ == '__main__':
         history.redo()
         assert history.revision() == 4
 
+    def testBudget():
+        frames = {}
+        def f(x, *rest):
+            frames['x'] = x
+        big = numpy.arange(SPILL_MIN_BYTES, dtype='float64')
+        size = big.nbytes
+
+        # Spill
+        history = History(max_bytes=3 * size)
+        for i in range(5):
+            x = big + i
+            history.add((f, [x]), (f, [x.copy()]))
+        assert history.nbytes() <= 3 * size
+        assert history.nbytes() + history.spilled_bytes() == 10 * size
+        assert history.can_undo()
+        for i in reversed(range(5)):
+            history.undo()
+            assert frames['x'].tolist() == (big + i).tolist()
+        assert not history.can_undo()
+        history.redo()
+        assert frames['x'].tolist() == big.tolist()
+        # Tables and small arrays are spilled too, if big enough.
+        history = History(max_bytes=0)
+        table = PieceTable(big).splice(10, 20, big[:5])
+        history.add((f, [table, big[:10]]), (f, [table]))
+        assert history.nbytes() == 15 * 8
+        history.undo()
+        assert frames['x'].tolist() == table.tolist()
+        assert isinstance(frames['x'], PieceTable)
+        assert history.spilled_bytes() == size
+        # Shared arrays are not counted
+        history = History(max_bytes=0, shared=lambda: [table])
+        history.add((f, [table]), (f, [big + 1]))
+        assert history.nbytes() == 0
+        assert history.spilled_bytes() == size
+
+        # Forget
+        history = History(max_bytes=3 * size, spill=False)
+        for i in range(5):
+            x = big + i
+            history.add((f, [x]), (f, [x.copy()]))
+        assert history.nbytes() <= 3 * size
+        assert history.spilled_bytes() == 0
+        assert history.revision() == 5
+        assert history.undo() is None
+        assert not history.can_undo()
+        assert history.undo() is None
+        # The oldest reachable state is not the original one.
+        assert history.revision() == 4
+        assert frames['x'].tolist() == (big + 4).tolist()
+        history.redo()
+        assert history.revision() == 5
+
     testAction()
     testHistory()
+    testBudget()
@@ -0,0 +1,103 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Sample types.
+
+A Sound stores its frames in one of DTYPES. Floating point samples
+are between -1 and 1, integer samples use the whole range of their
+type, like PCM files do.
+
+"""
+
+import numpy
+
+# Sample types a Sound can store its frames in.
+DTYPES = ['float64', 'float32', 'int32', 'int16']
+
+
+def fullscale(dtype):
+    """Return the value of a full scale sample of type dtype.
+
+    Types that are not sample types are considered as floating point.
+
+    """
+    dtype = numpy.dtype(dtype)
+    if dtype.kind == 'i' and dtype.name in DTYPES:
+        return float(2 ** (dtype.itemsize * 8 - 1))
+    else:
+        return 1.
+
+
+def cast(frames, dtype):
+    """Cast frames to the sample type dtype, without scaling.
+
+    Integers are rounded and clipped. Frames are returned unchanged if
+    dtype is not a sample type.
+
+    """
+    dtype = numpy.dtype(dtype)
+    if frames.dtype == dtype or dtype.name not in DTYPES:
+        return frames
+    frames = numpy.asarray(frames)
+    if dtype.kind == 'i':
+        info = numpy.iinfo(dtype)
+        if frames.dtype.kind == 'f':
+            frames = numpy.rint(frames)
+        frames = numpy.clip(frames, info.min, info.max)
+    return frames.astype(dtype)
+
+
+def convert(frames, dtype):
+    """Convert frames to the sample type dtype, scaling the values."""
+    dtype = numpy.dtype(dtype)
+    if frames.dtype == dtype:
+        return frames
+    frames = numpy.asarray(frames)
+    ratio = fullscale(dtype) / fullscale(frames.dtype)
+    if ratio != 1:
+        frames = frames * ratio
+    return cast(frames, dtype)
+
+
+def to_float(frames):
+    """Return floating point frames, between -1 and 1.
+
+    16-bit integers are converted to float32, which is exact; other
+    integers to float64.
+
+    """
+    if frames.dtype.kind == 'f':
+        return frames
+    elif frames.dtype.itemsize <= 2:
+        return convert(frames, 'float32')
+    else:
+        return convert(frames, 'float64')
+
+
+if __name__ == '__main__':
+    assert fullscale('int16') == 32768
+    assert fullscale('float32') == 1
+    assert fullscale('int64') == 1
+
+    x = numpy.array([-1, -0.5, 0, 0.5, 1])
+    assert convert(x, 'int16').tolist() == [-32768, -16384, 0, 16384, 32767]
+    assert convert(x, 'int16').dtype == numpy.int16
+    assert convert(x, 'float32').dtype == numpy.float32
+    assert convert(x, 'float64') is x
+    y = numpy.array([-32768, 16384], dtype='int16')
+    assert convert(y, 'float64').tolist() == [-1, 0.5]
+    assert convert(y, 'int32').tolist() == [-2 ** 31, 2 ** 30]
+    assert to_float(y).dtype == numpy.float32
+    assert to_float(y).tolist() == [-1, 0.5]
+    assert to_float(x) is x
+
+    # no scaling
+    assert cast(numpy.array([1.4, 40000.]), 'int16').tolist() == [1, 32767]
+    assert cast(y, 'float32').tolist() == [-32768, 16384]
+    assert cast(numpy.array([-70000, 70000]), 'int16').tolist() == \
+                                                           [-32768, 32767]
+    # not a sample type
+    z = numpy.array([0.5])
+    assert cast(z, 'int64') is z
+    assert convert(numpy.array([1, 2]), 'float64').tolist() == [1, 2]
@@ -0,0 +1,313 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Memory-mapped access to uncompressed PCM sound files.
+
+Opening a file only parses its header. Samples stay on disk and are
+decoded when a range of frames is sliced, so only the pages that are
+actually read get loaded in memory.
+
+"""
+
+from gum.lib import pcm
+import numpy
+import struct
+import os
+
+class NotMappable(Exception): pass
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xfffe
+
+
+def _chunks(f, start, end, byteorder):
+    """Iterate over (chunk_id, data_offset, size) of a RIFF/IFF file."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        chunk_id, size = struct.unpack(byteorder + '4sI', header)
+        yield chunk_id, pos + 8, size
+        # chunks are padded to an even size
+        pos = pos + 8 + size + (size & 1)
+
+
+def _parse_wav(f, filesize):
+    fmt = None
+    data = None
+    for chunk_id, offset, size in _chunks(f, 12, filesize, '<'):
+        if chunk_id == 'fmt ':
+            f.seek(offset)
+            fmt = f.read(size)
+        elif chunk_id == 'data':
+            data = offset, size
+            break
+    if fmt is None or data is None:
+        raise NotMappable("Missing 'fmt ' or 'data' chunk")
+    tag, numchan, _, _, blockalign, _ = struct.unpack('<HHIIHH', fmt[:16])
+    if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        tag, = struct.unpack('<H', fmt[24:26])
+    if tag == WAVE_FORMAT_PCM:
+        kind = 'i'
+    elif tag == WAVE_FORMAT_IEEE_FLOAT:
+        kind = 'f'
+    else:
+        raise NotMappable("Compressed WAV format: 0x%04x" % tag)
+    if numchan == 0 or blockalign % numchan:
+        raise NotMappable("Unsupported sample layout")
+    width = blockalign / numchan
+    if width == 1:
+        # 8-bit WAV samples are unsigned
+        kind = 'u'
+    return data, numchan, width, kind, '<'
+
+
+def _parse_aiff(f, filesize, aifc):
+    comm = None
+    data = None
+    for chunk_id, offset, size in _chunks(f, 12, filesize, '>'):
+        if chunk_id == 'COMM':
+            f.seek(offset)
+            comm = f.read(size)
+        elif chunk_id == 'SSND':
+            f.seek(offset)
+            ssnd_offset, _ = struct.unpack('>II', f.read(8))
+            data = offset + 8 + ssnd_offset, size - 8 - ssnd_offset
+    if comm is None or data is None:
+        raise NotMappable("Missing 'COMM' or 'SSND' chunk")
+    numchan, _, bits = struct.unpack('>hIh', comm[:8])
+    byteorder = '>'
+    kind = 'i'
+    if aifc:
+        compression = comm[18:22]
+        if compression == 'sowt':
+            byteorder = '<'
+        elif compression in ('fl32', 'FL32', 'fl64', 'FL64'):
+            kind = 'f'
+        elif compression != 'NONE':
+            raise NotMappable("Compressed AIFF format: %s" % compression)
+    if numchan <= 0:
+        raise NotMappable("Unsupported sample layout")
+    width = (bits + 7) / 8
+    return data, numchan, width, kind, byteorder
+
+
+def parse_header(filename):
+    """Return the layout of the sample data in a file.
+
+    Returns a tuple `(offset, nframes, numchan, width, kind, byteorder)`
+    where width is the number of bytes per sample and kind is 'i',
+    'u' or 'f' (signed integer, unsigned integer, floating point).
+    Raises NotMappable if the samples cannot be mapped.
+
+    """
+    filesize = os.path.getsize(filename)
+    f = open(filename, 'rb')
+    try:
+        header = f.read(12)
+        if len(header) < 12:
+            raise NotMappable("Not a sound file")
+        if header[:4] == 'RIFF' and header[8:12] == 'WAVE':
+            layout = _parse_wav(f, filesize)
+        elif header[:4] == 'FORM' and header[8:12] in ('AIFF', 'AIFC'):
+            layout = _parse_aiff(f, filesize, header[8:12] == 'AIFC')
+        else:
+            raise NotMappable("Only WAV and AIFF files can be mapped")
+    finally:
+        f.close()
+    (offset, size), numchan, width, kind, byteorder = layout
+    if width not in (1, 2, 3, 4, 8) or (kind == 'f' and width not in (4, 8)):
+        raise NotMappable("Unsupported sample width: %d bytes" % width)
+    # The data chunk may claim more bytes than the file actually has.
+    size = min(size, filesize - offset)
+    nframes = max(0, size) / (numchan * width)
+    return offset, nframes, numchan, width, kind, byteorder
+
+
+class PCMMap(object):
+    """A read-only array of frames mapped from a sound file.
+
+    Slicing returns a numpy array of type dtype, one of pcm.DTYPES,
+    scaled the same way libsndfile does. Only the sliced frames are
+    read from the file.
+
+    """
+    def __init__(self, filename, dtype='float64'):
+        layout = parse_header(filename)
+        offset, nframes, numchan, width, kind, byteorder = layout
+        self._numchan = numchan
+        self._width = width
+        self._kind = kind
+        self._byteorder = byteorder
+        if numchan == 1:
+            self.shape = (nframes,)
+        else:
+            self.shape = (nframes, numchan)
+        self.ndim = len(self.shape)
+        self.dtype = numpy.dtype(dtype)
+        if width == 3:
+            typecode = 'uint8'
+            shape = (nframes, numchan, 3)
+        else:
+            typecode = '%s%s%d' % (byteorder, kind, width)
+            shape = (nframes, numchan)
+        if nframes == 0:
+            # numpy cannot map an empty region
+            self._raw = numpy.zeros(shape, dtype=typecode)
+        else:
+            self._raw = numpy.memmap(filename, dtype=typecode, mode='r',
+                                     offset=offset, shape=shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def size(self):
+        return len(self) * self._numchan
+
+    def _decode(self, raw):
+        bits = self._width * 8
+        if self._kind == 'f':
+            y = pcm.convert(raw, self.dtype)
+        else:
+            if self._width == 3:
+                b = raw.astype(numpy.int32)
+                if self._byteorder == '<':
+                    x = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+                else:
+                    x = (b[..., 0] << 16) | (b[..., 1] << 8) | b[..., 2]
+                # sign extension
+                x = (x << 8) >> 8
+            elif self._kind == 'u':
+                x = raw.astype(numpy.int16) - 128
+            else:
+                x = raw
+            if self.dtype.kind == 'f':
+                scale = 1. / 2 ** (bits - 1)
+                y = numpy.multiply(x, scale, dtype=self.dtype)
+            else:
+                shift = self.dtype.itemsize * 8 - bits
+                if shift >= 0:
+                    y = x.astype(self.dtype) << shift
+                else:
+                    y = (x >> -shift).astype(self.dtype)
+        if self._numchan == 1:
+            y = y[:, 0]
+        return y
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            return self._decode(self._raw[start:max(start, stop)])
+        elif isinstance(key, (int, long, numpy.integer)):
+            if key < 0:
+                key += len(self)
+            return self._decode(self._raw[key:key + 1])[0]
+        else:
+            return numpy.asarray(self)[key]
+
+    def __array__(self, dtype=None):
+        a = self[:]
+        if dtype is not None:
+            a = a.astype(dtype)
+        return a
+
+    def tolist(self):
+        return self[:].tolist()
+
+    def transpose(self):
+        return self[:].transpose()
+
+
+# -- Tests
+
+def test_PCMMap():
+    import wave
+    import tempfile
+    filename = tempfile.mktemp(suffix='.wav')
+
+    def write(numchan, width, raw):
+        w = wave.open(filename, 'wb')
+        w.setnchannels(numchan)
+        w.setsampwidth(width)
+        w.setframerate(44100)
+        w.writeframes(raw)
+        w.close()
+
+    # mono 16 bits
+    samples = numpy.array([0, 16384, -16384, 32767, -32768], dtype='<i2')
+    write(1, 2, samples.tostring())
+    m = PCMMap(filename)
+    assert len(m) == 5
+    assert m.ndim == 1
+    assert m[:].tolist() == (samples / 32768.).tolist()
+    assert m[1:3].tolist() == [0.5, -0.5]
+    assert m[-1] == -1
+    assert m[10:20].tolist() == []
+
+    # stereo 16 bits
+    write(2, 2, samples[:4].tostring())
+    m = PCMMap(filename)
+    assert m.shape == (2, 2)
+    assert m[:].tolist() == [[0, 0.5], [-0.5, 32767 / 32768.]]
+    assert m.transpose().tolist() == [[0, -0.5], [0.5, 32767 / 32768.]]
+
+    # unsigned 8 bits
+    write(1, 1, numpy.array([128, 0, 192], dtype='uint8').tostring())
+    m = PCMMap(filename)
+    assert m[:].tolist() == [0, -1, 0.5]
+
+    # 24 bits
+    raw = '\x00\x00\x40' + '\x00\x00\xc0' + '\xff\xff\xff'
+    write(1, 3, raw)
+    m = PCMMap(filename)
+    assert m[:].tolist() == [0.5, -0.5, -1. / 2 ** 23]
+
+    # integer and float32 storage
+    m = PCMMap(filename, dtype='int16')
+    assert m[:].tolist() == [16384, -16384, -1]
+    assert m[:].dtype == numpy.int16
+    m = PCMMap(filename, dtype='int32')
+    assert m[:].tolist() == [2 ** 30, -2 ** 30, -256]
+    m = PCMMap(filename, dtype='float32')
+    assert m[:].dtype == numpy.float32
+    assert m[:2].tolist() == [0.5, -0.5]
+    write(1, 2, samples.tostring())
+    m = PCMMap(filename, dtype='int16')
+    assert m[:].tolist() == samples.tolist()
+    m = PCMMap(filename, dtype='int32')
+    assert m[1] == 16384 * 65536
+
+    # Empty file
+    for width in [2, 3]:
+        write(1, width, '')
+        m = PCMMap(filename)
+        assert len(m) == 0
+        assert m[:].tolist() == []
+
+    # Unsupported files
+    open(filename, 'wb').write('not a sound file')
+    try:
+        PCMMap(filename)
+    except NotMappable:
+        pass
+    else:
+        assert False
+
+    os.remove(filename)
+
+    # Files shipped with gum
+    import gum
+    m = PCMMap(gum.testdir + '/test2.wav')
+    assert m.ndim == 2
+    m = PCMMap(gum.testdir + '/test3.wav') # pcm24, wave extensible
+    assert m.ndim == 2
+    assert abs(m[:]).max() <= 1
+
+
+if __name__ == '__main__':
+    test_PCMMap()
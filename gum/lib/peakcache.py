@@ -0,0 +1,207 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Persistent cache of the peaks of sound files.
+
+Peaks are saved in CACHE_DIR, one file per sound file and tag. An
+entry is only valid for the file it was computed from: it is stamped
+with the size, modification time and a hash of the beginning and end
+of the file, and ignored when the file has changed. When the cache
+grows over MAX_BYTES, the least recently used entries are removed.
+Entries are saved and removed by one thread at a time.
+
+"""
+
+import numpy
+import hashlib
+import tempfile
+import threading
+import os
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', '~/.cache'),
+                         'gum', 'peaks')
+
+MAX_BYTES = 2 ** 28
+
+# Number of bytes hashed at the beginning and at the end of a file.
+HASH_BYTES = 2 ** 16
+
+# Taken to save or remove entries.
+_lock = threading.Lock()
+
+
+def _cachedir():
+    return os.path.expanduser(CACHE_DIR)
+
+
+def _entry(filename, tag):
+    "Path of the cache entry of filename."
+    name = hashlib.sha1(os.path.abspath(filename) + '\0' + tag).hexdigest()
+    return os.path.join(_cachedir(), name + '.npz')
+
+
+def stamp(filename):
+    "Return a string that changes when the file changes."
+    st = os.stat(filename)
+    h = hashlib.sha1()
+    f = open(filename, 'rb')
+    try:
+        h.update(f.read(HASH_BYTES))
+        f.seek(max(0, st.st_size - HASH_BYTES))
+        h.update(f.read(HASH_BYTES))
+    finally:
+        f.close()
+    return '%d:%r:%s' % (st.st_size, st.st_mtime, h.hexdigest())
+
+
+def load(filename, tag):
+    """Return the arrays saved for filename and tag, as a dict.
+
+    Returns None if there is no valid entry.
+
+    """
+    entry = _entry(filename, tag)
+    try:
+        f = open(entry, 'rb')
+    except IOError:
+        return None
+    try:
+        try:
+            npz = numpy.load(f)
+            arrays = dict((k, npz[k]) for k in npz.files)
+            if str(arrays.pop('_stamp')) != stamp(filename):
+                return None
+        except Exception:
+            # corrupted entry, or the sound file is gone
+            return None
+    finally:
+        f.close()
+    # mark as recently used
+    try:
+        os.utime(entry, None)
+    except OSError:
+        pass
+    return arrays
+
+
+def save(filename, tag, **arrays):
+    """Save arrays for filename and tag, and make room in the cache.
+
+    Errors are ignored: the cache is only an optimization.
+
+    """
+    _lock.acquire()
+    try:
+        try:
+            cachedir = _cachedir()
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            fd, path = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+            f = os.fdopen(fd, 'wb')
+            try:
+                numpy.savez(f, _stamp=numpy.array(stamp(filename)),
+                            **arrays)
+            finally:
+                f.close()
+            os.rename(path, _entry(filename, tag))
+            _evict(MAX_BYTES)
+        except (IOError, OSError):
+            pass
+    finally:
+        _lock.release()
+
+
+def evict(max_bytes=None):
+    "Remove the least recently used entries until the cache fits."
+    if max_bytes is None:
+        max_bytes = MAX_BYTES
+    _lock.acquire()
+    try:
+        _evict(max_bytes)
+    finally:
+        _lock.release()
+
+
+def _evict(max_bytes):
+    cachedir = _cachedir()
+    entries = []
+    for name in os.listdir(cachedir):
+        if name.endswith('.npz'):
+            path = os.path.join(cachedir, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    while total > max_bytes and entries:
+        _, size, path = entries.pop(0)
+        os.remove(path)
+        total -= size
+
+
+# -- Tests
+
+def test_peakcache():
+    import shutil
+    import time
+    global CACHE_DIR, MAX_BYTES
+    saved = CACHE_DIR, MAX_BYTES
+    CACHE_DIR = tempfile.mkdtemp()
+    try:
+        sndfile = os.path.join(CACHE_DIR, 'sound.wav')
+        open(sndfile, 'wb').write('RIFF' + '\0' * 1000)
+        assert load(sndfile, 'float64') is None
+
+        mins = numpy.array([[-1, -2], [-3, -4]], dtype='int16')
+        save(sndfile, 'int16', mins=mins, maxs=-mins)
+        arrays = load(sndfile, 'int16')
+        assert sorted(arrays) == ['maxs', 'mins']
+        assert arrays['mins'].tolist() == mins.tolist()
+        assert arrays['mins'].dtype == numpy.int16
+        assert load(sndfile, 'float64') is None
+
+        # the sound file changed
+        open(sndfile, 'wb').write('RIFF' + '\1' * 1000)
+        assert load(sndfile, 'int16') is None
+
+        # least recently used entries are evicted
+        other = os.path.join(CACHE_DIR, 'other.wav')
+        open(other, 'wb').write('RIFF')
+        save(sndfile, 'a', x=numpy.zeros(1000))
+        save(other, 'b', x=numpy.zeros(1000))
+        past = time.time() - 100
+        os.utime(_entry(other, 'b'), (past, past))
+        assert load(sndfile, 'a') is not None
+        size = os.path.getsize(_entry(sndfile, 'a'))
+        MAX_BYTES = 2 * size
+        save(sndfile, 'c', x=numpy.zeros(10))
+        assert load(other, 'b') is None
+        assert load(sndfile, 'a') is not None
+        assert not os.path.exists(_entry(other, 'b'))
+
+        # threads saving and evicting at once
+        errors = []
+        def churn(i):
+            try:
+                for j in range(20):
+                    save(sndfile, '%d-%d' % (i, j), x=numpy.zeros(100))
+                    evict()
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=churn, args=(i,))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+        assert sum(os.path.getsize(os.path.join(CACHE_DIR, name))
+                   for name in os.listdir(CACHE_DIR)
+                   if name.endswith('.npz')) <= MAX_BYTES
+    finally:
+        shutil.rmtree(CACHE_DIR)
+        CACHE_DIR, MAX_BYTES = saved
+
+
+if __name__ == '__main__':
+    test_peakcache()
@@ -0,0 +1,241 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+import numpy
+from bisect import bisect_right
+
+
+class PieceTable(object):
+    """An immutable array of frames made of pieces of other arrays.
+
+    A piece is a tuple `(buffer, start, end)` that stands for
+    `buffer[start:end]`. Buffers are shared between tables and must
+    never be modified once they are in a table.
+
+    splice() returns a new table that shares the buffers of the old
+    one, so editing costs O(number of pieces) instead of O(number of
+    frames). Slicing returns a numpy array: a view when the slice lies
+    in a single piece, a copy otherwise. Other numpy methods and
+    operators work on the flattened array.
+
+    """
+    # Make numpy call our reflected operators.
+    __array_priority__ = 10
+
+    def __init__(self, buf=None, pieces=None):
+        if isinstance(buf, PieceTable):
+            pieces = buf._pieces
+            buf = buf._template
+        elif buf is None:
+            buf = numpy.array([])
+        elif not hasattr(buf, 'shape'):
+            buf = numpy.asarray(buf)
+        if pieces is None:
+            pieces = [(buf, 0, len(buf))]
+        # An empty array gives ndim and dtype to empty tables.
+        self._template = buf[:0]
+        self._pieces = [p for p in pieces if p[2] > p[1]]
+        self._offsets = []
+        length = 0
+        for _, start, end in self._pieces:
+            self._offsets.append(length)
+            length += end - start
+        self._length = length
+        self.ndim = self._template.ndim
+        dtypes = [b.dtype for b, _, _ in self._pieces]
+        self.dtype = numpy.result_type(self._template.dtype, *dtypes)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def shape(self):
+        return (self._length,) + self._template.shape[1:]
+
+    @property
+    def size(self):
+        return int(numpy.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        "Number of bytes of the frames referenced by the table."
+        return sum((e - s) * b[:1].nbytes for b, s, e in self._pieces)
+
+    def _locate(self, frame):
+        "Index of the piece that contains frame."
+        return bisect_right(self._offsets, frame) - 1
+
+    def pieces(self, start=0, end=None):
+        "Return the list of pieces between start and end."
+        if end is None or end > self._length:
+            end = self._length
+        start = max(0, start)
+        if start >= end:
+            return []
+        res = []
+        i = max(0, self._locate(start))
+        while i < len(self._pieces) and self._offsets[i] < end:
+            buf, s, e = self._pieces[i]
+            offset = self._offsets[i]
+            a = s + max(0, start - offset)
+            b = s + min(e - s, end - offset)
+            res.append((buf, a, b))
+            i += 1
+        return res
+
+    def slice(self, start, end):
+        "Return a table of the frames between start and end, without copy."
+        return PieceTable(self._template, self.pieces(start, end))
+
+    def splice(self, start, end, frames):
+        """Return a new table where frames replace frames[start:end].
+
+        frames can be a PieceTable or an array.
+
+        """
+        if isinstance(frames, PieceTable):
+            middle = frames._pieces
+        else:
+            middle = [(frames, 0, len(frames))]
+        pieces = (self.pieces(0, start) + middle +
+                  self.pieces(end, self._length))
+        return PieceTable(self._template, pieces)
+
+    def chunks(self, start=0, end=None, size=None):
+        """Iterate over the frames between start and end.
+
+        Yields one array per piece, or arrays of at most size frames.
+
+        """
+        for buf, s, e in self.pieces(start, end):
+            step = size or (e - s)
+            for i in xrange(s, e, step):
+                yield buf[i:min(i + step, e)]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, end, _ = key.indices(self._length)
+            chunks = list(self.chunks(start, end))
+            if not chunks:
+                return self._template[:0]
+            elif len(chunks) == 1:
+                return chunks[0]
+            else:
+                return numpy.concatenate(chunks)
+        elif isinstance(key, (int, long, numpy.integer)):
+            if key < 0:
+                key += self._length
+            if not 0 <= key < self._length:
+                raise IndexError("index out of bounds")
+            i = self._locate(key)
+            buf, s, e = self._pieces[i]
+            return buf[s + key - self._offsets[i]]
+        else:
+            return numpy.asarray(self)[key]
+
+    def __array__(self, dtype=None):
+        a = self[:]
+        if dtype is not None:
+            a = a.astype(dtype)
+        return a
+
+    def tolist(self):
+        "Return the frames as a list. All the frames are copied."
+        return self[:].tolist()
+
+
+def _flattened(name):
+    def method(self, *args):
+        args = [numpy.asarray(a) if isinstance(a, PieceTable) else a
+                for a in args]
+        return getattr(self[:], name)(*args)
+    method.__name__ = name
+    return method
+
+for _name in ['__add__', '__radd__', '__sub__', '__rsub__', '__mul__',
+              '__rmul__', '__div__', '__rdiv__', '__truediv__',
+              '__rtruediv__', '__neg__', '__abs__']:
+    setattr(PieceTable, _name, _flattened(_name))
+
+
+# -- Tests
+
+def test_PieceTable():
+    a = numpy.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+    t = PieceTable(a)
+    assert len(t) == 10
+    assert t.ndim == 1
+    assert t.shape == (10,)
+    assert t.tolist() == range(10)
+    assert t[2:5].tolist() == [2, 3, 4]
+    assert t[3] == 3
+    assert t[-1] == 9
+
+    # cut
+    t2 = t.splice(2, 5, [])
+    assert t2.tolist() == [0, 1, 5, 6, 7, 8, 9]
+    assert t.tolist() == range(10)
+    assert len(t2.pieces()) == 2
+
+    # paste
+    t3 = t2.splice(1, 1, numpy.array([20, 30]))
+    assert t3.tolist() == [0, 20, 30, 1, 5, 6, 7, 8, 9]
+    assert t3[2:5].tolist() == [30, 1, 5]
+    assert t3[4] == 5
+    assert [c.tolist() for c in t3.chunks()] == [[0], [20, 30], [1],
+                                                 [5, 6, 7, 8, 9]]
+    assert [c.tolist() for c in t3.chunks(2, 7, size=2)] == [[30], [1],
+                                                             [5, 6], [7]]
+
+    # paste a table
+    t4 = t.splice(0, 0, t3.slice(1, 3))
+    assert t4.tolist() == [20, 30] + range(10)
+
+    # no copy when the slice lies in one piece
+    assert t4[5:8].base is a
+
+    # sample buffers are shared
+    assert t3.slice(1, 3).pieces()[0][0] is t3.pieces()[1][0]
+
+    # empty tables
+    e = t.splice(0, 10, [])
+    assert len(e) == 0
+    assert e.tolist() == []
+    assert e.ndim == 1
+    assert PieceTable().tolist() == []
+
+    # stereo
+    s = numpy.array([[1, 1], [2, 2], [3, 3]])
+    t = PieceTable(s).splice(1, 2, numpy.array([[5, 6]]))
+    assert t.shape == (3, 2)
+    assert t.ndim == 2
+    assert t.tolist() == [[1, 1], [5, 6], [3, 3]]
+    assert numpy.asarray(t).transpose().tolist() == [[1, 5, 3], [1, 6, 3]]
+    assert t.splice(0, 3, []).shape == (0, 2)
+
+    # upcasting
+    t = PieceTable(numpy.array([1, 2])).splice(1, 2, numpy.array([0.5]))
+    assert t.dtype == numpy.float64
+    assert t.tolist() == [1, 0.5]
+
+    # numpy
+    t = PieceTable(numpy.array([1., 2.])).splice(2, 2, numpy.array([-3.]))
+    assert numpy.asarray(t).tolist() == [1, 2, -3]
+    assert (t * 2).tolist() == [2, 4, -6]
+    assert (t - t).tolist() == [0, 0, 0]
+    assert (numpy.ones(3) + t).tolist() == [2, 3, -2]
+    assert abs(t).max() == 3
+    # other numpy methods would copy the whole table
+    try:
+        t.max()
+    except AttributeError:
+        pass
+    else:
+        assert False
+    assert t.nbytes == 3 * 8
+    assert list(t) == [1, 2, -3]
+
+
+if __name__ == '__main__':
+    test_PieceTable()
@@ -0,0 +1,173 @@
+# Gum sound editor (https://github.com/stackp/Gum)
+# Copyright 2009 (C) Pierre Duquesne <stackp@online.fr>
+# Licensed under the Revised BSD License.
+
+"""Ring buffer of frames, between one producer and one consumer thread.
+
+The producer only moves the write count and the consumer only moves
+the read count, each after copying the frames. No lock is taken: a
+thread never waits for the other one to release the buffer.
+
+Frames can be copied with write() and read(), or in place: the
+producer fills the view free_area() returns, then commit()s it, and
+the consumer uses the view buffered_area() returns, then release()s
+it.
+
+"""
+
+import numpy
+
+
+class RingBuffer(object):
+    """A ring buffer holding up to capacity frames of numchan samples."""
+
+    def __init__(self, capacity, numchan, dtype):
+        self.capacity = capacity
+        self.dtype = numpy.dtype(dtype)
+        self._frames = numpy.zeros((capacity, numchan), dtype=dtype)
+        # Frames written and read since the buffer was made: their
+        # difference is the number of frames buffered.
+        self._written = 0
+        self._read = 0
+
+    def fill(self):
+        "Return the number of frames that can be read."
+        return self._written - self._read
+
+    def space(self):
+        "Return the number of frames that can be written."
+        return self.capacity - (self._written - self._read)
+
+    def write(self, frames):
+        """Copy as many frames as there is space for.
+
+        Returns the number of frames copied. Only the producer calls
+        this method.
+
+        """
+        n = min(len(frames), self.space())
+        self._copy(frames[:n], self._written % self.capacity, True)
+        self._written += n
+        return n
+
+    def read(self, out):
+        """Copy as many frames as are buffered into out, up to its length.
+
+        Returns the number of frames copied. Only the consumer calls
+        this method.
+
+        """
+        n = min(len(out), self.fill())
+        self._copy(out[:n], self._read % self.capacity, False)
+        self._read += n
+        return n
+
+    def free_area(self, n):
+        """Return a view of at most n free frames, in one part.
+
+        Only the producer calls this method.
+
+        """
+        i = self._written % self.capacity
+        n = min(n, self.space(), self.capacity - i)
+        return self._frames[i:i + n]
+
+    def commit(self, n):
+        "Make the n frames written in the free area readable."
+        self._written += n
+
+    def buffered_area(self, n):
+        """Return a view of at most n buffered frames, in one part.
+
+        Only the consumer calls this method.
+
+        """
+        i = self._read % self.capacity
+        n = min(n, self.fill(), self.capacity - i)
+        return self._frames[i:i + n]
+
+    def release(self, n):
+        "Give back the n first frames of the buffered area for writing."
+        self._read += n
+
+    def clear(self):
+        "Drop the frames buffered. Only the consumer calls this method."
+        self._read = self._written
+
+    def total_written(self):
+        "Return the number of frames written since the buffer was made."
+        return self._written
+
+    def total_read(self):
+        "Return the number of frames read since the buffer was made."
+        return self._read
+
+    def drop_before(self, count):
+        """Drop the frames buffered that were written before the
+        count-th one. Only the consumer calls this method."""
+        self._read = max(self._read, min(count, self._written))
+
+    def _copy(self, frames, i, inward):
+        # The frames wrap around the end of the buffer in two parts.
+        n = min(len(frames), self.capacity - i)
+        parts = [(frames[:n], self._frames[i:i + n]),
+                 (frames[n:], self._frames[:len(frames) - n])]
+        for outside, inside in parts:
+            if inward:
+                inside[:] = outside
+            else:
+                outside[:] = inside
+
+
+def test_RingBuffer():
+    ring = RingBuffer(5, 2, 'float32')
+    assert (ring.fill(), ring.space()) == (0, 5)
+    x = numpy.arange(16, dtype='float32').reshape(8, 2)
+    assert ring.write(x[:3]) == 3
+    out = numpy.zeros((4, 2), dtype='float32')
+    assert ring.read(out[:2]) == 2
+    assert out[:2].tolist() == x[:2].tolist()
+    # wrapping around the end
+    assert ring.write(x[3:]) == 4
+    assert (ring.fill(), ring.space()) == (5, 0)
+    assert ring.write(x) == 0
+    assert ring.read(out) == 4
+    assert out.tolist() == x[2:6].tolist()
+    assert ring.read(out) == 1
+    assert out[:1].tolist() == x[6:7].tolist()
+    assert ring.read(out) == 0
+    # mono frames are duplicated by broadcasting
+    assert ring.write(numpy.array([7, 8], dtype='float32')[:, None]) == 2
+    assert ring.read(out) == 2
+    assert out[:2].tolist() == [[7, 7], [8, 8]]
+    ring.write(x)
+    ring.clear()
+    assert (ring.fill(), ring.space()) == (0, 5)
+
+    # in place, one part at a time
+    area = ring.free_area(10)
+    assert len(area) == 1
+    area[:] = 9
+    ring.commit(1)
+    area = ring.free_area(10)
+    assert len(area) == 4
+    area[:] = x[:4]
+    ring.commit(2)
+    assert ring.buffered_area(2).tolist() == [[9, 9]]
+    ring.release(1)
+    assert ring.buffered_area(5).tolist() == x[:2].tolist()
+    ring.release(2)
+    assert (ring.fill(), ring.space()) == (0, 5)
+
+    # dropping what was written before a count
+    ring.write(x[:4])
+    count = ring.total_written()
+    ring.write(x[4:5])
+    ring.drop_before(count)
+    assert ring.fill() == 1 and ring.total_read() == count
+    ring.drop_before(0)
+    assert ring.fill() == 1
+
+
+if __name__ == '__main__':
+    test_RingBuffer()
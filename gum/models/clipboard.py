@@ -1,4 +1,51 @@
+"""The clipboard, shared by all sounds."""
+
+from gum.lib.piecetable import PieceTable
 import numpy
 
 clip = numpy.array([])
 samplerate = 44100
+
+
+class Clip(PieceTable):
+    """Frames cut or copied from a sound.
+
+    A clip shares the buffers of the sound it comes from, and copies
+    them the first time it is modified. Tables sliced from a clip are
+    not affected by later changes to the clip.
+
+    """
+    _copy = None
+
+    def slice(self, start, end):
+        # The table may share our copy: copy again on next change.
+        self._copy = None
+        return PieceTable.slice(self, start, end)
+
+    def __setitem__(self, key, value):
+        if self._copy is None:
+            self._copy = numpy.array(self)
+            PieceTable.__init__(self, self._copy)
+        self._copy[key] = value
+
+
+def test_Clip():
+    x = numpy.arange(10)
+    table = PieceTable(x).splice(2, 4, numpy.array([7, 7]))
+    c = Clip(table)
+    assert c.pieces()[0][0] is x
+    c[0] = 5
+    assert c.tolist() == [5, 1, 7, 7, 4, 5, 6, 7, 8, 9]
+    assert table.tolist() == [0, 1, 7, 7, 4, 5, 6, 7, 8, 9]
+    assert x.tolist() == range(10)
+    frozen = c.slice(0, 3)
+    c[1:3] = 0
+    assert frozen.tolist() == [5, 1, 7]
+    assert c[:4].tolist() == [5, 0, 0, 7]
+    c = Clip(numpy.array([]))
+    c[:] = 1
+    assert len(c) == 0
+
+
+if __name__ == '__main__':
+    test_Clip()
@@ -3,6 +3,14 @@
 # Licensed under the Revised BSD License.
 
 from gum.lib.event import Signal
+from gum.lib import pcm, peakcache
+from gum.lib.piecetable import PieceTable
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import multiprocessing
+import numpy
+import threading
+import weakref
 try:
     from gum import fast
 except ImportError:
@@ -17,42 +25,499 @@ def frame2cell(frame, density):
 def cell2frame(cell, density):
     return cell * density
 
+# Maximum number of frames read at once to compute an overview.
+BLOCK_FRAMES = 2 ** 20
+
+# The peak pyramid summarizes frames by blocks of PEAK_BLOCK frames,
+# then of twice as many frames, and so on.
+PEAK_BLOCK = 2 ** 6
+
+# Cells of more than PEAK_BLOCK * PEAK_OVERSAMPLING frames are read
+# from the peak pyramid, using blocks of at most 1/PEAK_OVERSAMPLING
+# cell. Cell bounds are rounded to these blocks.
+PEAK_OVERSAMPLING = 16
+
+# Levels of the pyramid saved in the peak cache start at this one, to
+# keep cache files small. Lower levels are not restored.
+PEAK_CACHE_LEVEL = 4
+
+# Overviews of more than PARALLEL_FRAMES frames are split between
+# THREADS threads.
+PARALLEL_FRAMES = 2 ** 18
+THREADS = multiprocessing.cpu_count()
+
+# The overview cache keeps cells at MAX_OVERVIEWS densities, and at
+# most MAX_OVERVIEW_CELLS consecutive cells at each.
+MAX_OVERVIEWS = 8
+MAX_OVERVIEW_CELLS = 2 ** 15
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _thread_pool():
+    global _pool
+    _pool_lock.acquire()
+    try:
+        if _pool is None:
+            _pool = ThreadPool(THREADS)
+        return _pool
+    finally:
+        _pool_lock.release()
+
 def _overview(data, start, width, density):
-    numchan = data.ndim
-    if numchan == 1:
-        channels = [data]
+    """Returns the min, max and root mean square of each cell, for each
+    channel.
+
+    The result is a C-contiguous array of shape (channels, cells, 3),
+    with integer samples scaled between -1 and 1. There are less than
+    width cells at the end of data.
+
+    Frames are read by blocks of BLOCK_FRAMES, so that only the frames
+    of the visible cells are accessed, and not all at once. When cells
+    are large, peak pyramids are read instead of the frames.
+
+    """
+    if density >= PEAK_BLOCK * PEAK_OVERSAMPLING:
+        return _peak_overview(data, start, width, density)
+    start = int(start)
+    width = int(width)
+    numchan = 1 if data.ndim == 1 else data.shape[1]
+    out = numpy.empty((numchan, width, 3))
+    step = max(1, int(BLOCK_FRAMES / density))
+    parallel = HAVE_FAST and width * density > PARALLEL_FRAMES
+    if parallel:
+        step = min(step, -(-width // THREADS))
+
+    def condense_block(i):
+        n = min(step, start + width - i)
+        # Read one more frame on each side: cell bounds are rounded
+        # by _condense itself.
+        a = max(0, int(round(cell2frame(i, density))) - 1)
+        b = int(round(cell2frame(i + n, density))) + 1
+        k = i - start
+        return n, _condense_channels(data[a:b], i, n, density, a,
+                                     out[:, k:k + n])
+
+    blocks = range(start, start + width, step)
+    if parallel and len(blocks) > 1:
+        counts = _thread_pool().map(condense_block, blocks)
     else:
-        channels = data.transpose()
-    o = []
-    for chan in channels:
-        values = _condense(chan, start, width, density)
-        o.append(values)
-    return o
-
-def _condense(data, start, width, density):
+        counts = []
+        for i in blocks:
+            counts.append(condense_block(i))
+            if counts[-1][1] < counts[-1][0]:
+                break
+    ncells = 0
+    for n, filled in counts:
+        ncells += filled
+        if filled < n:
+            # end of data
+            break
+    out = numpy.ascontiguousarray(out[:, :ncells])
+    # integer samples are scaled between -1 and 1
+    scale = 1. / pcm.fullscale(data.dtype)
+    if scale != 1:
+        out *= scale
+    return out
+
+def _cells(start, width, density, offset, length):
+    """Returns the first frame of the visible cells, and the frame after.
+
+    Bounds are rounded like fast._condense does: the product is a
+    single precision float, rounded half away from zero.
+
+    """
+    start = int(start)
+    width = int(width)
+    cells = numpy.arange(start, start + width + 1).astype(numpy.float32)
+    x = (cells * numpy.float32(density)).astype(numpy.float64)
+    bounds = (numpy.sign(x) * numpy.floor(abs(x) + 0.5)).astype(numpy.int64)
+    bounds -= offset
+    first = numpy.maximum(bounds[:-1], 0)
+    n = int(numpy.sum(first < length))
+    first = first[:n]
+    if n == 0:
+        return first, 0
+    # A cell of less than one frame holds the frame it starts on.
+    end = max(min(bounds[n], length), first[-1] + 1)
+    return first, end
+
+def _condense_channels(data, start, width, density, offset, out):
+    """Fill out[c] with the (min, max, rms) of the cells of channel c.
+
+    Returns the number of cells filled. Each reduction runs once over
+    the whole block of a channel, yet this is still 4x to 12x slower
+    than fast.condense, depending on the density (bench/fallback.py).
+
+    """
+    first, end = _cells(start, width, density, offset, len(data))
+    n = len(first)
+    if n:
+        if data.ndim == 1:
+            data = data.reshape((len(data), 1))
+        d = data[first[0]:end]
+        first = first - first[0]
+        # A cell of less than one frame holds the frame it starts on.
+        counts = numpy.maximum(numpy.diff(numpy.append(first, len(d))), 1)
+        for c in range(d.shape[1]):
+            # One contiguous copy per channel: reduceat is several
+            # times faster along it than across the interleaved frames.
+            x = d[:, c].astype(numpy.float64)
+            out[c, :n, 0] = numpy.minimum.reduceat(x, first)
+            out[c, :n, 1] = numpy.maximum.reduceat(x, first)
+            numpy.square(x, out=x)
+            out[c, :n, 2] = numpy.add.reduceat(x, first)
+        out[:, :n, 2] = numpy.sqrt(out[:, :n, 2] / counts)
+    return n
+
+def _condense(data, start, width, density, offset=0):
     """Returns a list of (min, max) tuples.
 
     A density slices the data in "cells", each cell containing several
     frames. This function returns the min and max of each visible cell.
 
+    data[0] is frame number offset.
+
     """
-    res = []
-    start = int(start)
-    width = int(width)
-    for i in range(start, start + width):
-        a = int(round(cell2frame(i, density)))
-        b = int(round(cell2frame(i + 1, density)))
-        d = data[a:b]
-        if len(d) == 0:
-            break
-        mini = d.min()
-        maxi = d.max()
-        res.append((mini, maxi))
-    return res
+    first, end = _cells(start, width, density, offset, len(data))
+    if not len(first):
+        return []
+    d = data[first[0]:end]
+    first = first - first[0]
+    mins = numpy.minimum.reduceat(d, first).astype(numpy.float64)
+    maxs = numpy.maximum.reduceat(d, first).astype(numpy.float64)
+    return zip(mins.tolist(), maxs.tolist())
+
+# The fallbacks, for the tests to compare with the fast module.
+_numpy_condense = _condense
+_numpy_condense_channels = _condense_channels
 
 if HAVE_FAST:
     _condense = fast._condense
 
+    def _condense_channels(data, start, width, density, offset, out):
+        # All channels at once, and without the GIL.
+        if data.ndim == 1:
+            data = data.reshape((len(data), 1))
+        data = numpy.ascontiguousarray(data)
+        return fast.condense(data, start, width, density, offset, out)
+
+
+class PeakPyramid(object):
+    """Min, max and sum of squares of the frames of a buffer, by blocks
+    of frames.
+
+    levels[k] is a tuple of three arrays of shape (number of blocks,
+    number of channels) holding the min, max and sum of squares of each
+    block of PEAK_BLOCK * 2 ** k frames. Mins and maxs are in the
+    sample type of the buffer, sums of squares are float64. Frames
+    after the last full block are not summarized.
+
+    Only the first `length` frames of the buffer are summarized, the
+    blocks after them are left uninitialized. extend() summarizes more
+    frames, for buffers that are filled while the sound is loading.
+
+    The pyramid can also be built from the blocks of one level, as
+    (mins, maxs, sumsqs) arrays, and the length of the buffer they
+    summarize.
+    The levels below it are then None.
+
+    """
+    def __init__(self, buf=None, blocks=None, level=0, length=None):
+        if blocks is None:
+            numchan = 1 if buf.ndim == 1 else buf.shape[1]
+            n = len(buf) // PEAK_BLOCK
+            mins = numpy.empty((n, numchan), dtype=buf.dtype)
+            maxs = numpy.empty((n, numchan), dtype=buf.dtype)
+            sumsqs = numpy.empty((n, numchan))
+        else:
+            mins, maxs, sumsqs = blocks
+        self.numchan = mins.shape[1]
+        self.length = 0
+        self.levels = [None] * level + [(mins, maxs, sumsqs)]
+        while len(mins) > 1:
+            if blocks is None:
+                shape = (len(mins) // 2, self.numchan)
+                mins = numpy.empty(shape, dtype=mins.dtype)
+                maxs = numpy.empty(shape, dtype=maxs.dtype)
+                sumsqs = numpy.empty(shape)
+            else:
+                m = len(mins) // 2 * 2
+                mins = numpy.minimum(mins[0:m:2], mins[1:m:2])
+                maxs = numpy.maximum(maxs[0:m:2], maxs[1:m:2])
+                sumsqs = sumsqs[0:m:2] + sumsqs[1:m:2]
+            self.levels.append((mins, maxs, sumsqs))
+        if blocks is not None:
+            self.length = length
+        else:
+            self.extend(buf, len(buf) if length is None else length)
+
+    def extend(self, buf, length):
+        "Summarize the first length frames of buf."
+        start = self.length // PEAK_BLOCK
+        end = length // PEAK_BLOCK
+        if end <= start:
+            return
+        mins, maxs, sumsqs = self.levels[0]
+        step = BLOCK_FRAMES // PEAK_BLOCK
+        for i in xrange(start, end, step):
+            j = min(i + step, end)
+            x = buf[i * PEAK_BLOCK:j * PEAK_BLOCK]
+            x = x.reshape(j - i, PEAK_BLOCK, self.numchan)
+            mins[i:j] = x.min(axis=1)
+            maxs[i:j] = x.max(axis=1)
+            sumsqs[i:j] = numpy.square(x, dtype=numpy.float64).sum(axis=1)
+        for k in range(1, len(self.levels)):
+            start >>= 1
+            end >>= 1
+            if end <= start:
+                break
+            lmins, lmaxs, lsumsqs = self.levels[k - 1]
+            mins, maxs, sumsqs = self.levels[k]
+            mins[start:end] = numpy.minimum(lmins[2 * start:2 * end:2],
+                                            lmins[2 * start + 1:2 * end:2])
+            maxs[start:end] = numpy.maximum(lmaxs[2 * start:2 * end:2],
+                                            lmaxs[2 * start + 1:2 * end:2])
+            sumsqs[start:end] = (lsumsqs[2 * start:2 * end:2] +
+                                 lsumsqs[2 * start + 1:2 * end:2])
+        self.length = length
+
+    def peak(self, buf, start, end):
+        """Return the min, max and sum of squares of buf[start:end], one
+        per channel.
+
+        buf must be the buffer the pyramid was computed from. The frames
+        that are not in a full block of the lowest level are read from
+        buf.
+
+        """
+        lowest = 0
+        while self.levels[lowest] is None:
+            lowest += 1
+        size = PEAK_BLOCK * 2 ** lowest
+        l = -(-start // size)
+        r = end // size
+        if l >= r:
+            parts = [buf[start:end]]
+        else:
+            parts = [buf[start:l * size], buf[r * size:end]]
+        parts = [p.reshape(len(p), self.numchan) for p in parts if len(p)]
+        mins = [p.min(axis=0) for p in parts]
+        maxs = [p.max(axis=0) for p in parts]
+        sumsqs = [numpy.square(p, dtype=numpy.float64).sum(axis=0)
+                  for p in parts]
+        # Bottom-up range query, one level at a time.
+        for lmins, lmaxs, lsumsqs in self.levels[lowest:]:
+            if l >= r:
+                break
+            if l & 1:
+                mins.append(lmins[l])
+                maxs.append(lmaxs[l])
+                sumsqs.append(lsumsqs[l])
+                l += 1
+            if r & 1:
+                r -= 1
+                mins.append(lmins[r])
+                maxs.append(lmaxs[r])
+                sumsqs.append(lsumsqs[r])
+            l >>= 1
+            r >>= 1
+        return (numpy.min(mins, axis=0), numpy.max(maxs, axis=0),
+                numpy.sum(sumsqs, axis=0))
+
+
+# _PyramidEntry of each buffer, and sound file each buffer was read
+# from, by buffer id. Entries are removed when their buffer is garbage
+# collected. The lock is only held to look up and register entries.
+_pyramids = {}
+_peak_files = {}
+_pyramids_lock = threading.Lock()
+
+
+class _PyramidEntry(object):
+    """The pyramid of a buffer, made and extended under its own lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pyramid = None
+        self.saved = False
+
+
+def _register(table, buf, value):
+    key = id(buf)
+    def remove(ref):
+        table.pop(key, None)
+    table[key] = (weakref.ref(buf, remove), value)
+
+def _peak_tag(buf):
+    "Tag of the peak cache entries of buf."
+    numchan = 1 if buf.ndim == 1 else buf.shape[1]
+    return '%s-%d-%d-%d' % (buf.dtype.name, numchan, PEAK_BLOCK,
+                            PEAK_CACHE_LEVEL)
+
+def _load_pyramid(buf, filename):
+    "Return the pyramid of buf saved in the peak cache, or None."
+    arrays = peakcache.load(filename, _peak_tag(buf))
+    # Entries without sums of squares are ignored.
+    if arrays is None or 'sumsqs' not in arrays:
+        return None
+    blocks = arrays['mins'], arrays['maxs'], arrays['sumsqs']
+    return PeakPyramid(blocks=blocks, level=PEAK_CACHE_LEVEL,
+                       length=len(buf))
+
+def peak_pyramid(buf, end=None):
+    """Return the PeakPyramid of buf, summarizing at least buf[:end].
+
+    The pyramid is computed the first time, and extended when more
+    frames are needed. If buf holds a sound file, its pyramid is read
+    from the peak cache when possible, and saved in it once complete.
+
+    Only the pyramid of buf is locked while this is done, and frames
+    are summarized BLOCK_FRAMES at a time: a thread asking for frames
+    already summarized waits for one block at most.
+
+    """
+    key = id(buf)
+    if end is None:
+        end = len(buf)
+    _pyramids_lock.acquire()
+    try:
+        filename = _peak_files.get(key, (None, None))[1]
+        if key not in _pyramids:
+            _register(_pyramids, buf, _PyramidEntry())
+        entry = _pyramids[key][1]
+    finally:
+        _pyramids_lock.release()
+    entry.lock.acquire()
+    try:
+        if entry.pyramid is None:
+            if filename is not None:
+                entry.pyramid = _load_pyramid(buf, filename)
+                entry.saved = entry.pyramid is not None
+            if entry.pyramid is None:
+                entry.pyramid = PeakPyramid(buf, length=0)
+    finally:
+        entry.lock.release()
+    pyramid = entry.pyramid
+    target = end // PEAK_BLOCK * PEAK_BLOCK
+    while pyramid.length < target:
+        entry.lock.acquire()
+        try:
+            if pyramid.length < target:
+                pyramid.extend(buf, min(end, pyramid.length + BLOCK_FRAMES))
+        finally:
+            entry.lock.release()
+    if (filename is not None and end == len(buf) and not entry.saved and
+        len(pyramid.levels) > PEAK_CACHE_LEVEL):
+        entry.lock.acquire()
+        try:
+            save = not entry.saved
+            entry.saved = True
+        finally:
+            entry.lock.release()
+        if save:
+            mins, maxs, sumsqs = pyramid.levels[PEAK_CACHE_LEVEL]
+            peakcache.save(filename, _peak_tag(buf), mins=mins, maxs=maxs,
+                           sumsqs=sumsqs)
+    return pyramid
+
+def set_peak_file(buf, filename, complete=True):
+    """Tell that buf holds all the frames of a sound file.
+
+    The pyramid of buf is read from the peak cache in a background
+    thread. If buf is complete and the cache has no valid entry, the
+    pyramid is computed and saved by the thread. Otherwise, it is saved
+    once the frames have been loaded and summarized. Returns the thread.
+
+    """
+    _register(_peak_files, buf, filename)
+    end = len(buf) if complete else 0
+    t = threading.Thread(target=peak_pyramid, args=(buf, end))
+    t.daemon = True
+    t.start()
+    return t
+
+def _pieces(data, start, end):
+    "Return the (buffer, start, end) pieces of data[start:end]."
+    if isinstance(data, PieceTable):
+        return data.pieces(start, end)
+    elif start < end:
+        return [(data, start, end)]
+    else:
+        return []
+
+def _peak_overview(data, start, width, density):
+    """Same as _overview, reading the peak pyramids of the buffers.
+
+    Cells that lie inside a piece of data are read from the level
+    whose blocks are at most 1/PEAK_OVERSAMPLING cell, in O(number of
+    cells). The cells at both ends of a piece are computed exactly.
+
+    """
+    start = int(start)
+    width = int(width)
+    n = len(data)
+    numchan = 1 if data.ndim == 1 else data.shape[1]
+    cells = numpy.arange(start, start + width + 1)
+    bounds = numpy.floor(cells * float(density) + 0.5).astype(numpy.int64)
+    bounds = numpy.minimum(bounds, n)
+    ncells = int(numpy.sum(bounds[:-1] < n))
+    bounds = bounds[:ncells + 1]
+    level = 0
+    while PEAK_BLOCK * 2 ** (level + 1) * PEAK_OVERSAMPLING <= density:
+        level += 1
+    size = PEAK_BLOCK * 2 ** level
+    mins = numpy.empty((ncells, numchan))
+    maxs = numpy.empty((ncells, numchan))
+    mins.fill(numpy.inf)
+    maxs.fill(-numpy.inf)
+    # sums of squares, and the number of frames they add up
+    sumsqs = numpy.zeros((ncells, numchan))
+    counts = numpy.zeros(ncells)
+    offset = bounds[0] if ncells else 0
+    for buf, s, e in _pieces(data, offset, bounds[-1]):
+        pyramid = peak_pyramid(buf, e)
+        end = offset + e - s
+        i = max(0, numpy.searchsorted(bounds, offset, 'right') - 1)
+        j = min(ncells, numpy.searchsorted(bounds, end, 'left'))
+        # bounds of the cells, in buffer frames
+        a = numpy.maximum(bounds[i:j], offset) - offset + s
+        b = numpy.minimum(bounds[i + 1:j + 1], end) - offset + s
+        # bounds rounded to blocks
+        ba = (a + size // 2) // size
+        bb = (b + size // 2) // size
+        inside = (ba * size >= s) & (bb * size <= e) & (ba < bb)
+        if level >= len(pyramid.levels) or pyramid.levels[level] is None:
+            # buffer too short, or level not restored from the peak cache
+            inside[:] = False
+        if inside.any():
+            lmins, lmaxs, lsumsqs = pyramid.levels[level]
+            k = numpy.flatnonzero(inside)
+            first, last = ba[k[0]], bb[k[-1]]
+            indices = ba[k] - first
+            cmins = numpy.minimum.reduceat(lmins[first:last], indices)
+            cmaxs = numpy.maximum.reduceat(lmaxs[first:last], indices)
+            csumsqs = numpy.add.reduceat(lsumsqs[first:last], indices)
+            mins[i + k] = numpy.minimum(mins[i + k], cmins)
+            maxs[i + k] = numpy.maximum(maxs[i + k], cmaxs)
+            sumsqs[i + k] += csumsqs
+            counts[i + k] += (bb[k] - ba[k]) * size
+        for k in numpy.flatnonzero(~inside):
+            cmin, cmax, csumsq = pyramid.peak(buf, a[k], b[k])
+            mins[i + k] = numpy.minimum(mins[i + k], cmin)
+            maxs[i + k] = numpy.maximum(maxs[i + k], cmax)
+            sumsqs[i + k] += csumsq
+            counts[i + k] += b[k] - a[k]
+        offset = end
+    out = numpy.empty((numchan, ncells, 3))
+    out[:, :, 0] = mins.T
+    out[:, :, 1] = maxs.T
+    out[:, :, 2] = numpy.sqrt(sumsqs / counts[:, None]).T
+    scale = 1. / pcm.fullscale(data.dtype)
+    if scale != 1:
+        out *= scale
+    return out
+
 
 def intersection((a, b), (x, y)):
     if b <= x or a >= y:
@@ -63,46 +528,156 @@ def intersection((a, b), (x, y)):
         return start, end
 
 class OverviewCache(object):
+    """Overviews of the data at several densities.
+
+    At each of the last MAX_OVERVIEWS densities used, a run of
+    consecutive cells is kept. It grows when cells next to it are asked
+    for, up to MAX_OVERVIEW_CELLS cells. The density used the longest
+    time ago is dropped first.
+
+    hits counts the calls to get() answered from the cache alone, and
+    misses the calls that computed cells.
+
+    """
+
+    # update() may be called by the thread loading the sound while the
+    # view calls get().
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
     def set_data(self, data):
-        self._data = data
-        # _cache is a tuple (start_index, width, density, values)
-        self._cache = None, None, None, None
+        self._lock.acquire()
+        try:
+            self._data = data
+            # density: [start cell, end cell, values]. The values have
+            # less cells than asked for at the end of the data.
+            self._entries = OrderedDict()
+            # (start, width, density, values) of the last get()
+            self._last = None
+        finally:
+            self._lock.release()
 
     def get(self, start, width, density):
-        start = int(start)
-        done = False
-        c_start, c_width, c_density, _ = self._cache
-
-        # Same as last call
-        if (c_start, c_width, c_density) == (start, width, density):
-            done = True
-
-        # There is an intersection
-        if not done and c_density == density:
-            inter = intersection((start, start + width),
-                                 (c_start, c_start + c_width))
-            if inter != None:
-                head, tail = [], []
-                a, b = inter
-                if start < a:
-                    head = _overview(self._data, start, a - start, density)
-                if b < start + width:
-                    tail = _overview(self._data, b, start + width - b, density)
-                i, j = [int(x - c_start) for x in inter]
-                body = zip(*self._cache[3])[i:j]
-                ov = zip(*head) + body + zip(*tail)
-                ov = zip(*ov)
-                ov = [list(t) for t in ov]
-                self._cache = (start, width, density, ov)
-                done = True
-
-        # Compute entirely
-        if not done:
-            ov = _overview(self._data, start, width, density)
-            self._cache = (start, width, density, ov)
-
-        return self._cache[3]
+        self._lock.acquire()
+        try:
+            start = int(start)
+            width = int(width)
+            last = self._last
+            if last is not None and last[:3] == (start, width, density):
+                self.hits += 1
+                return last[3]
+            ov, hit = self._get(start, width, density)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._last = start, width, density, ov
+            return ov
+        finally:
+            self._lock.release()
+
+    def prefetch(self, start, width, density):
+        """Compute the cells of a window that may be asked for soon."""
+        self._lock.acquire()
+        try:
+            self._get(int(start), int(width), density)
+        finally:
+            self._lock.release()
+
+    def _get(self, start, width, density):
+        """Return the values of the window, and True if no cell had to
+        be computed."""
+        end = start + width
+        entry = self._entries.pop(density, None)
+        hit = False
+        if entry is not None and entry[0] <= start and end <= entry[1]:
+            hit = True
+        elif entry is not None and start <= entry[1] and entry[0] <= end:
+            # Extend the cached cells.
+            c_start, c_end, values = entry
+            parts = [values]
+            if start < c_start:
+                head = _overview(self._data, start, c_start - start, density)
+                parts.insert(0, head)
+            if c_end < end:
+                tail = _overview(self._data, c_end, end - c_end, density)
+                parts.append(tail)
+            entry = [min(start, c_start), max(end, c_end),
+                     numpy.concatenate(parts, axis=1)]
+            self._trim(entry, start, end)
+        else:
+            entry = [start, end, _overview(self._data, start, width, density)]
+        self._entries[density] = entry
+        while len(self._entries) > MAX_OVERVIEWS:
+            self._entries.popitem(last=False)
+        c_start = entry[0]
+        return entry[2][:, start - c_start:end - c_start], hit
+
+    def _trim(self, entry, start, end):
+        """Keep at most MAX_OVERVIEW_CELLS cells around the window."""
+        c_start, c_end, values = entry
+        if c_end - c_start > MAX_OVERVIEW_CELLS:
+            margin = max(0, (MAX_OVERVIEW_CELLS - (end - start)) // 2)
+            a = max(c_start, start - margin)
+            b = min(c_end, end + margin)
+            entry[:] = [a, b, values[:, a - c_start:b - c_start].copy()]
+
+    def update(self, data, start, end, delta):
+        """Set new data, where frames start to end have changed.
+
+        The frames after end moved by delta. Only the cached cells of
+        the changed frames are computed again. The cells after them
+        are kept if they moved by a whole number of cells.
+
+        """
+        self._lock.acquire()
+        try:
+            self._data = data
+            self._last = None
+            for density, entry in self._entries.items():
+                entry[2] = self._update(data, entry, density, start, end,
+                                        delta)
+        finally:
+            self._lock.release()
+
+    def _update(self, data, entry, density, start, end, delta):
+        c_start, c_end, old = entry
+        # One cell of margin on each side, for rounding.
+        first = int(frame2cell(start, density)) - 1
+        last = int(frame2cell(end + delta, density)) + 2
+        shift = frame2cell(delta, density)
+        if shift != int(shift):
+            last = c_end
+        # Where each cell is in the old values, or -1 if it changed.
+        cells = numpy.arange(c_start, c_end)
+        src = numpy.where(cells < first, cells, cells - int(shift)) - c_start
+        src[(cells >= first) & (cells < last)] = -1
+        src[src >= old.shape[1]] = -1
+        # Runs of missing cells, and of consecutive old cells.
+        missing = src < 0
+        runs = numpy.flatnonzero((missing[1:] != missing[:-1]) |
+                                 (~missing[1:] & (src[1:] != src[:-1] + 1)))
+        bounds = [0] + (runs + 1).tolist() + [len(cells)]
+        parts = []
+        for i, j in zip(bounds[:-1], bounds[1:]):
+            if i == j:
+                continue
+            if missing[i]:
+                ov = _overview(data, cells[i], j - i, density)
+                parts.append(ov)
+                if ov.shape[1] < j - i:
+                    # end of data
+                    break
+            else:
+                parts.append(old[:, src[i]:src[i] + j - i])
+        numchan = 1 if data.ndim == 1 else data.shape[1]
+        if parts:
+            return numpy.concatenate(parts, axis=1)
+        else:
+            return numpy.empty((numchan, 0, 3))
 
 
 class Graph(object):
@@ -130,14 +705,32 @@ class Graph(object):
     density = property(get_density, set_density)
 
     def set_sound(self, sound):
+        old = getattr(self, '_sound', None)
+        if old is not None and old is not sound:
+            old.changed.disconnect(self.on_sound_changed)
         self._sound = sound
         self._view_start = 0 # is a cell
-        self.density = self.numframes() / float(self._width)
+        self._overview.set_data(sound.frames)
         self._sound.changed.connect(self.on_sound_changed)
+        self.density = self.numframes() / float(self._width)
+        if hasattr(sound, 'file_frames'):
+            buf = sound.file_frames()
+            if buf is not None:
+                set_peak_file(buf, sound.filename, not sound.is_loading())
         self.on_sound_changed()
 
-    def on_sound_changed(self):
-        self._overview.set_data(self._sound.frames)
+    def on_sound_changed(self, start=None, end=None, delta=0):
+        if start is None:
+            self._overview.set_data(self._sound.frames)
+        else:
+            self._overview.update(self._sound.frames, start, end, delta)
+            n = self.numframes()
+            appended = delta > 0 and start == end == n - delta
+            if appended and self._view_start == 0 and \
+                   cell2frame(self._width, self.density) >= start:
+                # The whole sound was visible: keep it so, e.g. while
+                # the sound is loading.
+                self.density = n / float(self._width)
         self.update()
 
     def set_width(self, width):
@@ -176,6 +769,10 @@ class Graph(object):
     def center_on(self, frame):
         self.move_to(frame - (self._width - 1) * self.density * 0.5)
 
+    def first_cell(self):
+        "Return the index of the cell shown in the first column."
+        return int(self._view_start)
+
     def frmtopxl(self, f):
         "Converts a frame index to a pixel index."
         return int(frame2cell(f, self.density) - self._view_start)
@@ -268,8 +865,55 @@ class Graph(object):
 
     def channels(self):
         "Return the graph values."
-        o = self._overview.get(self._view_start, self._width, self.density)
-        return o
+        return self.cells(self._view_start, self._width, self.density)
+
+    def cells(self, start, width, density):
+        """Return the values of width cells from cell start, at density.
+
+        May be called from another thread than the one changing the view.
+
+        """
+        return self._overview.get(start, width, density)
+
+    def prefetch(self, start, width, density):
+        """Compute the values of cells that may be shown soon.
+
+        May be called from another thread than the one changing the view.
+
+        """
+        self._overview.prefetch(start, width, density)
+
+    def nearby(self, start, width, density):
+        """Return the (start, width, density) windows likely to be shown
+        after the window of width cells from start.
+
+        They are the pages on its left and right, and the cells any
+        zoom in or out on one of its pixels with the mouse wheel would
+        show.
+
+        """
+        windows = []
+        if start > 0:
+            left = max(0, start - width)
+            windows.append((left, start - left, density))
+        windows.append((start + width, width, density))
+        first = cell2frame(start, density)
+        maxi = max(1, self.numframes() / float(width))
+        for factor in [0.8, 1.2]:
+            d = self._gauge(density * factor, 1, maxi)
+            if d == density:
+                continue
+            # Frames a zoom on any pixel of the window shows, with one
+            # cell of margin for rounding.
+            a = int(frame2cell(first - width * max(d - density, 0), d)) - 1
+            b = int(frame2cell(first + width * max(d, density), d)) + 2
+            a = max(0, a)
+            windows.append((a, b - a, d))
+        return windows
+
+    def cache_stats(self):
+        """Return the hits and misses of the overview cache."""
+        return self._overview.hits, self._overview.misses
 
     def _adjust_view(self):
         numcells = frame2cell(self.numframes(), self.density)
@@ -289,6 +933,222 @@ def test_overview():
     assert len(_condense(b, 0, l, l/10)) == 10
     assert len(_condense(b, 0, l, l/100)) == 100
 
+def test_condense_channels():
+    import numpy
+    global PARALLEL_FRAMES
+    for numchan in [1, 2, 4, 8]:
+        for dtype in ['float64', 'float32', 'int16']:
+            x = numpy.random.uniform(-1, 1, (10000, numchan))
+            x = pcm.convert(x, dtype)
+            if numchan == 1:
+                x = x[:, 0]
+            out = numpy.empty((numchan, 300, 3))
+            n = _condense_channels(x[50:], 7, 300, 33.3, 50, out)
+            assert n == 294
+            channels = [x] if numchan == 1 else x.transpose()
+            for c, chan in enumerate(channels):
+                assert out[c, :n, :2].tolist() == \
+                       [list(t) for t in _condense(chan, 7, 300, 33.3)]
+                # frames 233 to 265 are in the first cell
+                rms = numpy.sqrt(numpy.mean(chan[233:266] ** 2.))
+                assert numpy.allclose(out[c, 0, 2], rms)
+            # split between threads
+            saved = PARALLEL_FRAMES
+            PARALLEL_FRAMES = 0
+            try:
+                ov = _overview(x, 3, 300, 33.3)
+            finally:
+                PARALLEL_FRAMES = saved
+            assert (ov == _overview(x, 3, 300, 33.3)).all()
+            assert ov.shape == (numchan, 298, 3)
+
+def test_numpy_condense():
+    import numpy
+    x = numpy.array([5, 1, 4, 2, 3], DTYPE)
+    assert _numpy_condense(x, 0, 2, 2.5) == [(1, 5), (2, 3)]
+    # cells shorter than a frame
+    assert _numpy_condense(x, 0, 4, 0.5) == [(5, 5), (1, 1), (1, 1), (4, 4)]
+    # data starting at frame offset
+    assert _numpy_condense(x, 1, 3, 2, 1) == [(1, 4), (2, 3)]
+    assert _numpy_condense(x, 0, 2, 2, 3) == [(5, 5), (5, 5)]
+    assert _numpy_condense(x, 3, 2, 2) == []
+    assert _numpy_condense(x[:0], 0, 2, 2) == []
+    out = numpy.zeros((1, 4, 3))
+    assert _numpy_condense_channels(x, 0, 4, 2, 0, out) == 3
+    assert out[..., :2].tolist() == [[[1, 5], [2, 4], [3, 3], [0, 0]]]
+    assert out[..., 2].tolist() == [[13 ** 0.5, 10 ** 0.5, 3, 0]]
+    # the frame of a cell shorter than a frame
+    assert _numpy_condense_channels(x, 0, 2, 0.5, 0, out) == 2
+    assert out[0, :2, 2].tolist() == [5, 1]
+
+def test_numpy_condense_parity():
+    import numpy
+    if not HAVE_FAST:
+        return
+    densities = [0.3, 1. / 3, 1, 2.5, 33.3, 100, 1000.5, 44100 / 7.]
+    for dtype in ['float64', 'float32', 'int16']:
+        x = numpy.random.uniform(-1, 1, (20000, 2))
+        x = pcm.convert(x, dtype)
+        for density in densities:
+            for start, offset in [(0, 0), (7, 50), (3, 19999), (40, -5)]:
+                chan = x[:, 1]
+                assert _numpy_condense(chan, start, 300, density, offset) == \
+                       fast._condense(chan, start, 300, density, offset)
+                out = numpy.zeros((2, 300, 3))
+                expected = numpy.zeros((2, 300, 3))
+                assert _numpy_condense_channels(x, start, 300, density,
+                                                offset, out) == \
+                       _condense_channels(x, start, 300, density, offset,
+                                          expected)
+                assert (out[..., :2] == expected[..., :2]).all()
+                assert numpy.allclose(out, expected)
+    # Far cells, where single precision rounds the product of the cell
+    # number and the density.
+    x = numpy.random.uniform(-1, 1, 10000)
+    for density in [0.1, 1. / 3, 7.7]:
+        start = 10 ** 7
+        offset = int(start * density)
+        assert _numpy_condense(x, start, 1000, density, offset) == \
+               fast._condense(x, start, 1000, density, offset)
+    # Frames mapped read-only from a file, as PCMMap returns them when
+    # the file holds the sample type asked for.
+    import tempfile
+    import os
+    fd, filename = tempfile.mkstemp()
+    try:
+        x = numpy.random.uniform(-1, 1, (5000, 2)).astype('float32')
+        os.write(fd, x.tostring())
+        os.close(fd)
+        mapped = numpy.memmap(filename, 'float32', 'r', shape=(5000, 2))
+        assert not mapped.flags.writeable
+        out = numpy.zeros((2, 100, 3))
+        expected = numpy.zeros((2, 100, 3))
+        _condense_channels(mapped, 0, 100, 50, 0, out)
+        _numpy_condense_channels(x, 0, 100, 50, 0, expected)
+        assert numpy.allclose(out, expected)
+        assert fast._condense(mapped[:, 0], 0, 100, 50, 0) == \
+               _numpy_condense(x[:, 0], 0, 100, 50, 0)
+        del mapped
+    finally:
+        os.remove(filename)
+
+def test_PeakPyramid():
+    import numpy
+    numpy.random.seed(0)
+    x = numpy.random.uniform(-1, 1, (10000, 2))
+    p = PeakPyramid(x)
+    assert len(p.levels[0][0]) == 10000 // PEAK_BLOCK
+    assert len(p.levels[-1][0]) == 1
+    for a, b in [(0, 10000), (0, 1), (5, 64), (63, 129), (100, 9999),
+                 (1000, 5000), (64, 128)]:
+        mini, maxi, sumsq = p.peak(x, a, b)
+        assert mini.tolist() == x[a:b].min(axis=0).tolist()
+        assert maxi.tolist() == x[a:b].max(axis=0).tolist()
+        assert numpy.allclose(sumsq, (x[a:b] ** 2).sum(axis=0))
+
+    # frames summarized in several steps
+    q = PeakPyramid(x, length=1000)
+    assert q.length == 1000
+    q.extend(x, 5000)
+    q.extend(x, 10000)
+    for qlevel, plevel in zip(q.levels, p.levels):
+        for a, b in zip(qlevel, plevel):
+            assert a.tolist() == b.tolist()
+
+    # Cell bounds and buffer offsets are multiples of the block size:
+    # the overview is exact, even across pieces.
+    y = numpy.random.uniform(-1, 1, 500000)
+    spike = numpy.zeros(1024)
+    spike[10:12] = [2, -2]
+    t = PieceTable(y).splice(1000, 1000, spike)
+    t = t.splice(300032, 301056, [])
+    t = t.splice(401408, 401408, numpy.random.uniform(-1, 1, 69632))
+    flat = numpy.asarray(t)
+    for start, width, density in [(0, 300, 2048), (3, 100, 4096),
+                                  (15, 10, 32768), (0, 1, 2 ** 20)]:
+        o = _peak_overview(t, start, width, density)
+        expected = []
+        for i in range(start, start + width):
+            d = flat[i * density:(i + 1) * density]
+            if len(d):
+                expected.append([d.min(), d.max(), (d ** 2).mean() ** 0.5])
+        assert o[..., :2].tolist() == [[e[:2] for e in expected]]
+        # The bounds of the last cell, at the end of data, are rounded
+        # to blocks: its mean square is not exact.
+        assert numpy.allclose(o[:, :-1, 2], [[e[2] for e in expected[:-1]]])
+    assert o[0][0][:2].tolist() == [-2, 2]
+
+    # Only the pyramids of living buffers are kept.
+    n = len(_pyramids)
+    peak_pyramid(numpy.zeros(1000))
+    assert len(_pyramids) == n
+
+    # integer samples
+    z = numpy.array([-32768, 16384] * 10000, dtype='int16')
+    rms = (1.25 / 2) ** 0.5
+    assert _overview(z, 0, 2, 10000).tolist() == [[[-1, 0.5, rms]] * 2]
+
+def test_peak_cache():
+    import numpy
+    import tempfile
+    import shutil
+    import wave
+    from gum.lib.pcmmap import PCMMap
+    saved = peakcache.CACHE_DIR
+    peakcache.CACHE_DIR = tempfile.mkdtemp()
+    try:
+        filename = peakcache.CACHE_DIR + '/test.wav'
+        numpy.random.seed(1)
+        x = numpy.random.randint(-32768, 32767, 300000).astype('<i2')
+        w = wave.open(filename, 'wb')
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(x.tostring())
+        w.close()
+        buf = PCMMap(filename)
+        set_peak_file(buf, filename).join()
+        expected = _peak_overview(buf, 0, 10, 2 ** 15)
+        assert peakcache.load(filename, _peak_tag(buf)) is not None
+
+        # another buffer of the same file reads the peak cache
+        buf = PCMMap(filename)
+        set_peak_file(buf, filename).join()
+        assert peak_pyramid(buf).levels[0] is None
+        assert peak_pyramid(buf).levels[PEAK_CACHE_LEVEL] is not None
+        assert (_peak_overview(buf, 0, 10, 2 ** 15) == expected).all()
+        o = _peak_overview(buf, 0, 100, 1500)
+        assert o[..., :2].tolist() == \
+                                    [map(list, _condense(buf[:], 0, 100, 1500))]
+        frames = buf[:150000].reshape(100, 1500)
+        assert numpy.allclose(o[0, :, 2], (frames ** 2).mean(axis=1) ** 0.5)
+
+        # a pyramid read or computed in the background does not hold
+        # up the other buffers
+        load = peakcache.load
+        reading = threading.Event()
+        go_on = threading.Event()
+        def slow_load(filename, tag):
+            reading.set()
+            go_on.wait()
+            return load(filename, tag)
+        peakcache.load = slow_load
+        try:
+            buf = PCMMap(filename)
+            t = set_peak_file(buf, filename)
+            reading.wait()
+            other = numpy.arange(100000, dtype='float32')
+            assert peak_pyramid(other).length == 100000
+            assert t.is_alive()
+        finally:
+            go_on.set()
+            peakcache.load = load
+        t.join()
+        assert (_peak_overview(buf, 0, 10, 2 ** 15) == expected).all()
+    finally:
+        shutil.rmtree(peakcache.CACHE_DIR)
+        peakcache.CACHE_DIR = saved
+
 def test_middle():
     from gum.lib.mock import Mock, Fake
     import numpy
@@ -339,6 +1199,25 @@ def test_Graph():
     c = Graph(sound)
     o = c.channels()
     assert(len(o)) == 2
+
+    # the sound replaced is not listened to any more
+    from gum.lib.event import Signal
+    calls = []
+    class Watched(Graph):
+        def on_sound_changed(self, start=None, end=None, delta=0):
+            calls.append(start)
+            Graph.on_sound_changed(self, start, end, delta)
+    old, new = Mock({"numchan": 1}), Mock({"numchan": 1})
+    for s in old, new:
+        s.changed = Signal()
+        s.frames = numpy.zeros(100, DTYPE)
+    c = Watched(old)
+    c.set_sound(new)
+    del calls[:]
+    old.changed(0, 10, 0)
+    assert calls == []
+    new.changed(0, 10, 0)
+    assert calls == [0]
     
 
 def test_zoom():
@@ -356,41 +1235,41 @@ def test_zoom():
     g._zoom(1)
     g.center_on(1.5)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]]
     
     g._zoom(factor=1)
     g.center_on(0)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]]
 
     g._zoom(1)
     g.center_on(6)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]]
     
     g._zoom(factor=0.5)
     g.center_on(1.5)
     g.set_width(4)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]]
 
     g.set_width(2)
     g._zoom(0.5)
     g.center_on(0)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2]]]
 
     g.set_width(4)
     g._zoom(0.25)
     g.center_on(0)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]]
     
     g.set_width(4)
     g._zoom(4)
     g.center_on(4)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]], o
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]], o
 
     g.set_width(100)
     data = numpy.array(range(3241))
@@ -416,12 +1295,12 @@ def test_zoom_in():
     g.set_width(2)
     g.zoom_in()
     o = g.channels()
-    assert o == [[(2, 2), (3, 3)]]
+    assert o[..., :2].tolist() == [[[2, 2], [3, 3]]]
 
     g.zoom_out()
     g.set_width(4)
     o = g.channels()
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]]
 
 def test_zoom_in_on():
     import numpy
@@ -434,15 +1313,15 @@ def test_zoom_in_on():
     g.set_width(2)
 
     g.zoom_in_on(0)
-    assert g.channels() == [[(1, 2), (3, 3)]]
+    assert g.channels()[..., :2].tolist() == [[[1, 2], [3, 3]]]
 
     g.zoom_out()
     g.zoom_in_on(1)
-    assert g.channels() == [[(1, 2), (3, 3)]]
+    assert g.channels()[..., :2].tolist() == [[[1, 2], [3, 3]]]
 
     g.zoom_out()
     g.zoom_in_on(2)
-    assert g.channels() == [[(1, 2), (3, 3)]]
+    assert g.channels()[..., :2].tolist() == [[[1, 2], [3, 3]]]
 
 def test_scroll():
     import numpy
@@ -463,10 +1342,40 @@ def test_scroll():
     assert start == 0
     assert end == 4
 
+def test_first_cell():
+    import numpy
+    from gum.lib.mock import Mock, Fake
+
+    sound = Mock({})
+    sound.frames = numpy.array(range(1000), DTYPE)
+    sound.changed = Fake()
+    g = Graph(sound)
+    g.set_width(10)
+    g.density = 10
+    g.move_to(255)
+    assert g.first_cell() == 25
+    assert g.channels()[0][0][:2].tolist() == [250, 259]
+    g.scroll_right()
+    assert g.first_cell() == 26
+    assert g.cells(25, 2, 10)[..., :2].tolist() == [[[250, 259], [260, 269]]]
+
 def test_density():
     from gum.models import Sound
     import gum
-    g = Graph(Sound(gum.basedir + "/data/test/test1.wav"))
+    global set_peak_file
+    # Wait for the peaks of the file, saved in the background.
+    threads = []
+    saved = set_peak_file
+    def recorded(*args):
+        threads.append(saved(*args))
+        return threads[-1]
+    set_peak_file = recorded
+    try:
+        g = Graph(Sound(gum.basedir + "/data/test/test1.wav"))
+    finally:
+        set_peak_file = saved
+    for t in threads:
+        t.join()
     g.set_width(700)
     g.zoom_in()
     g.channels()
@@ -504,15 +1413,14 @@ def test_OverviewCache():
     cache = OverviewCache()
     cache.set_data(numpy.array([1, 2, 3, 4], DTYPE))
     o = cache.get(start=0, width=4, density=1)
-    assert o == [[(1, 1), (2, 2), (3, 3), (4, 4)]]
+    assert o[..., :2].tolist() == [[[1, 1], [2, 2], [3, 3], [4, 4]]]
 
     o2 = cache.get(start=0, width=4, density=1)
-    assert o2 == o
     assert o2 is o
 
     cache.set_data(numpy.array([1, 2, 3, 4], DTYPE))
     o3 = cache.get(start=0, width=4, density=1)
-    assert o3 == o
+    assert (o3 == o).all()
     assert o3 is not o
 
     cache.set_data(numpy.array(range(1000), DTYPE))
@@ -520,20 +1428,159 @@ def test_OverviewCache():
     o2 = cache.get(start=4, width=10, density=10)
     o3 = cache.get(start=0, width=10, density=10)
     o4 = cache.get(start=4, width=10, density=10)
-    assert o1 == o3
-    assert o2 == o4
-    assert o1[0][4:] == o2[0][:6], str(o1[0][4:]) + str(o2[0][:6])
+    assert (o1 == o3).all()
+    assert (o2 == o4).all()
+    assert (o1[0][4:] == o2[0][:6]).all(), str(o1[0][4:]) + str(o2[0][:6])
+
+def test_OverviewCache_update():
+    import numpy
+
+    data = PieceTable(numpy.array(range(1000), DTYPE))
+    for start, end, frames in [(35, 42, [-1., -2.]), (35, 37, [-1., -2.]),
+                               (35, 45, []), (0, 1000, []),
+                               (990, 1000, range(100)),
+                               (35, 35, range(10)), (35, 35, range(7))]:
+        cache = OverviewCache()
+        cache.set_data(data)
+        o = cache.get(start=0, width=10, density=10)
+        # mark the cached cells, to tell them from computed ones
+        o[..., :2] += 10000
+        new = data.splice(start, end, numpy.array(frames, DTYPE))
+        cache.update(new, start, end, len(frames) - (end - start))
+        o2 = cache.get(start=0, width=10, density=10)
+        expected = _overview(new, 0, 10, 10)
+        kept = o2[0, :, 0] > 5000
+        assert o2.shape == expected.shape
+        assert (o2[..., :2] - 10000 * kept[:, None] ==
+                expected[..., :2]).all(), (start, end)
+        assert (o2[..., 2] == expected[..., 2]).all()
+        if start > 0:
+            # cells before the change are kept
+            assert kept[0]
+        if len(frames) == 10:
+            # cells after the change moved by one cell
+            assert kept[-1]
+
+    # stereo
+    data = PieceTable(numpy.array(zip(range(100), range(100)), DTYPE))
+    cache = OverviewCache()
+    cache.set_data(data)
+    cache.get(start=0, width=10, density=10)
+    new = data.splice(0, 100, [])
+    cache.update(new, 0, 100, -100)
+    assert cache.get(start=0, width=10, density=10).tolist() == [[], []]
+
+    # all densities are updated
+    data = PieceTable(numpy.array(range(1000), DTYPE))
+    cache = OverviewCache()
+    cache.set_data(data)
+    cache.get(start=0, width=10, density=10)
+    cache.get(start=0, width=10, density=20)
+    new = data.splice(0, 10, [])
+    cache.update(new, 0, 10, -10)
+    for density in [10, 20]:
+        o = cache.get(start=0, width=10, density=density)
+        assert (o == _overview(new, 0, 10, density)).all()
+
+
+def test_OverviewCache_lru():
+    import numpy
+    global MAX_OVERVIEW_CELLS
+
+    data = PieceTable(numpy.array(range(10000), DTYPE))
+    cache = OverviewCache()
+    cache.set_data(data)
+
+    def get(start, width, density):
+        o = cache.get(start, width, density)
+        assert (o == _overview(data, start, width, density)).all()
+
+    get(100, 10, 10)
+    get(105, 10, 10)
+    assert (cache.hits, cache.misses) == (0, 2)
+    # back to cells already seen
+    get(100, 15, 10)
+    get(100, 10, 20)
+    get(102, 10, 10)
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    # prefetched cells are hits, prefetching is not counted
+    cache.prefetch(90, 10, 10)
+    cache.prefetch(0, 10, 5)
+    get(90, 20, 10)
+    get(0, 10, 5)
+    assert (cache.hits, cache.misses) == (4, 3)
+
+    # the density used the longest time ago is dropped
+    for i in range(MAX_OVERVIEWS):
+        get(0, 10, 100 + i)
+    get(0, 10, 5)
+    assert (cache.hits, cache.misses) == (4, 4 + MAX_OVERVIEWS)
+
+    # the cells far from the window are dropped
+    saved = MAX_OVERVIEW_CELLS
+    MAX_OVERVIEW_CELLS = 20
+    try:
+        for start in range(0, 100, 5):
+            get(start, 10, 1)
+        get(92, 10, 1)
+        get(0, 10, 1)
+        assert (cache.hits, cache.misses) == (5, 25 + MAX_OVERVIEWS)
+    finally:
+        MAX_OVERVIEW_CELLS = saved
+
+
+def test_nearby():
+    from gum.models import Sound
+    import numpy
+
+    sound = Sound()
+    sound.frames = numpy.array(range(10000), DTYPE)
+    g = Graph(sound)
+    g.set_width(100)
+    assert g.nearby(0, 100, 10) == [(100, 100, 10), (0, 127, 8.), (0, 102, 12.)]
+    assert g.nearby(50, 100, 10)[:2] == [(0, 50, 10), (150, 100, 10)]
+    # cells shown after a zoom on the last pixel
+    start, width, density = g.nearby(50, 100, 10)[2]
+    assert start <= frame2cell(500, 8) and frame2cell(1500, 8) <= start + width
+    start, width, density = g.nearby(50, 100, 10)[3]
+    assert start <= frame2cell(500 - 200, 12)
+    assert frame2cell(500 + 1200, 12) <= start + width
+    # no zoom in past one frame per pixel
+    assert len(g.nearby(0, 100, 1)) == 2
+
+    for window in g.nearby(50, 100, 10):
+        g.prefetch(*window)
+    assert g.cache_stats() == (0, 0)
+    g.cells(150, 100, 10)
+    g.cells(62, 100, 8.)
+    assert g.cache_stats() == (2, 0)
 
 
 if __name__ == "__main__":
+    # Keep the peaks of the test sounds out of the user's cache.
+    import atexit
+    import shutil
+    import tempfile
+    peakcache.CACHE_DIR = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, peakcache.CACHE_DIR, True)
     test_overview()
+    test_condense_channels()
+    test_numpy_condense()
+    test_numpy_condense_parity()
     test_Graph()
+    test_PeakPyramid()
+    test_peak_cache()
     test_intersection()
     test_channels()
     test_middle()
     test_zoom()
     test_zoom_in()
     test_scroll()
+    test_first_cell()
     test_zoom_in_on()
     test_OverviewCache()
+    test_OverviewCache_update()
+    test_OverviewCache_lru()
+    test_nearby()
     test_density()
@@ -3,11 +3,31 @@
 # Licensed under the Revised BSD License.
 
 from gum.lib.event import Signal
-from gum.lib import history, edit
+from gum.lib import history, edit, pcm, pcmmap
+from gum.lib.piecetable import PieceTable
+from gum.models import clipboard
+from gum.models.clipboard import Clip
 import pysndfile
 from copy import copy
+import tempfile
+import shutil
+import threading
+import weakref
 import os.path
 import numpy
+try:
+    from gobject import idle_add
+except ImportError:
+    idle_add = None
+
+# Number of frames written at once when saving.
+SAVE_BLOCK_FRAMES = 2 ** 18
+
+# Number of frames read at once when loading in the background.
+LOAD_BLOCK_FRAMES = 2 ** 20
+
+# The sounds alive. Their frames and histories may share buffers.
+_sounds = weakref.WeakSet()
 
 def list_extensions():
     extensions = pysndfile.get_sndfile_formats()
@@ -15,127 +35,416 @@ def list_extensions():
     return extensions
 
 
+def _frozen(clip):
+    "Return clip, or a table that will not change with clip."
+    if isinstance(clip, PieceTable):
+        return clip.slice(0, len(clip))
+    return clip
+
+
 class Sound(object):
 
-    # frames is a numpy.ndarray, as returned by pysndfile
-    
-    def __init__(self, filename=None):
+    # frames is a PieceTable: edits share the sample buffers instead
+    # of copying them, and the history only records which pieces of
+    # the buffers make up the sound. Arrays assigned to frames are
+    # wrapped in a PieceTable, and must not be modified afterwards.
+    #
+    # With mmap=True, uncompressed WAV and AIFF files are not read
+    # when opened: frames are decoded from the file when they are
+    # sliced. Other formats are read as usual.
+    #
+    # dtype is the sample type frames are stored in, one of
+    # pcm.DTYPES. float32 and integer types take 2 to 4 times less
+    # memory than float64. Pasted and mixed clips are converted to it.
+    #
+    # changed(start, end, delta) is emitted after each edit, undo or
+    # redo: frames start to end were replaced by end - start + delta
+    # frames, and the frames after end moved by delta. changed()
+    # without arguments means that all frames may have changed.
+    #
+    # With background=True, the file is read by a thread and frames
+    # grow as blocks are read. The thread emits no signal: frames grow,
+    # and changed() and progress(loaded, total) are emitted, in the
+    # main loop, through gobject.idle_add. The blocks read meanwhile
+    # are told in one change. progress is emitted once more when
+    # loading is over. The sound cannot be edited or saved until then.
+    # Without gobject, or without a main loop running, wait_loaded()
+    # and cancel_loading() tell what was not told yet.
+
+    def __init__(self, filename=None, mmap=False, dtype='float64',
+                 background=False):
+        if numpy.dtype(dtype).name not in pcm.DTYPES:
+            raise ValueError("Unsupported sample type: %s" % dtype)
         self.filename = filename
-        self.history = history.History()
+        self.dtype = numpy.dtype(dtype)
+        self.history = history.History(shared=self._in_use)
         self.changed = Signal()
+        self.progress = Signal()
+        self.load_error = None
+        self._buffer = None
+        self._loader = None
+        # What the loader read and did not tell yet: the frames, the
+        # first frame not told, the number of frames loaded, whether
+        # loading is over, and whether a call to _tell() is pending.
+        self._load_lock = threading.Lock()
+        self._loaded_frames = None
+        self._untold = None
+        self._loaded = 0
+        self._load_over = False
+        self._telling = False
         if filename == None:
             # empty sound
-            self.frames = numpy.array([])
+            self.frames = numpy.array([], dtype=self.dtype)
             self.samplerate = 44100
             self._saved_revision = None
             self._format = pysndfile.construct_format('wavex', 'pcm24')
         else:
             filename = os.path.expanduser(filename)
             f = pysndfile.PySndfile(filename)
-            nframes = f.frames()
-            self.frames = f.read_frames(nframes)
+            frames = None
+            if mmap:
+                try:
+                    frames = pcmmap.PCMMap(filename, self.dtype)
+                except pcmmap.NotMappable:
+                    pass
+            if frames is None and background:
+                numchan = f.channels()
+                shape = (f.frames(),) + ((numchan,) if numchan > 1 else ())
+                buf = numpy.empty(shape, dtype=self.dtype)
+                frames = PieceTable(buf, [])
+                self._loader = threading.Thread(target=self._load,
+                                                args=(f, buf))
+                self._loader.daemon = True
+                self._cancel = threading.Event()
+            elif frames is None:
+                nframes = f.frames()
+                frames = f.read_frames(nframes, dtype=self.dtype)
+            self.frames = frames
+            self._buffer = frames
             self.samplerate = f.samplerate()
             self._format = f.format()
             self._saved_revision = self.history.revision()
+            if self._loader is not None:
+                self._buffer = buf
+                self._loader.start()
+        _sounds.add(self)
+
+    def _load(self, f, buf):
+        start = 0
+        try:
+            try:
+                while start < len(buf) and not self._cancel.isSet():
+                    n = min(LOAD_BLOCK_FRAMES, len(buf) - start)
+                    block = f.read_frames(n, dtype=self.dtype)
+                    if not len(block):
+                        break
+                    end = start + len(block)
+                    buf[start:end] = block
+                    self._publish(PieceTable(buf, [(buf, 0, end)]), start,
+                                  end)
+                    start = end
+            except Exception, e:
+                self.load_error = e
+        finally:
+            self._publish(None, start, start, over=True)
+
+    def _publish(self, frames, start, end, over=False):
+        "Called by the loader: have frames told in the main loop."
+        self._load_lock.acquire()
+        try:
+            if frames is not None:
+                self._loaded_frames = frames
+                if self._untold is None:
+                    self._untold = start
+            self._loaded = end
+            self._load_over = over
+            schedule = not self._telling and idle_add is not None
+            if schedule:
+                self._telling = True
+        finally:
+            self._load_lock.release()
+        if schedule:
+            idle_add(self._tell)
+
+    def _tell(self):
+        "Set the frames loaded and emit the signals the loader could not."
+        self._load_lock.acquire()
+        try:
+            self._telling = False
+            frames, start = self._loaded_frames, self._untold
+            loaded, over = self._loaded, self._load_over
+            self._loaded_frames = self._untold = None
+        finally:
+            self._load_lock.release()
+        if self._loader is None:
+            # Already told that loading is over.
+            return False
+        if start is not None:
+            self.frames = frames
+            self.changed(start, start, loaded - start)
+        total = len(self._buffer)
+        if over:
+            if loaded < total:
+                # Cancelled or failed: the frames are not the file's.
+                self.filename = None
+                self._saved_revision = None
+            self._loader = None
+        self.progress(loaded, total)
+        return False
+
+    def is_loading(self):
+        return self._loader is not None
+
+    def wait_loaded(self):
+        """Wait until the file is loaded, and tell what was not told
+        yet."""
+        loader = self._loader
+        if loader is not None:
+            loader.join()
+            self._tell()
+
+    def cancel_loading(self):
+        """Stop loading the file.
+
+        The frames read so far are kept, as an unsaved sound.
+
+        """
+        loader = self._loader
+        if loader is not None:
+            self._cancel.set()
+            loader.join()
+            self._tell()
+
+    def _check_loaded(self):
+        if self.is_loading():
+            raise Exception("The sound is still loading.")
+
+    def file_frames(self):
+        """Return the buffer holding all the frames of the sound file.
+
+        Returns None if the frames are not the ones of the file. While
+        loading, the buffer is not filled yet.
+
+        """
+        buf = self._buffer
+        if buf is None or not self.is_saved():
+            return None
+        if self.is_loading():
+            return buf
+        pieces = self.frames.pieces()
+        if (len(pieces) == 1 and pieces[0][0] is buf and
+            pieces[0][1:] == (0, len(buf))):
+            return buf
+        return None
+
+    def get_frames(self):
+        return self._frames
+
+    def set_frames(self, frames):
+        if not isinstance(frames, PieceTable):
+            frames = PieceTable(frames)
+        self._frames = frames
+
+    frames = property(get_frames, set_frames)
 
     def numchan(self):
         return self.frames.ndim
 
+    def is_mapped(self):
+        "True if some frames are read from a memory-mapped file."
+        return any(isinstance(buf, pcmmap.PCMMap)
+                   for buf, _, _ in self.frames.pieces())
+
     def save(self):
         self.save_as(self.filename)
 
     def save_as(self, filename):
+        self._check_loaded()
         if filename is None:
             raise Exception("No filename")
-        f = pysndfile.PySndfile(filename,
+        filename = os.path.expanduser(filename)
+        # Never truncate the file the frames are mapped from: write
+        # a new file and rename it over the old one.
+        overwrite = (self.is_mapped() and self.filename is not None and
+                     os.path.exists(filename) and
+                     os.path.samefile(filename,
+                                      os.path.expanduser(self.filename)))
+        if overwrite:
+            fd, path = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                        suffix=os.path.basename(filename))
+            os.close(fd)
+        else:
+            path = filename
+        f = pysndfile.PySndfile(path,
                                 mode='w',
                                 format=self._format,
                                 channels=self.numchan(),
                                 samplerate=self.samplerate)
-        f.write_frames(self.frames)
+        for chunk in self.frames.chunks(size=SAVE_BLOCK_FRAMES):
+            f.write_frames(chunk)
+        del f
+        if overwrite:
+            # The new file takes the place of the old one, with its
+            # permissions and, if allowed, its group.
+            shutil.copymode(filename, path)
+            try:
+                os.chown(path, -1, os.stat(filename).st_gid)
+            except OSError:
+                pass
+            os.rename(path, filename)
         self.filename = filename
         self._saved_revision = self.history.revision()
 
     def cut(self, start, end):
-        clip = copy(self.frames[start:end])
+        self._check_loaded()
+        saved = self.frames.slice(start, end)
         do = (self._do_cut, (start, end))
-        undo = (self._do_paste, (start, start, clip))
+        undo = (self._do_paste, (start, start, saved))
         self.history.add(do, undo)
-        self.changed()
-        return clip
+        return Clip(saved)
     
     def _do_cut(self, start, end):
-        data = numpy.concatenate((self.frames[:start], self.frames[end:]))
-        self.frames = data
+        self.frames = self.frames.splice(start, end, [])
+        self.changed(start, end, start - end)
 
     def copy(self, start, end):
-        clip = copy(self.frames[start:end])
-        return clip
+        "Return a Clip of the frames between start and end."
+        return Clip(self.frames.slice(start, end))
 
     def paste(self, start, end, clip):
-        saved = copy(self.frames[start:end])
+        self._check_loaded()
+        clip = _frozen(clip)
+        saved = self.frames.slice(start, end)
         do = (self._do_paste, (start, end, clip))
         undo = (self._do_paste, (start, start + len(clip), saved))
         self.history.add(do, undo)
-        self.changed()
 
     def _do_paste(self, start, end, clip):
+        clip = pcm.convert(clip, self.dtype)
         if self.is_empty():
             self.frames = clip
+            self.changed()
         else:
             # FIXME: should resample
             clip = edit.mix_channels_auto(clip, self.numchan())
-            x = self.frames
-            y = numpy.concatenate((x[:start], clip, x[end:]))
-            self.frames = y
+            self.frames = self.frames.splice(start, end, clip)
+            self.changed(start, end, len(clip) - (end - start))
+
+    def replace(self, start, end, frames):
+        """Replace the frames between start and end by as many frames.
+
+        Only the new frames are stored: the rest of the sound is left
+        in place, and undo puts the old frames back.
+
+        """
+        self._check_loaded()
+        # Like slicing, ignore the frames past the end.
+        end = min(end, len(self.frames))
+        start = min(start, end)
+        if len(frames) != end - start:
+            raise ValueError("replace() must keep the number of frames")
+        frames = pcm.convert(_frozen(frames), self.dtype)
+        frames = edit.mix_channels_auto(frames, self.numchan())
+        saved = self.frames.slice(start, end)
+        do = (self._do_replace, (start, frames))
+        undo = (self._do_replace, (start, saved))
+        self.history.add(do, undo)
+
+    def _do_replace(self, start, frames):
+        end = start + len(frames)
+        self.frames = self.frames.splice(start, end, frames)
+        self.changed(start, end, 0)
 
     def mix(self, start, end, clip):
-        saved = copy(self.frames[start:start + len(clip)])
+        self._check_loaded()
+        clip = _frozen(clip)
+        saved = self.frames.slice(start, start + len(clip))
         do = (self._do_mix, (start, end, clip))
         undo = (self._do_paste, (start, start + len(clip), saved))
         self.history.add(do, undo)
-        self.changed()
 
     def _do_mix(self, start, end, clip):
+        clip = pcm.convert(clip, self.dtype)
         if self.is_empty():
             self.frames = clip
+            self.changed()
         else:
             # FIXME: should resample
             clip = edit.mix_channels_auto(clip, self.numchan())
             if start != end:
                 length = min(end - start, len(clip))
                 chunk = clip[:length].astype(self.frames.dtype) # FIXME
-                self.frames[start:start + length] += chunk
+                mixed = edit.add(self.frames[start:start + length], chunk)
             else:
-                a = self.frames
-                b = clip
-                sound_length = max(len(a), start + len(b))
-                if self.numchan() > 1:
-                    c = numpy.zeros((sound_length, self.numchan()))
-                else:
-                    c = numpy.zeros(sound_length)
-                c[:len(a)] = a
-                c[start:start + len(b)] += b
-                self.frames = c
+                # The sound may get longer.
+                a = self.frames[start:start + len(clip)]
+                mixed = numpy.zeros((len(clip),) + self.frames.shape[1:],
+                                    dtype=numpy.result_type(a, clip))
+                mixed[:len(a)] = a
+                mixed = edit.add(mixed, clip)
+                length = len(a)
+            self.frames = self.frames.splice(start, start + length, mixed)
+            self.changed(start, start + length, len(mixed) - length)
+
+    def trim(self, start, end):
+        "Keep only the frames between start and end."
+        self._check_loaded()
+        head = self.frames.slice(0, start)
+        tail = self.frames.slice(end, len(self.frames))
+        do = (self._do_trim, (start, end))
+        undo = (self._do_untrim, (head, tail))
+        self.history.add(do, undo)
+
+    def _do_trim(self, start, end):
+        length = len(self.frames)
+        self.frames = self.frames.slice(start, end)
+        self.changed(0, length, end - start - length)
+
+    def _do_untrim(self, head, tail):
+        length = len(self.frames)
+        frames = self.frames.splice(0, 0, head)
+        self.frames = frames.splice(len(frames), len(frames), tail)
+        self.changed(0, length, len(head) + len(tail))
 
     def undo(self):
+        self._check_loaded()
         self.history.undo()
-        self.changed()
 
     def redo(self):
+        self._check_loaded()
         self.history.redo()
-        self.changed()
 
     def is_empty(self):
         return not len(self.frames)
 
     def is_fresh(self):
-        """True if sound is empty and has never been edited."""
-        return self.is_empty() and self.history.is_empty()
+        """True if sound is empty, has never been edited and is not
+        loading a file."""
+        return (self.is_empty() and self.history.is_empty() and
+                not self.is_loading())
 
     def is_saved(self):
         return self._saved_revision == self.history.revision()
 
+    def _in_use(self):
+        """Frames the history must not count nor spill: the frames of
+        every sound and the clipboard, and those the histories of the
+        other sounds hold. Spilling them would free no memory."""
+        in_use = [clipboard.clip]
+        for sound in list(_sounds):
+            in_use.append(sound.frames)
+            if sound is not self:
+                in_use.extend(sound.history.buffers())
+        return in_use
+
+    def undo_memory(self):
+        """Return the number of bytes of frames kept to undo and redo.
+
+        Returns a tuple (bytes in memory, bytes spilled to disk).
+
+        """
+        return self.history.nbytes(), self.history.spilled_bytes()
+
 
 # -- Tests
 
@@ -173,6 +482,21 @@ def testSound():
     snd.history.redo()
     assert snd.frames.tolist() == sine2[start:end] + sine2
 
+    # clips share the frames of the sound
+    x = numpy.arange(100.)
+    snd.frames = x
+    clip = snd.cut(10, 20)
+    assert [p[0] is x for p in clip.pieces()] == [True]
+    assert snd.copy(0, 50).pieces()[0][0] is x
+    snd.paste(0, 0, clip)
+    snd.mix(0, 5, clip)
+    assert all(p[0] is x for p in snd.frames.pieces()[1:])
+    assert clip.tolist() == range(10, 20)
+    snd.undo()
+    snd.undo()
+    snd.undo()
+    assert snd.frames.tolist() == range(100)
+
     # test with a mono file
     snd = Sound(testdir + "/test1.wav")
     assert snd.frames != []
@@ -221,6 +545,174 @@ def testSound():
     snd.paste(0, 0, clip)
     assert snd.frames.tolist() == data2[start:end] + data2
 
+    # change notifications
+    changes = []
+    def on_changed(*args):
+        changes.append(args)
+    snd = Sound()
+    snd.changed.connect(on_changed)
+    snd.paste(0, 0, numpy.zeros(10))
+    snd.cut(2, 5)
+    snd.paste(1, 1, numpy.ones(4))
+    snd.mix(0, 3, numpy.ones(3))
+    snd.mix(9, 9, numpy.ones(5))
+    snd.trim(1, 9)
+    snd.undo()
+    snd.undo()
+    snd.redo()
+    assert changes == [(), (2, 5, -3), (1, 1, 4), (0, 3, 0), (9, 11, 3),
+                       (0, 14, -6), (0, 8, 6), (9, 14, -3), (9, 11, 3)]
+
+    # replace
+    x = numpy.arange(100.)
+    snd = Sound()
+    snd.frames = x
+    snd.changed.connect(on_changed)
+    changes[:] = []
+    snd.replace(10, 15, numpy.zeros(5))
+    assert snd.frames.tolist() == range(10) + [0] * 5 + range(15, 100)
+    pieces = snd.frames.pieces()
+    assert pieces[0][0] is x and pieces[2][0] is x
+    snd.undo()
+    assert snd.frames.tolist() == range(100)
+    snd.redo()
+    assert snd.frames[8:17].tolist() == [8, 9, 0, 0, 0, 0, 0, 15, 16]
+    assert changes == [(10, 15, 0)] * 3
+    try:
+        snd.replace(10, 15, numpy.zeros(6))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+    # background loading
+    global LOAD_BLOCK_FRAMES, idle_add
+    LOAD_BLOCK_FRAMES = 10000
+    # the main loop, run by this thread
+    calls = []
+    saved_idle_add = idle_add
+    idle_add = calls.append
+    def run_main_loop():
+        while calls:
+            calls.pop(0)()
+    signals = []
+    def on_changed(*args):
+        signals.append(('changed', args, threading.current_thread()))
+    def on_progress(*args):
+        signals.append(('progress', args + (snd.is_loading(),),
+                        threading.current_thread()))
+    # hold the loader until the test is ready
+    go = threading.Event()
+    load = Sound._load
+    def held_load(self, f, buf):
+        go.wait()
+        load(self, f, buf)
+    Sound._load = held_load
+    for filename in ["/test1.wav", "/test2.wav"]:
+        expected = Sound(testdir + filename).frames.tolist()
+        go.clear()
+        snd = Sound(testdir + filename, background=True)
+        snd.changed.connect(on_changed)
+        snd.progress.connect(on_progress)
+        assert snd.is_loading() and not snd.is_fresh()
+        try:
+            snd.cut(0, 1)
+        except Exception:
+            pass
+        else:
+            assert False
+        del signals[:]
+        go.set()
+        snd._loader.join()
+        # the loader only asked once for the blocks to be told
+        assert len(calls) == 1 and signals == []
+        assert snd.is_loading() and len(snd.frames) == 0
+        run_main_loop()
+        assert not snd.is_loading()
+        assert snd.frames.tolist() == expected
+        assert snd.is_saved()
+        assert snd.file_frames() is not None
+        n = len(expected)
+        main = threading.current_thread()
+        assert signals == [('changed', (0, 0, n), main),
+                           ('progress', (n, n, False), main)]
+    snd.cut(0, 1)
+    assert snd.file_frames() is None
+    # blocks are told as the main loop runs
+    go.clear()
+    snd = Sound(testdir + "/test2.wav", background=True)
+    snd.changed.connect(on_changed)
+    del signals[:]
+    publish = snd._publish
+    published = threading.Event()
+    told = threading.Event()
+    def publish_and_wait(*args, **kwargs):
+        publish(*args, **kwargs)
+        published.set()
+        told.wait()
+        told.clear()
+    snd._publish = publish_and_wait
+    go.set()
+    while snd.is_loading():
+        published.wait()
+        published.clear()
+        run_main_loop()
+        told.set()
+    blocks = [(start, start, min(10000, n - start))
+              for start in range(0, n, 10000)]
+    assert [args for name, args, thread in signals] == blocks
+    #
+    Sound._load = load
+    idle_add = saved_idle_add
+    snd = Sound(testdir + "/test2.wav", background=True)
+    snd.cancel_loading()
+    assert not snd.is_loading()
+    assert snd.frames.tolist() == expected[:len(snd.frames)]
+    if len(snd.frames) < n:
+        assert snd.filename is None
+        assert not snd.is_saved()
+    LOAD_BLOCK_FRAMES = 2 ** 20
+
+    # undo memory
+    snd = Sound()
+    snd.frames = numpy.zeros(100000)
+    assert snd.undo_memory() == (0, 0)
+    snd.paste(0, 50000, numpy.ones(100000))
+    # frames in use by the sound are not counted
+    assert snd.undo_memory() == (0, 0)
+    snd.paste(0, len(snd.frames), numpy.ones(100000))
+    assert snd.undo_memory() == (1600000, 0)
+    snd.history.max_bytes = 10000
+    snd.cut(0, 10)
+    assert snd.undo_memory() == (0, 1600000)
+    snd.undo()
+    snd.undo()
+    snd.undo()
+    assert snd.frames.tolist() == [0] * 100000
+    # frames shared with another sound are not counted
+    import gc
+    a = Sound()
+    a.frames = numpy.ones(100000)
+    b = Sound()
+    b.paste(0, 0, a.copy(0, 100000))
+    a.paste(0, 100000, numpy.zeros(100000))
+    saved = clipboard.clip
+    clipboard.clip = numpy.array([])
+    try:
+        # b plays the frames a keeps to undo
+        assert a.undo_memory() == (0, 0)
+        a.history.max_bytes = 0
+        a.cut(0, 10)
+        assert a.undo_memory() == (0, 0)
+        del b
+        gc.collect()
+        assert a.undo_memory() == (800000, 0)
+    finally:
+        clipboard.clip = saved
+    a.undo()
+    a.undo()
+    assert a.frames.tolist() == [1] * 100000
+
     # test save_as()
     import os
     snd = Sound(testdir + "/test1.wav")
@@ -379,6 +871,86 @@ def testSound():
     snd.mix(1, 3, clip)
     assert snd.frames.tolist() == [[1, 1], [22, 22], [33, 33], [4, 4]]
 
+    # test trim
+    snd = Sound()
+    snd.frames = numpy.array([1, 2, 3, 4, 5])
+    snd.trim(1, 3)
+    assert snd.frames.tolist() == [2, 3]
+    snd.undo()
+    assert snd.frames.tolist() == [1, 2, 3, 4, 5]
+    snd.redo()
+    assert snd.frames.tolist() == [2, 3]
+
+    # edits share the sample buffers instead of copying them
+    snd = Sound()
+    data = numpy.array(range(10))
+    snd.frames = data
+    snd.cut(2, 4)
+    snd.paste(0, 0, numpy.array([42]))
+    assert snd.frames.tolist() == [42, 0, 1, 4, 5, 6, 7, 8, 9]
+    pieces = snd.frames.pieces()
+    assert len(pieces) == 3
+    assert pieces[1][0] is data and pieces[2][0] is data
+    snd.undo()
+    snd.undo()
+    assert snd.frames.tolist() == range(10)
+    assert snd.frames.pieces()[0][0] is data
+
+    # sample types
+    for dtype in pcm.DTYPES:
+        snd = Sound(testdir + "/test2.wav", dtype=dtype)
+        assert snd.frames.dtype == dtype
+        mapped = Sound(testdir + "/test2.wav", mmap=True, dtype=dtype)
+        assert mapped.frames.dtype == dtype
+        assert mapped.frames[:].tolist() == snd.frames.tolist()
+    #
+    # clips are converted to the sample type
+    snd = Sound(dtype='int16')
+    snd.frames = numpy.array([0, 0, 0, 0], dtype='int16')
+    snd.paste(1, 2, numpy.array([0.5, -1]))
+    assert snd.frames.tolist() == [0, 16384, -32768, 0, 0]
+    assert snd.frames.dtype == numpy.int16
+    snd.mix(0, 2, numpy.array([1., 1.]))
+    assert snd.frames.tolist() == [32767, 32767, -32768, 0, 0]
+    snd.mix(4, 4, numpy.array([-0.5, -0.5]))
+    assert snd.frames.tolist() == [32767, 32767, -32768, 0, -16384, -16384]
+    assert snd.frames.dtype == numpy.int16
+    #
+    outfile = "/tmp/test_int16.wav"
+    snd.save_as(outfile)
+    assert Sound(outfile, dtype='int16').frames.tolist() == \
+                                                      snd.frames.tolist()
+    os.remove(outfile)
+
+    # memory-mapped files
+    for name in ["test1.wav", "test2.wav", "test3.wav"]:
+        snd = Sound(testdir + "/" + name)
+        mapped = Sound(testdir + "/" + name, mmap=True)
+        assert mapped.is_mapped()
+        assert mapped.numchan() == snd.numchan()
+        assert len(mapped.frames) == len(snd.frames)
+        assert mapped.frames[:].tolist() == snd.frames.tolist()
+        assert mapped.frames[100:200].tolist() == snd.frames[100:200].tolist()
+    #
+    mapped = Sound(testdir + "/test1.wav", mmap=True)
+    data = mapped.frames[:].tolist()
+    mapped.cut(10, 20)
+    assert mapped.frames.tolist() == data[:10] + data[20:]
+    mapped.undo()
+    assert mapped.frames.tolist() == data
+    #
+    # saving over the mapped file
+    outfile = "/tmp/test_mapped.wav"
+    shutil.copy(testdir + "/test1.wav", outfile)
+    os.chmod(outfile, 0644)
+    mapped = Sound(outfile, mmap=True)
+    data = mapped.frames[:].tolist()
+    mapped.save()
+    assert mapped.frames[:].tolist() == data
+    assert Sound(outfile).frames.tolist() == data
+    assert os.stat(outfile).st_mode & 0777 == 0644
+    os.remove(outfile)
+
     # Do not crash when saving with None as filename
     snd = Sound()
     try:
@@ -399,4 +971,9 @@ def testSound():
     pysndfile.PySndfile = orig
 
 if __name__ == '__main__':
+    # Keep the peaks of the test sounds out of the user's cache.
+    import atexit
+    from gum.lib import peakcache
+    peakcache.CACHE_DIR = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, peakcache.CACHE_DIR, True)
     testSound()
@@ -157,6 +157,7 @@ class EditorWindow(gtk.Window):
             <accelerator action="End"/>
             <accelerator action="Play"/>
             <accelerator action="Stop"/>
+            <accelerator action="Loop"/>
         </ui>'''
 
         uimanager = gtk.UIManager()
@@ -184,6 +185,7 @@ class EditorWindow(gtk.Window):
                    ('Quit', gtk.STOCK_QUIT, None, None, '', self.quit),
                    ('Play', gtk.STOCK_MEDIA_PLAY, None, 'p', '', self.play),
                    ('Stop', gtk.STOCK_MEDIA_STOP, None, 'o', '', self.stop),
+                   ('Loop', None, 'Loop', 'l', '', self.toggle_loop),
                    ('Start', gtk.STOCK_MEDIA_PREVIOUS, None, 'Home', '',
                                                               self.goto_start),
                    ('End', gtk.STOCK_MEDIA_NEXT, None, 'End', '',
@@ -269,7 +271,7 @@ class EditorWindow(gtk.Window):
 
         """
         if name in ["new", "save", "play", "toggle_play", "stop",
-                    "goto_start", "goto_end", "select_all",
+                    "toggle_loop", "goto_start", "goto_end", "select_all",
                     "cut", "copy", "paste", "mix", "undo", "redo",
                     "zoom_in", "zoom_out", "zoom_fit",
                     "select_till_start", "select_till_end"]:
@@ -449,7 +451,7 @@ class EditorNotebook(gtk.Notebook):
 
     def __getattr__(self, name):
         if name in ["new", "save", "play", "toggle_play", "stop",
-                    "goto_start", "goto_end", "select_all",
+                    "toggle_loop", "goto_start", "goto_end", "select_all",
                     "cut", "copy", "paste", "mix", "undo", "redo",
                     "zoom_in", "zoom_out", "zoom_fit",
                     "select_till_start", "select_till_end",
@@ -504,9 +506,22 @@ class EditorPage(gtk.VBox):
         self.waveform = GraphView(graph, selection, cursor)
         self.scrollbar = GraphScrollbar(graph)
         self.statusbar = gtk.Statusbar()
+
+        # Shown while the sound file is loading
+        self.progressbar = gtk.ProgressBar()
+        button = gtk.Button(stock=gtk.STOCK_CANCEL)
+        button.connect("clicked", self.cancel_loading)
+        self.loadingbox = gtk.HBox()
+        self.loadingbox.pack_start(self.progressbar, expand=True, fill=True)
+        self.loadingbox.pack_end(button, expand=False, fill=False)
+        self.loadingbox.set_no_show_all(True)
+        self._loading = False
+        self._cancelled = False
+
         self.pack_start(self.waveform, expand=True, fill=True)
         self.pack_start(self.scrollbar, expand=False, fill=False)
         self.pack_end(self.statusbar, expand=False, fill=False)
+        self.pack_end(self.loadingbox, expand=False, fill=False)
         self.waveform.connect("selection-changed",
                                               self.on_selection_changed)
         self.ctrl.filename_changed.connect(self._update_filename)
@@ -520,6 +535,31 @@ class EditorPage(gtk.VBox):
     def close(self, force=False):
         self.ctrl.close(force)
 
+    def cancel_loading(self, *args):
+        # The frames loaded so far stay in the tab, as an unsaved sound.
+        self._cancelled = True
+        self.ctrl.cancel_loading()
+
+    def _watch_loading(self):
+        if not self._loading and self.ctrl.load_progress() is not None:
+            self._loading = True
+            self.loadingbox.show_all()
+            gobject.timeout_add(100, self._update_progress)
+
+    def _update_progress(self):
+        fraction = self.ctrl.load_progress()
+        if fraction is not None:
+            self.progressbar.set_fraction(fraction)
+            self.progressbar.set_text("Loading %d%%" % (fraction * 100))
+            return True
+        self._loading = False
+        self.loadingbox.hide()
+        error = self.ctrl.load_error()
+        if error is not None and not self._cancelled:
+            self._update_filename()
+            self.emit_error("Error", "Loading failed: %s" % error)
+        return False
+
     def on_destroy(self, widget):
         # For some reason, the "tab" widget has to be destroyed
         # explicitely. Otherwise, it does not get garbage-collected.
@@ -537,10 +577,11 @@ class EditorPage(gtk.VBox):
         self.title.set_text(name)
         self.menu_title.set_text(name)
         self.emit('filename-changed', filename)
+        self._watch_loading()
 
     def __getattr__(self, name):
         if name in ["new", "save", "play", "toggle_play", "stop",
-                    "goto_start", "goto_end", "select_all",
+                    "toggle_loop", "goto_start", "goto_end", "select_all",
                     "cut", "copy", "paste", "mix", "undo", "redo",
                     "zoom_in", "zoom_out", "zoom_fit",
                     "select_till_start", "select_till_end",
@@ -559,12 +600,17 @@ class EditorPage(gtk.VBox):
            
 def test():
     from gum.lib.mock import Fake, Mock
+    import numpy
     graph = Mock({"frames_info":(0, 0, [], []),
-                  "channels": [[(0, 0.5)]],
+                  "channels": numpy.array([[(0, 0.5)]]),
+                  "cells": numpy.array([[(0, 0.5)]]),
+                  "first_cell": 0,
+                  "nearby": [],
                   "set_width": None,
                   "scroll_left": None,
                   "scroll_right": None})
     graph.changed = Fake()
+    graph.density = 1.
     selection = Mock({"pixels": [50, 100],
                       "start_selection": None,
                       "end_selection": None,
@@ -576,6 +622,8 @@ def test():
         def __init__(self):
             self.filename_changed = Fake()
             self.error = Fake()
+        def load_progress(self):
+            return None
 
     notebook = EditorNotebook()
     win = EditorWindow(notebook)
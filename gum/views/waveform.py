@@ -5,6 +5,9 @@
 import gtk
 import gobject
 import cairo
+import numpy
+from threading import Thread, Condition, Lock
+import time
 try:
     from gum import fast
 except ImportError:
@@ -12,6 +15,106 @@ except ImportError:
 else:
     HAVE_FAST = True
 
+# Milliseconds between two frames drawn by a FrameScheduler.
+FRAME_INTERVAL = 1000 / 60
+
+# Waveform columns filled at once. cairo sorts the boxes of a path before
+# filling it, which costs more per box on long paths than a fill does.
+FILL_COLUMNS = 16
+
+class FrameScheduler(object):
+    """Draw a widget at most once per display frame.
+
+    Model changes come in bursts, some of them from other threads than
+    the main one. redraw() may be called from any thread: the widget is
+    drawn once on the next frame, whatever the number of calls before.
+    Calls queued with defer() are made together just before drawing.
+
+    Only the columns passed to redraw() are drawn with draw_columns(x,
+    width), unless a call asked for the whole widget, drawn with draw().
+
+    changes counts the calls to redraw() and defer(), and frames the
+    frames drawn.
+
+    """
+    def __init__(self, draw, draw_columns, interval=FRAME_INTERVAL):
+        self._draw = draw
+        self._draw_columns = draw_columns
+        self._interval = interval
+        self._lock = Lock()
+        self._scheduled = False
+        self._calls = []
+        self._whole = False
+        self._areas = []
+        self._last = 0
+        self.changes = 0
+        self.frames = 0
+
+    def redraw(self, areas=None):
+        """Draw the (x, width) spans of columns in areas on the next
+        frame, or the whole widget if areas is None."""
+        self._lock.acquire()
+        try:
+            self.changes += 1
+            if areas is None:
+                self._whole = True
+            else:
+                self._areas.extend(areas)
+            self._schedule()
+        finally:
+            self._lock.release()
+
+    def defer(self, func, *args):
+        """Call func(*args) before drawing the next frame."""
+        self._lock.acquire()
+        try:
+            self.changes += 1
+            self._calls.append((func, args))
+            self._schedule()
+        finally:
+            self._lock.release()
+
+    def coalesced(self):
+        """Return the number of changes drawn in the same frame as
+        another one."""
+        return self.changes - self.frames
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            elapsed = (time.time() - self._last) * 1000
+            delay = max(0, int(self._interval - elapsed))
+            gobject.timeout_add(delay, self._frame)
+
+    def _frame(self):
+        self._lock.acquire()
+        try:
+            calls = self._calls
+            self._calls = []
+        finally:
+            self._lock.release()
+        for func, args in calls:
+            func(*args)
+        # Changes made until now are drawn in this frame.
+        self._lock.acquire()
+        try:
+            self._scheduled = False
+            self._last = time.time()
+            self.frames += 1
+            whole, areas = self._whole, self._areas
+            self._whole = False
+            self._areas = []
+        finally:
+            self._lock.release()
+        if whole:
+            self._draw()
+        else:
+            for x, width in areas:
+                if width > 0:
+                    self._draw_columns(x, width)
+        return False
+
+
 # -- Base classes for drawing sound visualization.
 #
 # CairoWidget, LayeredCairoWidget, and LayeredGraphView are defined as
@@ -24,23 +127,25 @@ class CairoWidget(gtk.DrawingArea):
 
     def __init__(self):
         gtk.DrawingArea.__init__(self)
-        self._redrawing = False
+        self.scheduler = FrameScheduler(self.queue_draw, self._queue_columns)
 
     def do_expose_event(self, event):
         context = self.window.cairo_create()
-        context.rectangle(event.area.x, event.area.y,
-                          event.area.width, event.area.height)
+        # Only the damaged areas are composited.
+        context.region(event.region)
         context.clip()
         width, height = self.window.get_size()
         self.draw(context, width, height)
-        self._redrawing = False
 
-    def redraw(self):
+    def redraw(self, areas=None):
+        """Draw again the (x, width) spans of columns in areas, or
+        everything if areas is None."""
         # queue_draw() emits an expose event. Double buffering is used
         # automatically in the expose event handler.
-        if not self._redrawing:
-            self._redrawing = True
-            self.queue_draw()
+        self.scheduler.redraw(areas)
+
+    def _queue_columns(self, x, width):
+        self.queue_draw_area(int(x), 0, int(width), self.allocation.height)
 
     def draw(self, context, width, height):
         """Must be overriden to draw to the cairo context."""
@@ -164,76 +269,373 @@ class CachedLayer(Layer):
                                                    width, height)
 
         if self._must_draw:
-            # clear the cached surface
-            c = cairo.Context(self._surface)
-            c.set_operator(cairo.OPERATOR_CLEAR)
-            c.paint()
-            c.set_operator(cairo.OPERATOR_OVER)
-            self.draw(c, width, height)
+            self.refresh(width, height)
             self._must_draw = False
 
         context.set_source_surface(self._surface, 0, 0)
         context.set_operator(cairo.OPERATOR_OVER)
         context.paint()
-    
 
-class WaveformLayer(CachedLayer):
+    def refresh(self, width, height):
+        """Paint the cached surface again."""
+        c = cairo.Context(self._surface)
+        c.set_operator(cairo.OPERATOR_CLEAR)
+        c.paint()
+        c.set_operator(cairo.OPERATOR_OVER)
+        self.draw(c, width, height)
+
+
+# Surfaces kept by WaveformRenderer to draw on, besides the one shown.
+MAX_FREE_SURFACES = 2
+
+class WaveformRenderer(Thread):
+    """Draw waveforms on image surfaces, in the background.
+
+    request() asks for the waveform of a view and returns at once. Only
+    the last request is drawn: a drawing is abandoned as soon as
+    another request comes. Each surface drawn is passed to the done
+    callback through the main loop, and must be handed back with
+    release() once it is not shown anymore.
+
+    A surface is drawn from the last one: at the same density, the
+    columns still in view are shifted into place, and only the columns
+    that appear or whose values changed are drawn.
+
+    Once a surface is drawn, and until the next request, the values of
+    the views likely to come next are computed, so that scrolling and
+    zooming find them ready.
+
+    """
+    def __init__(self, graph, draw_values, done):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self._graph = graph
+        self._draw_values = draw_values
+        self._done = done
+        self._cond = Condition()
+        self._request = None
+        self._stopped = False
+        # Surfaces not shown anymore, to draw on.
+        self._free = []
+        # (view, values, surface) of the last surface drawn
+        self._last = None
+        self.rendered = 0
+        self.cancelled = 0
+
+    def request(self, first, density, width, height):
+        """Ask for the waveform of width cells from first, at density."""
+        self._cond.acquire()
+        try:
+            self._request = first, density, width, height
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def release(self, surface):
+        """Give back a surface passed to the done callback."""
+        self._cond.acquire()
+        try:
+            if len(self._free) < MAX_FREE_SURFACES:
+                self._free.append(surface)
+        finally:
+            self._cond.release()
+
+    def stop(self):
+        self._cond.acquire()
+        try:
+            self._stopped = True
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def run(self):
+        while True:
+            self._cond.acquire()
+            try:
+                while self._request is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                view = self._request
+                self._request = None
+            finally:
+                self._cond.release()
+            surface = self.render(view)
+            if surface is not None:
+                gobject.idle_add(self._done, surface, view)
+                self.prefetch(view)
+
+    def prefetch(self, view):
+        """Compute the values of the views next to view, until the next
+        request comes."""
+        first, density, width, height = view
+        for window in self._graph.nearby(first, width, density):
+            if self._stale():
+                return
+            self._graph.prefetch(*window)
+
+    def _stale(self):
+        return self._request is not None or self._stopped
+
+    def _surface(self, width, height):
+        self._cond.acquire()
+        try:
+            while self._free:
+                surface = self._free.pop()
+                if (surface.get_width(), surface.get_height()) == \
+                       (width, height):
+                    return surface
+        finally:
+            self._cond.release()
+        return cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+
+    def render(self, view):
+        """Draw the waveform of view.
+
+        Returns a new surface, or None if the last one is still right
+        or the drawing was abandoned.
+
+        """
+        first, density, width, height = view
+        values = self._graph.cells(first, width, density)
+        if self._stale():
+            self.cancelled += 1
+            return None
+        surface = self._surface(width, height)
+        c = cairo.Context(surface)
+        runs = self._runs(view, values)
+        if runs is None:
+            c.set_operator(cairo.OPERATOR_CLEAR)
+            c.paint()
+            c.set_operator(cairo.OPERATOR_OVER)
+            runs = [(0, width)]
+        else:
+            if not runs and view == self._last[0]:
+                self.release(surface)
+                return None
+            # Pixels shifted in from outside the surface are transparent.
+            shift = first - self._last[0][0]
+            c.set_operator(cairo.OPERATOR_SOURCE)
+            c.set_source_surface(self._last[2], -shift, 0)
+            c.paint()
+        for i, j in runs:
+            if self._stale():
+                self.release(surface)
+                self.cancelled += 1
+                return None
+            c.save()
+            c.rectangle(i, 0, j - i, height)
+            c.set_operator(cairo.OPERATOR_CLEAR)
+            c.fill()
+            c.set_operator(cairo.OPERATOR_OVER)
+            c.translate(i, 0)
+            self._draw_values(values[:, i:j], c, j - i, height)
+            c.restore()
+        surface.flush()
+        self._last = view, values, surface
+        self.rendered += 1
+        return surface
+
+    def _runs(self, view, values):
+        """Return the (start, end) runs of columns to draw on the last
+        surface, or None if everything must be drawn."""
+        if self._last is None:
+            return None
+        (first, density, width, height), old = view, self._last[1]
+        last_first, last_density, last_width, last_height = self._last[0]
+        shift = first - last_first
+        if (density, width, height) != (last_density, last_width,
+                                        last_height) or \
+               len(values) != len(old) or abs(shift) >= width:
+            return None
+        # Columns of the old values that are shown again, unchanged.
+        numcells = values.shape[1]
+        src = numpy.arange(numcells) + shift
+        kept = (src >= 0) & (src < old.shape[1])
+        same = numpy.zeros(numcells, bool)
+        same[kept] = (values[:, kept] == old[:, src[kept]]).all(axis=2).all(axis=0)
+        # Runs of columns to draw, and the columns past the values,
+        # which only have the line at zero.
+        edges = numpy.flatnonzero(numpy.diff(same.astype(int)))
+        bounds = [0] + (edges + 1).tolist() + [numcells]
+        runs = [(i, j) for i, j in zip(bounds[:-1], bounds[1:])
+                if not same[i]]
+        if numcells < width and (last_first, old.shape[1]) != \
+               (first, numcells):
+            runs.append((numcells, width))
+        return runs
+
+
+def draw_channel(values, context, ystart, width, height,
+                 wavecolor, rmscolor, axiscolor, fill_columns):
+    """Draw the (min, max) rows of the values array.
+
+    If the rows also hold the root mean square, it is drawn as a band
+    inside the peaks. Colors are (r, g, b) tuples, and the rectangles
+    of fill_columns columns are filled at once.
+
+    """
+    # Line at zero
+    context.set_line_width(1)
+    context.set_source_rgb(*axiscolor)
+    context.move_to(0, ystart + round(height / 2.0) + 0.5)
+    context.line_to(width, ystart + round(height / 2.0) + 0.5)
+    context.stroke()
+
+    # Waveform, as pixel-aligned rectangles filled a few columns at
+    # once.
+    context.set_source_rgb(*wavecolor)
+    # -1 <= mini <= maxi <= 1
+    # ystart <= ymax <= ymin <= ystart + height - 1
+    ys = ystart + numpy.floor((-values * 0.5 + 0.5) * (height - 1) + 0.5)
+    # The pixels a line from max to min covers, at least one.
+    heights = numpy.maximum(ys[:, 0] - ys[:, 1], 1)
+    for x, (ymax, h) in enumerate(zip(ys[:, 1].tolist(),
+                                      heights.tolist())):
+        context.rectangle(x, ymax, 1, h)
+        if x % fill_columns == fill_columns - 1:
+            context.fill()
+    context.fill()
+
+    if values.shape[1] < 3:
+        return
+    context.set_source_rgb(*rmscolor)
+    rms = values[:, 2]
+    band = numpy.array([numpy.maximum(values[:, 0], -rms),
+                        numpy.minimum(values[:, 1], rms)]).transpose()
+    ys = ystart + numpy.floor((-band * 0.5 + 0.5) * (height - 1) + 0.5)
+    heights = ys[:, 0] - ys[:, 1]
+    for i, x in enumerate(numpy.flatnonzero(heights > 0).tolist()):
+        context.rectangle(x, ys[x, 1], 1, heights[x])
+        if i % fill_columns == fill_columns - 1:
+            context.fill()
+    context.fill()
+
+# The fallback, for the tests to compare with the fast module.
+_cairo_draw_channel = draw_channel
+
+if HAVE_FAST:
+    draw_channel = fast.draw_channel
+
+
+class WaveformLayer(Layer):
     """A layer for LayeredGraphView.
 
     It paints the graph (the waveform).
 
+    The waveform is drawn by a WaveformRenderer thread. Until the
+    surface of the current view is ready, the last one is shown, moved
+    and scaled to the view.
+
     """
     def __init__(self, layered, graph):
-        CachedLayer.__init__(self, layered)
+        Layer.__init__(self, layered)
         self._graph = graph
         self.wavecolor = 0.0, 0.47058823529411764, 1.0
+        self.rmscolor = 0.4, 0.6823529411764706, 1.0
+        self.axiscolor = 0.2, 0.2, 0.2
+        self._must_draw = True
+        self._requested = None
+        # The surface shown, and the view drawn on it.
+        self._surface = None
+        self._view = None
+        self._renderer = WaveformRenderer(graph, self.draw_values,
+                                          self._on_rendered)
+        self._renderer.start()
         graph.changed.connect(self.update)
+        layered.connect("destroy", self.on_destroy)
 
-    def draw_channel(self, values, context, ystart, width, height):
-        # Line at zero
-        context.set_line_width(1)
-        context.set_source_rgb(0.2, 0.2, 0.2)
-        context.move_to(0, ystart + round(height / 2) + 0.5)
-        context.line_to(width, ystart + round(height / 2) + 0.5)
-        context.stroke()
+    def on_destroy(self, widget):
+        self._renderer.stop()
 
-        # Waveform
-        context.set_source_rgb(*self.wavecolor)
-        for x, (mini, maxi) in enumerate(values):
-            # -1 <= mini <= maxi <= 1
-            # ystart <= ymin <= ymax <= ystart + height - 1
-            ymin = ystart + round((-mini * 0.5 + 0.5) * (height - 1))
-            ymax = ystart + round((-maxi * 0.5 + 0.5) * (height - 1))
-            if ymin == ymax:
-                # Fill one pixel 
-                context.rectangle(x, ymin, 1, 1)
-                context.fill()
-            else:
-                # Draw a line from min to max
-                context.move_to(x + 0.5, ymin)
-                context.line_to(x + 0.5, ymax)
-                context.stroke()
+    def update(self):
+        self._must_draw = True
+        Layer.update(self)
+
+    def stack(self, context, width, height):
+        graph = self._graph
+        view = graph.first_cell(), graph.density, width, height
+        if self._must_draw or view != self._requested:
+            self._renderer.request(*view)
+            self._requested = view
+            self._must_draw = False
+        if self._surface is None:
+            return
+        first, density, _, drawn_height = self._view
+        context.save()
+        if (density, drawn_height) != view[1:3:2]:
+            # Frame f is in column f / density of both views.
+            scale = density / float(view[1])
+            context.translate(first * scale - view[0], 0)
+            context.scale(scale, height / float(drawn_height))
+        else:
+            context.translate(first - view[0], 0)
+        context.set_source_surface(self._surface, 0, 0)
+        context.set_operator(cairo.OPERATOR_OVER)
+        context.paint()
+        context.restore()
 
-    if HAVE_FAST:
-        draw_channel = fast.draw_channel
+    def _on_rendered(self, surface, view):
+        if self._surface is not None:
+            self._renderer.release(self._surface)
+        self._surface = surface
+        self._view = view
+        self._layered.redraw()
+        return False
 
-    def draw(self, context, width, height):
-        channels = self._graph.channels()
+    def draw_values(self, channels, context, width, height):
         numchan = len(channels)
         for i in range(numchan):
             y = (height / numchan) * i
-            self.draw_channel(channels[i], context, y, width, height / numchan)
+            values = numpy.ascontiguousarray(channels[i])
+            draw_channel(values, context, y, width, height / numchan,
+                         self.wavecolor, self.rmscolor, self.axiscolor,
+                         FILL_COLUMNS)
 
 
-class BackgroundLayer(Layer):
-    """A layer for LayeredGraphView.
+def changed_columns(old, new):
+    """Return the (x, width) spans of columns in one of the old and new
+    (start, end) pixel ranges but not in both.
+
+    None stands for no range: then everything changes, unless neither
+    is a range. The spans returned may overlap.
+
+    """
+    if old == new:
+        return []
+    if old is None or new is None:
+        return None
+    (s0, e0), (s1, e1) = old, new
+    return [(min(s0, s1), abs(s1 - s0)), (min(e0, e1), abs(e1 - e0))]
+
+
+class SelectionBoundLayer(Layer):
+    """Base class for layers drawn from a Selection.
+
+    When the selection changes, only the columns that enter or leave it
+    are drawn again.
 
     """
     def __init__(self, layered, selection):
         Layer.__init__(self, layered)
         self._selection = selection
+        self._pixels = None
         self._selection.changed.connect(self.update)
 
+    def update(self):
+        pixels = None
+        if self._selection.selected():
+            pixels = tuple(self._selection.pixels())
+        areas = changed_columns(self._pixels, pixels)
+        self._pixels = pixels
+        if areas != []:
+            self._layered.redraw(areas)
+
+
+class BackgroundLayer(SelectionBoundLayer):
+    """A layer for LayeredGraphView.
+
+    """
     def draw(self, context, width, height):
         # Black background
         context.set_source_rgb(0, 0, 0)
@@ -247,17 +649,12 @@ class BackgroundLayer(Layer):
             context.fill()
 
 
-class SelectionLayer(Layer):
+class SelectionLayer(SelectionBoundLayer):
     """A layer for LayeredGraphView.
 
     It highlights the selected area.
 
     """
-    def __init__(self, layered, selection):
-        Layer.__init__(self, layered)
-        self._selection = selection
-        self._selection.changed.connect(self.update)
-
     def draw(self, context, width, height):
         if self._selection.selected():
             start, end = self._selection.pixels()
@@ -272,11 +669,22 @@ class CursorLayer(Layer):
     def __init__(self, layered, cursor):
         Layer.__init__(self, layered)
         self._cursor = cursor
+        # The column the cursor is drawn on.
+        self._x = cursor.pixel()
         self._cursor.changed.connect(self.update)
         self.rgba = (1, 1, 1, 0.5)
 
-    def draw(self, context, width, height):
+    def update(self):
+        # Erase the old cursor column and draw the new one.
         x = self._cursor.pixel()
+        areas = [(x, 1)]
+        if self._x != x:
+            areas.append((self._x, 1))
+        self._x = x
+        self._layered.redraw(areas)
+
+    def draw(self, context, width, height):
+        x = self._x
         context.set_source_rgba(*self.rgba)
         context.set_line_width(1)
         context.move_to(x + 0.5, 0)
@@ -308,14 +716,16 @@ class MouseScroll(object):
         UP = event.direction is gtk.gdk.SCROLL_UP
         DOWN = event.direction is gtk.gdk.SCROLL_DOWN
 
+        # A flick of the wheel is applied in one frame.
+        defer = widget.scheduler.defer
         if LEFT or (UP and MOD1):
-            self._graph.scroll_left()
+            defer(self._graph.scroll_left)
         elif RIGHT or (DOWN and MOD1):
-            self._graph.scroll_right()
+            defer(self._graph.scroll_right)
         elif UP:
-            self._graph.zoom_in_on(event.x)
+            defer(self._graph.zoom_in_on, event.x)
         elif DOWN:
-            self._graph.zoom_out_on(event.x)
+            defer(self._graph.zoom_out_on, event.x)
 
 
 class MouseSelection(object):
@@ -371,6 +781,8 @@ class MouseMiddleClick(object):
         self.widget = widget
         self.graph = graph
         self.pressed = False
+        # Pixels to move by on the next frame
+        self._delta = None
         widget.add_events(gtk.gdk.BUTTON_PRESS_MASK |
                           gtk.gdk.BUTTON_RELEASE_MASK |
                           gtk.gdk.POINTER_MOTION_MASK |
@@ -391,10 +803,18 @@ class MouseMiddleClick(object):
     def motion_notify(self, widget, event):
         if self.pressed:
             x = event.window.get_pointer()[0]
-            delta = self._xlast - x
+            # Motions until the next frame add up to one move.
+            if self._delta is None:
+                self._delta = 0
+                self.widget.scheduler.defer(self._move)
+            self._delta += self._xlast - x
             self._xlast = x
-            start, _ = self.graph.view()
-            self.graph.move_to(start + delta * self.graph.density)
+
+    def _move(self):
+        delta = self._delta
+        self._delta = None
+        start, _ = self.graph.view()
+        self.graph.move_to(start + delta * self.graph.density)
 
 
 class PointerStyle(object):
@@ -507,6 +927,236 @@ class GraphScrollbar(gtk.HScrollbar):
 
 # -- Tests
 
+def test_changed_columns():
+    # None stands for no range.
+    assert changed_columns(None, None) == []
+    assert changed_columns(None, (2, 5)) is None
+    assert changed_columns((2, 5), None) is None
+
+    # Equal ranges change nothing.
+    assert changed_columns((2, 5), (2, 5)) == []
+
+    # Overlapping ranges change the columns between their bounds.
+    assert changed_columns((2, 5), (3, 9)) == [(2, 1), (5, 4)]
+    assert changed_columns((3, 9), (2, 5)) == [(2, 1), (5, 4)]
+    assert changed_columns((2, 9), (2, 5)) == [(2, 0), (5, 4)]
+
+    # The columns in one range but not in the other are always covered.
+    ranges = [(s, e) for s in range(6) for e in range(s, 6)]
+    for old in ranges:
+        for new in ranges:
+            covered = set()
+            for x, width in changed_columns(old, new):
+                covered.update(range(x, x + width))
+            changed = set(range(*old)) ^ set(range(*new))
+            assert changed <= covered, (old, new)
+
+def test_FrameScheduler():
+    timeouts = []
+    timeout_add = gobject.timeout_add
+    gobject.timeout_add = lambda delay, func: timeouts.append((delay, func))
+    try:
+        drawn = []
+        scheduler = FrameScheduler(lambda: drawn.append("all"),
+                                   lambda x, width: drawn.append((x, width)),
+                                   interval=1000)
+
+        # Calls until the frame are drawn together, on the first frame
+        # at once. Empty spans are not drawn.
+        scheduler.redraw([(1, 2)])
+        scheduler.redraw([(5, 1), (9, 0)])
+        scheduler.redraw([(3, 4)])
+        assert [delay for delay, frame in timeouts] == [0]
+        assert timeouts.pop()[1]() == False
+        assert drawn == [(1, 2), (5, 1), (3, 4)]
+        assert (scheduler.changes, scheduler.frames) == (3, 1)
+        assert scheduler.coalesced() == 2
+
+        # The next frame waits for the interval, and a call for the
+        # whole widget draws it once.
+        del drawn[:]
+        scheduler.redraw([(1, 2)])
+        scheduler.redraw()
+        scheduler.redraw([(7, 1)])
+        [(delay, frame)] = timeouts
+        assert 0 < delay <= 1000
+        del timeouts[:]
+        frame()
+        assert drawn == ["all"]
+
+        # Deferred calls are made in order before drawing, and what they
+        # ask to draw is drawn in the same frame.
+        del drawn[:]
+        scheduler.defer(drawn.append, "a")
+        scheduler.defer(scheduler.redraw, [(4, 2)])
+        scheduler.defer(drawn.append, "b")
+        assert len(timeouts) == 1
+        timeouts.pop()[1]()
+        assert drawn == ["a", "b", (4, 2)]
+        assert timeouts == []
+
+        # A change made while drawing goes to the next frame.
+        del drawn[:]
+        scheduler._draw_columns = lambda x, width: scheduler.redraw()
+        scheduler.redraw([(0, 1)])
+        timeouts.pop()[1]()
+        assert len(timeouts) == 1 and drawn == []
+    finally:
+        gobject.timeout_add = timeout_add
+
+def _fake_graph(numcells):
+    """Return a graph mock with numcells cells, whose values are made
+    from their index and density, unless set in graph.edits."""
+    from gum.lib.mock import Mock
+    graph = Mock({"nearby": []})
+    graph.edits = {}
+
+    def cells(first, width, density):
+        index = numpy.arange(first, min(first + width, numcells))
+        values = numpy.empty((1, len(index), 2))
+        values[0, :, 0] = (index * density) % 7 / 7.
+        values[0, :, 1] = (index * density) % 5 / 5.
+        for i, value in graph.edits.items():
+            if first <= i < first + len(index):
+                values[0, i - first] = value
+        return values
+
+    graph.cells = cells
+    return graph
+
+def _paint_cells(channels, context, width, height):
+    """Paint a line at zero across the width, and each column of cells
+    in a colour made from their values."""
+    context.set_source_rgb(0.5, 0.5, 0.5)
+    context.rectangle(0, height / 2, width, 1)
+    context.fill()
+    for x in range(channels.shape[1]):
+        mini, maxi = channels[0, x]
+        context.set_source_rgb(mini, maxi, 1)
+        context.rectangle(x, 0, 1, height / 2)
+        context.fill()
+
+def _pixels(surface):
+    return numpy.frombuffer(surface.get_data(), numpy.uint8)
+
+def test_draw_channel():
+    if not HAVE_FAST:
+        return
+    width, height = 200, 61
+    peaks = numpy.random.uniform(-1, 1, (width, 2))
+    peaks.sort(axis=1)
+    values = numpy.empty((width, 3))
+    values[:, :2] = peaks
+    values[:, 2] = abs(peaks).max(axis=1) * 0.7
+    colors = (1, 0, 0), (0, 1, 0), (0, 0, 1)
+    pixels = []
+    for draw in [_cairo_draw_channel, fast.draw_channel]:
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+        context = cairo.Context(surface)
+        draw(values, context, 0, width, height, *(colors + (3,)))
+        surface.flush()
+        pixels.append(_pixels(surface).reshape((height, width, 4)))
+    assert (pixels[0] == pixels[1]).all()
+    # the colors given are the ones painted, as blue, green, red bytes
+    painted = set(map(tuple, pixels[1][..., :3].reshape((-1, 3)).tolist()))
+    assert set([(0, 0, 255), (0, 255, 0), (255, 0, 0)]) <= painted
+
+def test_WaveformRenderer():
+    graph = _fake_graph(300)
+    drawn = []
+    def draw_values(channels, context, width, height):
+        drawn.append(width)
+    renderer = WaveformRenderer(graph, draw_values, None)
+
+    # The first surface is drawn whole.
+    a = renderer.render((0, 1, 50, 8))
+    assert drawn == [50]
+
+    # Scrolled by 7 columns, only the 7 that appear are drawn.
+    del drawn[:]
+    b = renderer.render((7, 1, 50, 8))
+    assert drawn == [7] and b is not a
+
+    # Back to the same view and values: nothing to draw.
+    del drawn[:]
+    assert renderer.render((7, 1, 50, 8)) is None
+    assert drawn == [] and renderer.rendered == 2
+
+    # A surface given back is drawn on again, if it has the same size.
+    renderer.release(a)
+    c = renderer.render((0, 1, 50, 8))
+    assert c is a
+    renderer.release(b)
+    d = renderer.render((0, 1, 50, 16))
+    assert d is not b and renderer._free == []
+    assert drawn == [7, 50]
+
+    # At most MAX_FREE_SURFACES are kept.
+    for surface in [a, b, c]:
+        renderer.release(surface)
+    assert len(renderer._free) == MAX_FREE_SURFACES
+    renderer._free = []
+
+    # A request coming while the values are computed abandons the
+    # drawing.
+    del drawn[:]
+    cells = graph.cells
+    def cells_then_request(first, width, density):
+        renderer.request(first, density, width, 8)
+        return cells(first, width, density)
+    graph.cells = cells_then_request
+    assert renderer.render((3, 1, 50, 16)) is None
+    assert drawn == [] and renderer.cancelled == 1
+    graph.cells = cells
+    renderer._request = None
+
+    # A request coming while columns are drawn abandons the others, and
+    # the surface is given back.
+    graph.edits[10] = graph.edits[20] = (0, 0)
+    def draw_then_request(channels, context, width, height):
+        drawn.append(width)
+        renderer.request(0, 1, 50, 16)
+    renderer._draw_values = draw_then_request
+    assert renderer.render((0, 1, 50, 16)) is None
+    assert drawn == [1] and renderer.cancelled == 2
+    assert len(renderer._free) == 1
+    renderer._request = None
+
+    # The next drawing starts again from the last surface drawn.
+    del drawn[:]
+    renderer._draw_values = draw_values
+    given_back = renderer._free[0]
+    assert renderer.render((0, 1, 50, 16)) is given_back
+    assert drawn == [1, 1] and renderer.rendered == 5
+
+def test_WaveformRenderer_shift():
+    import random
+    random.seed(0)
+    graph = _fake_graph(300)
+    renderer = WaveformRenderer(graph, _paint_cells, None)
+    first, density = 0, 1
+    shown = None
+    for i in range(300):
+        r = random.random()
+        if r < 0.6:
+            first = min(max(0, first + random.randint(-60, 60)), 280)
+        elif r < 0.8:
+            graph.edits[random.randrange(300)] = (random.random(),
+                                                  random.random())
+        else:
+            density = random.choice([1, 2])
+        view = first, density, 50, 8
+        surface = renderer.render(view)
+        if surface is not None:
+            if shown is not None:
+                renderer.release(shown)
+            shown = surface
+        # The surface shifted and drawn again where needed is the one
+        # drawn from scratch.
+        full = WaveformRenderer(graph, _paint_cells, None).render(view)
+        assert (_pixels(shown) == _pixels(full)).all()
+
+
 if __name__ == '__main__':
     from gum.lib.mock import Mock, Fake
 
@@ -514,12 +1164,17 @@ if __name__ == '__main__':
 
         def randomized():
             from random import random        
-            channels = [[((random() - 0.5) * 2, (random() - 0.5) * 2)
-                       for i in xrange(500)]]
+            channels = numpy.array([[((random() - 0.5) * 2,
+                                      (random() - 0.5) * 2)
+                                     for i in xrange(500)]])
             graph = Mock({"channels": channels,
+                          "cells": channels,
+                          "nearby": [],
                           "set_width": None,
+                          "first_cell": 0,
                           "frames_info": (0, 0, 0)})
             graph.changed = Fake()
+            graph.density = 1.
             layered = LayeredGraphView(graph)
             layered.layers.append(WaveformLayer(layered, graph))
             return layered
@@ -527,10 +1182,13 @@ if __name__ == '__main__':
         def sine():
             from math import sin
             sine = [sin(2 * 3.14 * 0.01 * x) for x in xrange(500)]
-            channels = [[(i, i) for i in sine]]
-            graph = Mock({"channels": channels, "set_width": None,
+            channels = numpy.array([[(i, i) for i in sine]])
+            graph = Mock({"channels": channels, "cells": channels,
+                          "nearby": [],
+                          "set_width": None, "first_cell": 0,
                           "frames_info": (0, 0, 0)})
             graph.changed = Fake()
+            graph.density = 1.
             layered = LayeredGraphView(graph)
             layered.layers.append(WaveformLayer(layered, graph))
             return layered
@@ -538,11 +1196,15 @@ if __name__ == '__main__':
         def sines():
             from math import sin
             sine = [sin(2 * 3.14 * 0.01 * x) for x in xrange(500)]
-            channels = [[(i, i) for i in sine], [(i, i) for i in sine]]
+            channels = numpy.array([[(i, i) for i in sine],
+                                    [(i, i) for i in sine]])
 
-            graph = Mock({"channels": channels, "set_width": None,
+            graph = Mock({"channels": channels, "cells": channels,
+                          "nearby": [],
+                          "set_width": None, "first_cell": 0,
                           "frames_info": (0, 0, 0)})
             graph.changed = Fake()
+            graph.density = 1.
             layered = LayeredGraphView(graph)
             layered.layers.append(WaveformLayer(layered, graph))
             return layered
@@ -587,4 +1249,9 @@ if __name__ == '__main__':
             window.show_all()
             gtk.main()
 
+    test_changed_columns()
+    test_FrameScheduler()
+    test_draw_channel()
+    test_WaveformRenderer()
+    test_WaveformRenderer_shift()
     test_layered()